@@ -42,6 +42,11 @@ CREATE TABLE Товары (
     ID_Категории INT,
     Изображение VARCHAR(255) DEFAULT 'default.jpg',
     Статус_активности BOOLEAN NOT NULL DEFAULT 1,
+    Версия INT NOT NULL DEFAULT 1, -- увеличивается при каждом изменении товара (ETag страниц)
+    Дата_изменения TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    Артикул VARCHAR(64) NULL, -- ключ товара при импорте каталога (scr/catalog_import.py)
+    INDEX Товары_витрина (Статус_активности, ID_Категории, Цена),
+    UNIQUE INDEX Товары_артикул (Артикул),
     FOREIGN KEY (ID_Категории) REFERENCES Категории(ID_Категории)
 );
 
@@ -51,6 +56,7 @@ CREATE TABLE Корзина (
     ID_Пользователя INT,
     ID_Товара INT,
     Количество INT DEFAULT 1,
+    UNIQUE INDEX Корзина_пользователь_товар (ID_Пользователя, ID_Товара), -- одна строка на товар
     FOREIGN KEY (ID_Пользователя) REFERENCES Пользователи(ID_Пользователя),
     FOREIGN KEY (ID_Товара) REFERENCES Товары(ID_Товара)
 );
@@ -62,6 +68,11 @@ CREATE TABLE Заказы (
     Дата_заказа DATETIME DEFAULT CURRENT_TIMESTAMP,
     Статус VARCHAR(50) DEFAULT 'Новый',
     Итоговая_сумма DECIMAL(10, 2),
+    Ключ_идемпотентности VARCHAR(64) NULL, -- из формы корзины: повторная отправка не создает второй заказ
+    INDEX Заказы_пользователь_дата (ID_Пользователя, Дата_заказа),
+    UNIQUE INDEX Заказы_идемпотентность (ID_Пользователя, Ключ_идемпотентности),
+    INDEX Заказы_статус_дата (Статус, Дата_заказа),
+    INDEX Заказы_дата (Дата_заказа, ID_Заказа),
     FOREIGN KEY (ID_Пользователя) REFERENCES Пользователи(ID_Пользователя)
 );
 
@@ -81,12 +92,98 @@ CREATE TABLE Состав_заказа (
 CREATE TABLE Лицензии (
     ID_Лицензии INT PRIMARY KEY AUTO_INCREMENT,
     ID_Позиции_заказа INT,
-    Лицензионный_ключ VARCHAR(100) NOT NULL,
+    Лицензионный_ключ VARCHAR(100) NOT NULL UNIQUE,
     Дата_активации DATETIME,
     Дата_истечения DATETIME,
     FOREIGN KEY (ID_Позиции_заказа) REFERENCES Состав_заказа (ID_Позиции)
 );
 
+-- 9.1. Таблица: Склад_ключей (Заранее загруженные ключи, выдаются при оформлении заказа)
+CREATE TABLE Склад_ключей (
+    ID_Ключа INT PRIMARY KEY AUTO_INCREMENT,
+    ID_Товара INT NOT NULL,
+    Лицензионный_ключ VARCHAR(100) NOT NULL UNIQUE,
+    Выдан BOOLEAN NOT NULL DEFAULT 0,
+    Дата_загрузки DATETIME DEFAULT CURRENT_TIMESTAMP,
+    Дата_выдачи DATETIME,
+    INDEX (ID_Товара, Выдан, ID_Ключа), -- выдача ключей товара по порядку загрузки
+    INDEX (Выдан, ID_Товара),           -- подсчет остатков
+    FOREIGN KEY (ID_Товара) REFERENCES Товары(ID_Товара)
+);
+
+-- 9.1.1. Таблица: Остатки_ключей (Свободные ключи по товарам для отчета «ключи заканчиваются»,
+--        ведет scr/keystore.py при загрузке и выдаче ключей)
+CREATE TABLE Остатки_ключей (
+    ID_Товара INT PRIMARY KEY,
+    Доступно INT NOT NULL DEFAULT 0,
+    INDEX (Доступно, ID_Товара), -- товары с малым остатком
+    FOREIGN KEY (ID_Товара) REFERENCES Товары(ID_Товара)
+);
+
+-- 9.2. Таблица: Миграции (Примененные миграции из database/migrations, см. python migrate.py)
+CREATE TABLE Миграции (
+    Версия INT PRIMARY KEY,
+    Название VARCHAR(255) NOT NULL,
+    Контрольная_сумма CHAR(64) NOT NULL,
+    Дата_применения DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+
+-- 9.3. Таблица: Очередь_выполнения (Выдача ключей оформленным заказам в фоне, см. scr/fulfilment.py)
+CREATE TABLE Очередь_выполнения (
+    ID_Задания INT PRIMARY KEY AUTO_INCREMENT,
+    ID_Заказа INT NOT NULL UNIQUE,
+    Статус VARCHAR(20) NOT NULL DEFAULT 'Ожидает', -- Ожидает / Выполняется / Выполнено / Ошибка
+    Попытки INT NOT NULL DEFAULT 0,
+    Выполнить_после DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP, -- время повтора или конец аренды задания
+    Ошибка TEXT,
+    Дата_создания TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    INDEX Очередь_выборка (Статус, Выполнить_после),
+    FOREIGN KEY (ID_Заказа) REFERENCES Заказы(ID_Заказа)
+);
+
+-- 10. Таблица: Версии_кэша (Счетчик изменений каталога для сброса кэша во всех воркерах)
+CREATE TABLE Версии_кэша (
+    Ключ VARCHAR(50) PRIMARY KEY,
+    Версия BIGINT NOT NULL DEFAULT 0,
+    Дата_изменения TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+);
+
+-- 11. Сводные таблицы для отчетов (обновляются при оформлении заказа,
+--     пересчитываются из истории командой: python rollups.py rebuild)
+CREATE TABLE Сводка_товары (
+    ID_Товара INT PRIMARY KEY,
+    Количество BIGINT NOT NULL DEFAULT 0,
+    INDEX (Количество),
+    FOREIGN KEY (ID_Товара) REFERENCES Товары(ID_Товара)
+);
+
+CREATE TABLE Сводка_категории (
+    ID_Категории INT PRIMARY KEY,
+    Выручка DECIMAL(16, 2) NOT NULL DEFAULT 0,
+    FOREIGN KEY (ID_Категории) REFERENCES Категории(ID_Категории)
+);
+
+-- Только оплаченные заказы
+CREATE TABLE Сводка_дни (
+    День DATE PRIMARY KEY,
+    Количество_заказов INT NOT NULL DEFAULT 0,
+    Сумма DECIMAL(16, 2) NOT NULL DEFAULT 0
+);
+
+-- Только оплаченные заказы
+CREATE TABLE Сводка_покупатели (
+    ID_Пользователя INT PRIMARY KEY,
+    Сумма DECIMAL(16, 2) NOT NULL DEFAULT 0,
+    INDEX (Сумма),
+    FOREIGN KEY (ID_Пользователя) REFERENCES Пользователи(ID_Пользователя) ON DELETE CASCADE
+);
+
+-- Счетчики для карточек статистики: orders, products, users (ведут триггеры) и revenue
+CREATE TABLE Счетчики (
+    Название VARCHAR(50) PRIMARY KEY,
+    Значение DECIMAL(16, 2) NOT NULL DEFAULT 0
+);
+
 -- ==========================================================
 -- (Триггеры и Процедуры)
 -- ==========================================================
@@ -114,6 +211,48 @@ END //
 
 DELIMITER ;	
 
+-- Триггеры счетчиков для статистики админ-панели (вместо COUNT(*) по большим таблицам)
+DELIMITER //
+CREATE TRIGGER Счетчик_заказов_добавление AFTER INSERT ON Заказы
+FOR EACH ROW
+BEGIN
+    INSERT INTO Счетчики (Название, Значение) VALUES ('orders', 1)
+    ON DUPLICATE KEY UPDATE Значение = Значение + 1;
+END //
+
+CREATE TRIGGER Счетчик_заказов_удаление AFTER DELETE ON Заказы
+FOR EACH ROW
+BEGIN
+    UPDATE Счетчики SET Значение = Значение - 1 WHERE Название = 'orders';
+END //
+
+CREATE TRIGGER Счетчик_товаров_добавление AFTER INSERT ON Товары
+FOR EACH ROW
+BEGIN
+    INSERT INTO Счетчики (Название, Значение) VALUES ('products', 1)
+    ON DUPLICATE KEY UPDATE Значение = Значение + 1;
+END //
+
+CREATE TRIGGER Счетчик_товаров_удаление AFTER DELETE ON Товары
+FOR EACH ROW
+BEGIN
+    UPDATE Счетчики SET Значение = Значение - 1 WHERE Название = 'products';
+END //
+
+CREATE TRIGGER Счетчик_пользователей_добавление AFTER INSERT ON Пользователи
+FOR EACH ROW
+BEGIN
+    INSERT INTO Счетчики (Название, Значение) VALUES ('users', 1)
+    ON DUPLICATE KEY UPDATE Значение = Значение + 1;
+END //
+
+CREATE TRIGGER Счетчик_пользователей_удаление AFTER DELETE ON Пользователи
+FOR EACH ROW
+BEGIN
+    UPDATE Счетчики SET Значение = Значение - 1 WHERE Название = 'users';
+END //
+DELIMITER ;
+
 -- ПРОЦЕДУРА: Оформление заказа из корзины
 -- Эта процедура переносит всё из корзины в заказ и очищает корзину
 DELIMITER //
@@ -292,6 +431,20 @@ DirectX: 10', 12000.00, 2),
 Интернет-соединение: для активации и обновлений
 Дополнительно: мышь, клавиатура, CD/DVD привод (для коробочной версии)', 900.00, 3);
 
+-- Начальная версия каталога
+INSERT INTO Версии_кэша (Ключ, Версия) VALUES ('catalog', 0);
+
+-- Схема выше уже включает все миграции
+INSERT INTO Миграции (Версия, Название, Контрольная_сумма) VALUES
+(1, 'catalog_cache_versions', '05d7a8419ebe3efc2657141de6cf791f7c91567b64ef2827fe51c4eeb03b2646'),
+(2, 'sales_rollups', 'e1f0bf4b0ef42a1c7ae83a6dcc0e9a3ada7ee3db1f4e0386a222c2452e32f7ad'),
+(3, 'key_inventory', '36abccad5f69e5b099a056205748f00530d0ef454586ed54f39919a5295983c4'),
+(4, 'hot_query_indexes', 'cf171f4e889568b2325a518dd45d5a088866bb47b3806fe9f3a24a2566d9a77e'),
+(5, 'product_versions', '4fa39a792525e00c1c63a7fba498a326b776f29aedccc8cf537923bb7d775328'),
+(6, 'fulfilment_queue', '68e7dfa0e89fe363bf560e6c9d954c354dd92ede871479c085fa65f2bcd020b3'),
+(7, 'product_sku', '91b1d2b42af3fe09f80970659f2c707b295d8ffe69d7191a7680e90d3493a78e'),
+(8, 'key_stock_counters', '1d28c8ea3ea630689792e7431a7692ac1d028cdfb54372f2e6f65ff3d4574eb5');
+
 -- 5. Тестовая Корзина (Петров положил товар, но еще не купил)
 INSERT INTO Корзина (ID_Пользователя, ID_Товара, Количество) VALUES 
 (2, 3, 1), -- Петров хочет Касперский
@@ -312,4 +465,11 @@ INSERT INTO Состав_заказа (ID_Заказа, ID_Товара, Цен
 -- Привязываем к позициям из Состава_заказа (ID 1 и 2)
 INSERT INTO Лицензии (ID_Позиции_заказа, Лицензионный_ключ, Дата_активации, Дата_истечения) VALUES 
 (1, 'OFF-2021-XXXX-YYYY-ZZZZ', '2024-05-20 15:00:00', '2099-12-31 23:59:59'),
-(2, 'DRWEB-6MO-AAAA-BBBB-CCCC', '2024-05-20 15:00:00', '2024-11-20 15:00:00');
\ No newline at end of file
+(2, 'DRWEB-6MO-AAAA-BBBB-CCCC', '2024-05-20 15:00:00', '2024-11-20 15:00:00');
+
+-- 9. Сводки отчетов для заказа Сидоровой (то же самое делает python rollups.py rebuild)
+INSERT INTO Сводка_товары (ID_Товара, Количество) VALUES (2, 1), (5, 1);
+INSERT INTO Сводка_категории (ID_Категории, Выручка) VALUES (2, 12000.00), (3, 900.00);
+INSERT INTO Сводка_дни (День, Количество_заказов, Сумма) VALUES ('2024-05-20', 1, 12900.00);
+INSERT INTO Сводка_покупатели (ID_Пользователя, Сумма) VALUES (3, 12900.00);
+INSERT INTO Счетчики (Название, Значение) VALUES ('revenue', 12900.00);
\ No newline at end of file
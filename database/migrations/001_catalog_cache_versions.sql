@@ -0,0 +1,10 @@
+-- 001. Версия каталога для сброса кэша каталога во всех воркерах
+--
+-- Приложение держит снимок каталога в памяти процесса и перечитывает его, когда версия
+-- в этой таблице меняется (см. scr/catalog.py, CatalogCache.bump).
+CREATE TABLE Версии_кэша (
+    Ключ VARCHAR(50) PRIMARY KEY,
+    Версия BIGINT NOT NULL DEFAULT 0
+);
+
+INSERT INTO Версии_кэша (Ключ, Версия) VALUES ('catalog', 0);
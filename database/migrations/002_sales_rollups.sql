@@ -0,0 +1,111 @@
+-- 002. Сводные таблицы отчетов админ-панели и счетчики статистики
+--
+-- Отчеты читаются из маленьких сводок, которые обновляются при оформлении и оплате заказа
+-- (см. scr/rollups.py), а карточки статистики — из счетчиков, которые ведут триггеры.
+-- В конце сводки заполняются из уже накопленной истории заказов (то же самое делает
+-- python rollups.py rebuild).
+CREATE TABLE Сводка_товары (
+    ID_Товара INT PRIMARY KEY,
+    Количество BIGINT NOT NULL DEFAULT 0,
+    INDEX (Количество),
+    FOREIGN KEY (ID_Товара) REFERENCES Товары(ID_Товара)
+);
+
+CREATE TABLE Сводка_категории (
+    ID_Категории INT PRIMARY KEY,
+    Выручка DECIMAL(16, 2) NOT NULL DEFAULT 0,
+    FOREIGN KEY (ID_Категории) REFERENCES Категории(ID_Категории)
+);
+
+-- Только оплаченные заказы
+CREATE TABLE Сводка_дни (
+    День DATE PRIMARY KEY,
+    Количество_заказов INT NOT NULL DEFAULT 0,
+    Сумма DECIMAL(16, 2) NOT NULL DEFAULT 0
+);
+
+-- Только оплаченные заказы
+CREATE TABLE Сводка_покупатели (
+    ID_Пользователя INT PRIMARY KEY,
+    Сумма DECIMAL(16, 2) NOT NULL DEFAULT 0,
+    INDEX (Сумма),
+    FOREIGN KEY (ID_Пользователя) REFERENCES Пользователи(ID_Пользователя) ON DELETE CASCADE
+);
+
+-- Счетчики для карточек статистики: orders, products, users (ведут триггеры) и revenue
+CREATE TABLE Счетчики (
+    Название VARCHAR(50) PRIMARY KEY,
+    Значение DECIMAL(16, 2) NOT NULL DEFAULT 0
+);
+
+DELIMITER //
+CREATE TRIGGER Счетчик_заказов_добавление AFTER INSERT ON Заказы
+FOR EACH ROW
+BEGIN
+    INSERT INTO Счетчики (Название, Значение) VALUES ('orders', 1)
+    ON DUPLICATE KEY UPDATE Значение = Значение + 1;
+END //
+
+CREATE TRIGGER Счетчик_заказов_удаление AFTER DELETE ON Заказы
+FOR EACH ROW
+BEGIN
+    UPDATE Счетчики SET Значение = Значение - 1 WHERE Название = 'orders';
+END //
+
+CREATE TRIGGER Счетчик_товаров_добавление AFTER INSERT ON Товары
+FOR EACH ROW
+BEGIN
+    INSERT INTO Счетчики (Название, Значение) VALUES ('products', 1)
+    ON DUPLICATE KEY UPDATE Значение = Значение + 1;
+END //
+
+CREATE TRIGGER Счетчик_товаров_удаление AFTER DELETE ON Товары
+FOR EACH ROW
+BEGIN
+    UPDATE Счетчики SET Значение = Значение - 1 WHERE Название = 'products';
+END //
+
+CREATE TRIGGER Счетчик_пользователей_добавление AFTER INSERT ON Пользователи
+FOR EACH ROW
+BEGIN
+    INSERT INTO Счетчики (Название, Значение) VALUES ('users', 1)
+    ON DUPLICATE KEY UPDATE Значение = Значение + 1;
+END //
+
+CREATE TRIGGER Счетчик_пользователей_удаление AFTER DELETE ON Пользователи
+FOR EACH ROW
+BEGIN
+    UPDATE Счетчики SET Значение = Значение - 1 WHERE Название = 'users';
+END //
+DELIMITER ;
+
+-- Первичное заполнение из истории (запросы как в rollups.HISTORY_QUERIES)
+INSERT INTO Сводка_товары (ID_Товара, Количество)
+SELECT ID_Товара, SUM(Количество)
+FROM Состав_заказа
+GROUP BY ID_Товара;
+
+INSERT INTO Сводка_категории (ID_Категории, Выручка)
+SELECT t.ID_Категории, SUM(sz.Цена_продажи * sz.Количество)
+FROM Состав_заказа sz
+JOIN Товары t ON sz.ID_Товара = t.ID_Товара
+WHERE t.ID_Категории IS NOT NULL
+GROUP BY t.ID_Категории;
+
+INSERT INTO Сводка_дни (День, Количество_заказов, Сумма)
+SELECT DATE(Дата_заказа), COUNT(ID_Заказа), SUM(Итоговая_сумма)
+FROM Заказы
+WHERE Статус = 'Оплачен'
+GROUP BY DATE(Дата_заказа);
+
+INSERT INTO Сводка_покупатели (ID_Пользователя, Сумма)
+SELECT ID_Пользователя, SUM(Итоговая_сумма)
+FROM Заказы
+WHERE Статус = 'Оплачен' AND ID_Пользователя IS NOT NULL
+GROUP BY ID_Пользователя;
+
+INSERT INTO Счетчики (Название, Значение)
+SELECT 'orders', COUNT(*) FROM Заказы
+UNION ALL SELECT 'products', COUNT(*) FROM Товары
+UNION ALL SELECT 'users', COUNT(*) FROM Пользователи
+UNION ALL SELECT 'revenue', COALESCE(SUM(Итоговая_сумма), 0) FROM Заказы WHERE Статус = 'Оплачен';
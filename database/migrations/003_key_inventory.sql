@@ -0,0 +1,19 @@
+-- 003. Склад лицензионных ключей и уникальность выданных ключей
+--
+-- Ключи поставщика загружаются на склад (python keystore.py load) и выдаются при оформлении
+-- заказа. Уникальный индекс по Лицензии.Лицензионный_ключ запрещает выдать один ключ дважды
+-- и служит индексом поиска ключа. Если в Лицензии уже есть повторяющиеся ключи, миграция
+-- остановится на ALTER TABLE: повторы нужно разобрать вручную и запустить ее снова.
+CREATE TABLE Склад_ключей (
+    ID_Ключа INT PRIMARY KEY AUTO_INCREMENT,
+    ID_Товара INT NOT NULL,
+    Лицензионный_ключ VARCHAR(100) NOT NULL UNIQUE,
+    Выдан BOOLEAN NOT NULL DEFAULT 0,
+    Дата_загрузки DATETIME DEFAULT CURRENT_TIMESTAMP,
+    Дата_выдачи DATETIME,
+    INDEX (ID_Товара, Выдан, ID_Ключа), -- выдача ключей товара по порядку загрузки
+    INDEX (Выдан, ID_Товара),           -- подсчет остатков
+    FOREIGN KEY (ID_Товара) REFERENCES Товары(ID_Товара)
+);
+
+ALTER TABLE Лицензии ADD UNIQUE INDEX Лицензионный_ключ (Лицензионный_ключ);
@@ -0,0 +1,30 @@
+-- 004. Индексы для частых запросов приложения
+--
+-- Корзина: одна строка на пару (пользователь, товар), чтобы добавление в корзину было
+-- одним INSERT ... ON DUPLICATE KEY UPDATE. Сначала сливаем уже существующие дубликаты.
+UPDATE Корзина k
+JOIN (
+    SELECT MIN(ID_Корзины) AS ID_Корзины, SUM(Количество) AS Количество
+    FROM Корзина
+    GROUP BY ID_Пользователя, ID_Товара
+    HAVING COUNT(*) > 1
+) d ON k.ID_Корзины = d.ID_Корзины
+SET k.Количество = d.Количество;
+
+DELETE k FROM Корзина k
+JOIN Корзина k2 ON k.ID_Пользователя = k2.ID_Пользователя
+               AND k.ID_Товара = k2.ID_Товара
+               AND k.ID_Корзины > k2.ID_Корзины;
+
+ALTER TABLE Корзина ADD UNIQUE INDEX Корзина_пользователь_товар (ID_Пользователя, ID_Товара);
+
+-- Заказы: история пользователя (профиль, мои заказы), отчеты по статусу и дате,
+-- постраничный список заказов в админ-панели (ORDER BY Дата_заказа, ID_Заказа)
+ALTER TABLE Заказы
+    ADD INDEX Заказы_пользователь_дата (ID_Пользователя, Дата_заказа),
+    ADD INDEX Заказы_статус_дата (Статус, Дата_заказа),
+    ADD INDEX Заказы_дата (Дата_заказа, ID_Заказа);
+
+-- Товары: витрина и загрузка каталога (активные товары категории, сортировка по цене)
+ALTER TABLE Товары ADD INDEX Товары_витрина (Статус_активности, ID_Категории, Цена);
+
@@ -0,0 +1,11 @@
+-- 005. Версии товаров для условных HTTP-запросов (ETag / Last-Modified)
+--
+-- Версия увеличивается приложением при каждом изменении товара (редактирование, снятие
+-- с продажи), Дата_изменения обновляется автоматически при любом изменении строки.
+ALTER TABLE Товары
+    ADD COLUMN Версия INT NOT NULL DEFAULT 1,
+    ADD COLUMN Дата_изменения TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP;
+
+-- Время последнего изменения каталога — для Last-Modified страниц витрины
+ALTER TABLE Версии_кэша
+    ADD COLUMN Дата_изменения TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP;
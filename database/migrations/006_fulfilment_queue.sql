@@ -0,0 +1,20 @@
+-- 006. Очередь выполнения заказов
+--
+-- Оформление заказа записывает заказ в статусе 'В обработке' и задание в очередь, а ключи
+-- выдает фоновый обработчик (см. scr/fulfilment.py). Ключ идемпотентности приходит из формы
+-- корзины: повторная отправка той же формы не создает второй заказ.
+ALTER TABLE Заказы
+    ADD COLUMN Ключ_идемпотентности VARCHAR(64) NULL,
+    ADD UNIQUE INDEX Заказы_идемпотентность (ID_Пользователя, Ключ_идемпотентности);
+
+CREATE TABLE Очередь_выполнения (
+    ID_Задания INT PRIMARY KEY AUTO_INCREMENT,
+    ID_Заказа INT NOT NULL UNIQUE,
+    Статус VARCHAR(20) NOT NULL DEFAULT 'Ожидает', -- Ожидает / Выполняется / Выполнено / Ошибка
+    Попытки INT NOT NULL DEFAULT 0,
+    Выполнить_после DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP, -- время повтора или конец аренды задания
+    Ошибка TEXT,
+    Дата_создания TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    INDEX Очередь_выборка (Статус, Выполнить_после),
+    FOREIGN KEY (ID_Заказа) REFERENCES Заказы(ID_Заказа)
+);
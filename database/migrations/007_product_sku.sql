@@ -0,0 +1,7 @@
+-- 007. Артикулы товаров для массового импорта каталога
+--
+-- Импорт (/admin/import, см. scr/catalog_import.py) обновляет товар с тем же артикулом
+-- вместо создания дубликата. У товаров, добавленных вручную, артикула может не быть.
+ALTER TABLE Товары
+    ADD COLUMN Артикул VARCHAR(64) NULL,
+    ADD UNIQUE INDEX Товары_артикул (Артикул);
@@ -0,0 +1,17 @@
+-- 008. Счетчики свободных ключей по товарам
+--
+-- Отчет «ключи заканчиваются» в админ-панели раньше считал COUNT(*) по всем невыданным
+-- строкам Склад_ключей. Теперь число свободных ключей хранится по товару: его увеличивает
+-- загрузка ключей и уменьшает выдача (scr/keystore.py). Строка есть у каждого товара,
+-- для которого загружались ключи. Пересчет из склада: python rollups.py rebuild
+CREATE TABLE Остатки_ключей (
+    ID_Товара INT PRIMARY KEY,
+    Доступно INT NOT NULL DEFAULT 0,
+    INDEX (Доступно, ID_Товара), -- товары с малым остатком
+    FOREIGN KEY (ID_Товара) REFERENCES Товары(ID_Товара)
+);
+
+INSERT INTO Остатки_ключей (ID_Товара, Доступно)
+SELECT ID_Товара, SUM(Выдан = 0)
+FROM Склад_ключей
+GROUP BY ID_Товара;
@@ -1,81 +1,398 @@
-from flask import Flask, render_template, session, request, redirect, url_for, flash, jsonify
+import startup
+# Время запуска считается с начала импорта: модули ниже (Flask, драйвер БД, шаблоны) — его часть
+startup_timer = startup.StartupTimer()
+
+from flask import Flask, render_template, session, request, redirect, url_for, flash, jsonify, g, abort, Response, stream_with_context, current_app
 import pymysql as db
 from config import host, user, password, port, db_name
-import uuid
-from datetime import datetime, timedelta
+from config import secret_key, upload_folder, warm_up_on_start
+from config import pool_min_size, pool_max_size, pool_timeout, pool_recycle, pool_idle_timeout, pool_ping_interval
+from config import db_replicas, replica_max_lag, replica_lag_check_interval, replica_retry_after, read_your_writes_seconds
+from config import catalog_cache_ttl, catalog_version_check_interval
+from config import catalog_page_size, admin_page_size, max_page_size, orders_page_size, keys_page_size
+from config import key_low_stock_threshold, key_load_batch_size
+from config import export_batch_size, export_net_write_timeout
+from config import import_batch_size, import_max_upload_mb, import_errors_shown
+from config import fulfilment_workers, fulfilment_poll_interval, fulfilment_batch_size
+from config import fulfilment_max_attempts, fulfilment_lease_seconds, fulfilment_retry_delay
+from config import license_index_check_interval, license_index_ttl, license_batch_max, license_api_tokens
+from config import slow_request_threshold, slow_request_log, metrics_allowed_ips
+from config import cart_store_backend, cart_store_path, cart_store_max_users, cart_flush_interval, cart_flush_batch_size
+from config import image_max_upload_mb, image_workers
+from config import page_cache_max_entries, page_cache_max_mb
+from config import fragment_cache_max_entries, fragment_cache_max_mb, fragment_cache_ttl, template_bytecode_dir
+from db_pool import ConnectionPool
+from db_router import ReplicaSet, ReadRouter, replica_settings, mark_written, is_sticky
+from catalog import CatalogCache, PRODUCT_QUERY, product_from_row
+from cart_store import create_store
+from images import ImagePipeline, ImageTooLarge, DEFAULT_IMAGE
+import assets
+import http_cache
+import fragments
+from pagination import Page, page_args, page_size, paginate_list, fetch_keyset, keyset_query, keyset_page
+import rollups
+import metrics
+import keystore
+import exports
+import catalog_import
+import catalog_api
+import fulfilment
+from licenses import LicenseIndex
+import io
 import os
-from werkzeug.utils import secure_filename
+import uuid
+from werkzeug.exceptions import RequestEntityTooLarge
 
-app = Flask(__name__)
-app.secret_key = 'softkey_secret_key'
+# Маршруты и обработчики подключаются к приложению в create_app() (см. startup.py)
+routes = startup.Routes()
 
+# Папка приложения: шаблоны, статические файлы и изображения ищутся в ней, а не в текущей папке
+APP_ROOT = os.path.dirname(os.path.abspath(__file__))
 # Папка, куда будут сохраняться изображения товаров (должна существовать!)
-UPLOAD_FOLDER = os.path.join('static', 'images')
-app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+UPLOAD_FOLDER = os.path.join(APP_ROOT, upload_folder)
 # Разрешенные расширения файлов
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
+# Срок действия выдаваемых лицензий (дней)
+LICENSE_DAYS = 365
 
 def allowed_file(filename):
     return '.' in filename and \
             filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+# Общий пул соединений процесса. Соединения открываются лениво при первом запросе
+db_pool = ConnectionPool(
+    dict(host=host, port=port, user=user, password=password,
+         database=db_name, cursorclass=metrics.InstrumentedCursor, autocommit=True),
+    min_size=pool_min_size, max_size=pool_max_size, timeout=pool_timeout,
+    recycle=pool_recycle, idle_timeout=pool_idle_timeout, ping_interval=pool_ping_interval
+)
+
+# Реплики для чтения (см. db_router.py): у каждой свой пул с теми же настройками
+def _replica_pool(settings):
+    return ConnectionPool(settings, min_size=0, max_size=pool_max_size, timeout=pool_timeout,
+                          recycle=pool_recycle, idle_timeout=pool_idle_timeout, ping_interval=pool_ping_interval)
+
+read_router = ReadRouter(
+    ReplicaSet([replica_settings(db_pool.connect_kwargs, replica) for replica in db_replicas],
+               max_lag=replica_max_lag, check_interval=replica_lag_check_interval, retry_after=replica_retry_after),
+    _replica_pool
+)
+
+# Кэш каталога (активные товары и категории) в памяти процесса
+catalog_cache = CatalogCache(ttl=catalog_cache_ttl, check_interval=catalog_version_check_interval)
+
+# Корзины покупателей: изменения записываются в таблицу Корзина в фоне (см. cart_store.py)
+cart_store = create_store(cart_store_backend, db_pool, path=cart_store_path, max_users=cart_store_max_users,
+                          flush_interval=cart_flush_interval, batch_size=cart_flush_batch_size)
+
+# Выдача ключей оформленным заказам: потоки-обработчики очереди (см. fulfilment.py)
+fulfilment_queue = fulfilment.FulfilmentQueue(
+    db_pool, workers=fulfilment_workers, poll_interval=fulfilment_poll_interval, batch_size=fulfilment_batch_size,
+    max_attempts=fulfilment_max_attempts, lease_seconds=fulfilment_lease_seconds, retry_delay=fulfilment_retry_delay
+)
+
+# Выданные лицензионные ключи в памяти процесса для /api/licenses (см. licenses.py)
+license_index = LicenseIndex(ttl=license_index_ttl, check_interval=license_index_check_interval)
+
+# Статические файлы: url_for('static', ...) ведет на версию с хэшем из манифеста сборки
+# (python assets.py build), такие файлы кэшируются браузером навсегда и отдаются сжатыми
+asset_manifest = assets.Manifest(os.path.join(APP_ROOT, 'static'))
+
+@routes.url_defaults
+def hashed_static_url(endpoint, values):
+    if endpoint == 'static' and 'filename' in values:
+        values['filename'] = asset_manifest.url_path(values['filename'])
+
+def serve_static(filename):
+    return assets.send_asset(asset_manifest, filename, request.accept_encodings)
+
+# Загрузка изображений товаров: имена по хэшу содержимого, уменьшенные копии в фоне (см. images.py)
+image_pipeline = ImagePipeline(UPLOAD_FOLDER, max_bytes=image_max_upload_mb * 1024 * 1024, workers=image_workers)
+
+def _image_file_url(name):
+    return url_for('static', filename='images/' + name)
+
+@routes.template_global()
+def image_srcset(name, fmt='jpg'):
+    # srcset с уменьшенными копиями ('' — копий еще нет, показываем оригинал)
+    return image_pipeline.srcset(name, fmt, _image_file_url)
+
+@routes.template_global()
+def image_url(name, size='card'):
+    return image_pipeline.url(name, size, _image_file_url)
+
+@routes.errorhandler(RequestEntityTooLarge)
+def upload_too_large(exc):
+    # У импорта товаров свой, больший лимит (admin_import)
+    if request.endpoint == 'admin_import':
+        flash(f"Файл слишком большой (не более {import_max_upload_mb} МБ)", "error")
+        return redirect(url_for('admin_dashboard', tab='products'))
+    flash(f"Файл слишком большой (не более {image_max_upload_mb} МБ)", "error")
+    return redirect(url_for('admin_dashboard'))
+
+# Готовые страницы витрины и товаров для анонимных посетителей (см. http_cache.py)
+page_cache = http_cache.ResponseCache(max_entries=page_cache_max_entries, max_bytes=page_cache_max_mb * 1024 * 1024)
+TEMPLATES_FINGERPRINT = http_cache.templates_fingerprint(os.path.join(APP_ROOT, 'templates'))
+
+# Фрагменты шаблонов ({% cache %}) — для всех посетителей, и байт-код шаблонов на диске (см. fragments.py)
+fragment_cache = fragments.FragmentCache(max_entries=fragment_cache_max_entries,
+                                         max_chars=fragment_cache_max_mb * 1024 * 1024, ttl=fragment_cache_ttl)
+TEMPLATE_BYTECODE_DIR = os.path.join(APP_ROOT, template_bytecode_dir) if template_bytecode_dir else None
+
+def page_lookup(req, version, last_modified):
+    # Общая часть cached_page для обоих приложений (app и async_app, req — запрос Flask или Quart):
+    # (etag, key, body). key None — у браузера та же версия страницы (ответ 304),
+    # body None — страницы нет в кэше, ее нужно отрендерить и положить под key
+    etag = f"{TEMPLATES_FINGERPRINT}-{version}"
+    if http_cache.not_modified(req, etag, last_modified):
+        return etag, None, None
+    key = http_cache.page_key(req)
+    return etag, key, page_cache.get(key, etag)
+
+def page_response(response, etag, last_modified):
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    # Браузер хранит страницу, но каждый раз сверяет ETag: после правки товара он получит новую
+    response.cache_control.no_cache = True
+    return response
+
+def cached_page(version, last_modified, render):
+    # 304, если у браузера та же версия страницы; иначе HTML из кэша или render()
+    etag, key, body = page_lookup(request, version, last_modified)
+    if key is None:
+        return page_response(Response(status=304), etag, last_modified)
+    if body is None:
+        body = render().encode('utf-8')
+        page_cache.put(key, etag, body)
+    return page_response(Response(body, mimetype='text/html'), etag, last_modified)
+
+def cached_json(version, last_modified, build):
+    # Ответ JSON API: 304 по ETag, иначе тело из кэша страниц или build() —
+    # сжатое gzip, если клиент его принимает (сжатое и несжатое тело кэшируются отдельно).
+    # У сжатого тела свой сильный ETag (с суффиксом -gzip): байты ответа другие
+    etag = f"api-{version}"
+    gzip_etag = f"{etag}-gzip"
+    if http_cache.not_modified(request, gzip_etag):
+        response = Response(status=304)
+        etag = gzip_etag
+    elif http_cache.not_modified(request, etag, last_modified):
+        response = Response(status=304)
+    else:
+        key = http_cache.page_key(request) + ('#gzip' if request.accept_encodings['gzip'] else '')
+        body = page_cache.get(key, etag)
+        if body is None:
+            body = catalog_api.encode(catalog_api.dumps(build()), request.accept_encodings)
+            page_cache.put(key, etag, body)
+        response = Response(body, mimetype='application/json')
+        if catalog_api.is_gzip(body):
+            response.headers['Content-Encoding'] = 'gzip'
+            etag = gzip_etag
+    response.vary.add('Accept-Encoding')
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    response.cache_control.no_cache = True
+    return response
+
+# --- Метрики (/metrics) и журнал медленных запросов ---
+metrics.setup_slow_log(slow_request_log)
+
+def _cache_counts():
+    search_index = catalog_cache.search_index
+    return {
+        ('catalog', 'hit'): catalog_cache.hits, ('catalog', 'miss'): catalog_cache.misses,
+        ('search', 'hit'): search_index.hits, ('search', 'miss'): search_index.misses,
+        ('page', 'hit'): page_cache.hits, ('page', 'miss'): page_cache.misses,
+        ('fragment', 'hit'): fragment_cache.hits, ('fragment', 'miss'): fragment_cache.misses,
+    }
+
+def _cache_hit_ratio():
+    counts = _cache_counts()
+    ratios = {}
+    for cache in ('catalog', 'search', 'page', 'fragment'):
+        total = counts[(cache, 'hit')] + counts[(cache, 'miss')]
+        ratios[(cache,)] = counts[(cache, 'hit')] / total if total else 0
+    return ratios
+
+metrics.registry.register(metrics.Gauge(
+    'softkey_db_pool_connections', "Соединения пула по состоянию",
+    lambda: {(state,): value for state, value in db_pool.stats().items() if state in ('size', 'idle', 'in_use')},
+    ('state',)))
+metrics.registry.register(metrics.Gauge(
+    'softkey_db_pool_utilization', "Доля занятых соединений от max_size",
+    lambda: db_pool.stats()['in_use'] / db_pool.max_size))
+metrics.registry.register(metrics.Gauge(
+    'softkey_db_pool_timeouts_total', "Сколько раз не дождались свободного соединения",
+    lambda: db_pool.timeouts, kind='counter'))
+metrics.registry.register(metrics.Gauge(
+    'softkey_db_replica_lag_seconds', "Отставание реплик при последней проверке (-1 — репликация остановлена)",
+    lambda: {(name,): -1 if state['lag'] is None else state['lag']
+             for name, state in read_router.replicas.stats().items() if state['checked']},
+    ('replica',)))
+metrics.registry.register(metrics.Gauge(
+    'softkey_db_replica_reads_total', "Соединения для чтения, выданные репликами",
+    lambda: {(name,): state['reads'] for name, state in read_router.replicas.stats().items()},
+    ('replica',), kind='counter'))
+metrics.registry.register(metrics.Gauge(
+    'softkey_db_replica_fallbacks_total', "Чтения, переданные основному серверу: все реплики отстают или недоступны",
+    lambda: read_router.replicas.fallbacks, kind='counter'))
+metrics.registry.register(metrics.Gauge(
+    'softkey_cache_requests_total', "Обращения к кэшам каталога и поиска",
+    _cache_counts, ('cache', 'result'), kind='counter'))
+metrics.registry.register(metrics.Gauge(
+    'softkey_cache_hit_ratio', "Доля попаданий в кэш", _cache_hit_ratio, ('cache',)))
+metrics.registry.register(metrics.Gauge(
+    'softkey_fulfilment_jobs_total', "Задания выдачи ключей по результату (retried — будут повторены)",
+    lambda: {(result,): value for result, value in fulfilment_queue.stats().items()},
+    ('result',), kind='counter'))
+metrics.registry.register(metrics.Gauge(
+    'softkey_license_index_keys', "Лицензионные ключи в индексе проверки",
+    lambda: len(license_index)))
+metrics.registry.register(metrics.Gauge(
+    'softkey_license_checks_total', "Проверки ключей через API по результату",
+    lambda: {('found',): license_index.found, ('missing',): license_index.missing},
+    ('result',), kind='counter'))
+metrics.registry.register(metrics.Gauge(
+    'softkey_cart_store_carts', "Корзины в локальном хранилище (dirty — ждут записи в БД)",
+    lambda: {(state,): value for state, value in cart_store.stats().items() if state in ('cached', 'dirty')},
+    ('state',)))
+metrics.registry.register(metrics.Gauge(
+    'softkey_cart_store_flushed_total', "Сколько корзин записано в БД",
+    lambda: cart_store.flushed, kind='counter'))
+metrics.registry.register(metrics.Gauge(
+    'softkey_cart_store_flush_errors_total', "Неудачные записи корзин в БД",
+    lambda: cart_store.flush_errors, kind='counter'))
+
+metrics.registry.register(metrics.Gauge(
+    'softkey_startup_seconds', "Длительность этапов запуска процесса",
+    lambda: {(phase,): seconds for phase, seconds in startup_timer.phases.items()}, ('phase',)))
+
+@routes.before_request
+def start_request_metrics():
+    metrics.start_request()
+
+@routes.before_request
+def start_fulfilment_workers():
+    # Обработчики очереди запускаются в каждом процессе при первом запросе
+    fulfilment_queue.start()
+
+@routes.after_request
+def record_request_metrics(response):
+    stats = metrics.finish_request()
+    if stats is not None:
+        metrics.observe_request(stats, request.method, request.path, request.endpoint,
+                                response.status_code, slow_request_threshold)
+    return response
+
+@routes.teardown_request
+def record_failed_request_metrics(exc):
+    # Исключение прошло мимо after_request — считаем запрос ошибкой сервера
+    stats = metrics.finish_request()
+    if stats is not None:
+        metrics.observe_request(stats, request.method, request.path, request.endpoint,
+                                500, slow_request_threshold)
+
+@routes.route('/metrics')
+def metrics_endpoint():
+    # Метрики процесса в текстовом формате Prometheus
+    if metrics_allowed_ips and request.remote_addr not in metrics_allowed_ips:
+        abort(403)
+    return Response(metrics.registry.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+@routes.route('/ready')
+def ready():
+    # Готовность процесса принимать трафик (для балансировщика): каталог загружен, шаблоны
+    # скомпилированы. Если прогрев при запуске не удался или был выключен, пробуем здесь
+    if not startup_timer.ready:
+        warm_up(current_app)
+    phases = {phase: round(seconds, 3) for phase, seconds in startup_timer.phases.items()}
+    status = 200 if startup_timer.ready else 503
+    return jsonify({'ready': startup_timer.ready, 'pid': os.getpid(), 'startup': phases}), status
+
 def get_db_connection():
+    # Одно соединение на запрос: берется из пула при первом обращении и хранится в g
+    if 'db_conn' in g:
+        return g.db_conn
     try:
-        return db.connect(
-            host=host, port=port, user=user, password=password,
-            database=db_name, cursorclass=db.cursors.DictCursor, autocommit=True
-        )
+        g.db_conn = db_pool.acquire()
+        return g.db_conn
     except Exception as ex:
         print("Ошибка подключения:", ex)
         return None
 
-@app.route('/index')
-@app.route('/')
+def get_read_connection():
+    # Соединение для запросов только на чтение: с реплики, если они настроены и сессия
+    # недавно ничего не записывала; иначе (и если все реплики отстают) — основное соединение
+    if 'read_conn' in g:
+        return g.read_conn
+    if 'db_conn' in g or not read_router or is_sticky(session, read_your_writes_seconds):
+        return get_db_connection()
+    conn = read_router.acquire()
+    if conn is None:
+        return get_db_connection()
+    g.read_conn = conn
+    return conn
+
+@routes.after_request
+def remember_db_write(response):
+    # POST-запрос, работавший с основным сервером, мог что-то записать: следующие чтения
+    # этой сессии идут туда же, пока реплики не догонят
+    if request.method == 'POST' and 'db_conn' in g:
+        mark_written(session)
+    return response
+
+@routes.template_global()
+def page_url(**updates):
+    # Ссылка на текущую страницу с теми же параметрами, кроме измененных (None — убрать)
+    return url_for(request.endpoint, **(request.view_args or {}), **page_args(request.args, updates))
+
+@routes.teardown_appcontext
+def release_db_connection(exc):
+    # Возвращаем соединение в пул по завершении запроса
+    conn = g.pop('db_conn', None)
+    if conn is not None:
+        db_pool.release(conn)
+    conn = g.pop('read_conn', None)
+    if conn is not None:
+        read_router.release(conn)
+
+@routes.route('/index')
+@routes.route('/')
 def index():
     category_id = request.args.get('category')
     search_query = request.args.get('search')
     sort_price = request.args.get('sort_price') # asc / desc
     sort_date = request.args.get('sort_date')   # new / old
+    price_min = request.args.get('price_min')
+    price_max = request.args.get('price_max')
     
-    conn = get_db_connection()
-    categories = []
-    products = []
-    
-    if conn:
-        with conn.cursor() as cursor:
-            # Получаем все категории для выпадающего списка
-            cursor.execute("SELECT * FROM Категории")
-            categories = cursor.fetchall()
-            
-            # Строим запрос
-            sql = "SELECT t.*, k.Название_категории FROM Товары t JOIN Категории k ON t.ID_Категории = k.ID_Категории WHERE Статус_активности = 1"
-            params = []
-            
-            if category_id and category_id != 'all':
-                sql += " AND t.ID_Категории = %s"
-                params.append(category_id)
-            if search_query:
-                sql += " AND t.Название LIKE %s"
-                params.append(f"%{search_query}%")
-            
-            # Сортировка
-            order_clauses = []
-            if sort_price == 'asc': order_clauses.append("t.Цена ASC")
-            elif sort_price == 'desc': order_clauses.append("t.Цена DESC")
-            
-            if sort_date == 'new': order_clauses.append("t.ID_Товара DESC")
-            elif sort_date == 'old': order_clauses.append("t.ID_Товара ASC")
-            
-            if order_clauses:
-                sql += " ORDER BY " + ", ".join(order_clauses)
-                
-            cursor.execute(sql, tuple(params))
-            products = cursor.fetchall()
-        conn.close()
+    per_page = page_size(request.args.get('per_page'), catalog_page_size, max_page_size)
     
-    return render_template('index.html', products=products, categories=categories)
+    # Каталог берется из кэша в памяти, БД нужна только для сверки версии
+    catalog = catalog_cache.get(get_read_connection, get_db_connection)
+
+    def render():
+        categories = []
+        products = Page([], per_page)
+        total = 0
+        facets = None
+        if catalog:
+            categories = catalog.categories
+            items, sort_key = catalog.query(category_id, search_query, sort_price, sort_date,
+                                            price_min, price_max)
+            total = len(items)
+            products = paginate_list(items, sort_key, request.args.get('cursor'), per_page)
+            facets = catalog.facets(category_id, search_query, price_min, price_max)
+        return render_template('index.html', products=products, categories=categories, total=total,
+                               facets=facets, catalog_version=catalog.version if catalog else None)
+
+    # Анонимным посетителям витрина не меняется до следующего изменения каталога
+    if catalog and http_cache.cacheable(request, session):
+        return cached_page(f"c{catalog.version}", catalog.changed_at, render)
+    return render()
 
-@app.route('/login', methods=['GET', 'POST'])
+@routes.route('/login', methods=['GET', 'POST'])
 def login():
     if request.method == 'POST':
         login_input = request.form['login']
@@ -104,12 +421,11 @@ def login():
                         return redirect(url_for('index')) # На главную для клиентов
                 else:
                     flash("Неверный логин или пароль", "error")
-            conn.close()
             
     return render_template('login.html')
 
 
-@app.route('/register', methods=['GET', 'POST'])
+@routes.route('/register', methods=['GET', 'POST'])
 def register():
     if request.method == 'POST':
         email = request.form['email']
@@ -132,187 +448,251 @@ def register():
                         return redirect(url_for('login'))
             except Exception as e:
                 flash(f'Ошибка: {str(e)}', 'error')
-            finally:
-                conn.close()
     return render_template('register.html')
 
 # --- ОТОБРАЖЕНИЕ КОРЗИНЫ ---
-@app.route('/cart')
+@routes.route('/cart')
 def cart():
     if 'user_id' not in session:
         flash("Войдите, чтобы пользоваться корзиной", "error")
         return redirect(url_for('login'))
         
-    conn = get_db_connection()
     items = []
     total_price = 0
-    if conn:
-        with conn.cursor() as cursor:
-            sql = """
-                SELECT k.*, t.Название, t.Цена, t.Описание, t.Изображение, cat.Название_категории
-                FROM Корзина k
-                JOIN Товары t ON k.ID_Товара = t.ID_Товара
-                JOIN Категории cat ON t.ID_Категории = cat.ID_Категории
-                WHERE k.ID_Пользователя = %s
-            """
-            cursor.execute(sql, (session['user_id'],))
-            items = cursor.fetchall()
-            # Считаем сумму
-            total_price = sum(item['Цена'] * item['Количество'] for item in items)
-        conn.close()
-    return render_template('cart.html', items=items, total_price=total_price)
+    try:
+        # Количество — из хранилища корзин, названия и цены — из кэша каталога,
+        # поэтому обычно страница корзины не обращается к БД
+        catalog = catalog_cache.get(get_db_connection)
+        items, total_price = cart_store.lines(session['user_id'], catalog, get_db_connection)
+    except Exception as ex:
+        print("Ошибка загрузки корзины:", ex)
+    # Ключ идемпотентности формы оформления: повторная отправка не создаст второй заказ
+    return render_template('cart.html', items=items, total_price=total_price, idempotency_key=uuid.uuid4().hex)
 
 # --- ИЗМЕНЕНИЕ КОЛИЧЕСТВА ---
-@app.route('/cart/update/<int:product_id>/<action>')
+@routes.route('/cart/update/<int:product_id>/<action>')
 def update_cart(product_id, action):
     if 'user_id' not in session: return redirect(url_for('login'))
     
-    conn = get_db_connection()
-    if conn:
-        with conn.cursor() as cursor:
-            if action == 'plus':
-                cursor.execute("UPDATE Корзина SET Количество = Количество + 1 WHERE ID_Пользователя = %s AND ID_Товара = %s", (session['user_id'], product_id))
-            elif action == 'minus':
-                # Удаляем, если количество станет 0
-                cursor.execute("UPDATE Корзина SET Количество = Количество - 1 WHERE ID_Пользователя = %s AND ID_Товара = %s AND Количество > 1", (session['user_id'], product_id))
-        conn.close()
+    try:
+        if action == 'plus':
+            cart_store.add(session['user_id'], product_id, get_db_connection)
+        elif action == 'minus':
+            # Меньше одной штуки не уменьшаем — для этого есть удаление
+            cart_store.add(session['user_id'], product_id, get_db_connection, delta=-1)
+    except Exception as ex:
+        print("Ошибка изменения корзины:", ex)
     return redirect(url_for('cart'))
 
 # --- УДАЛЕНИЕ ИЗ КОРЗИНЫ ---
-@app.route('/cart/remove/<int:product_id>')
+@routes.route('/cart/remove/<int:product_id>')
 def remove_from_cart(product_id):
     if 'user_id' not in session: return redirect(url_for('login'))
-    conn = get_db_connection()
-    if conn:
-        with conn.cursor() as cursor:
-            cursor.execute("DELETE FROM Корзина WHERE ID_Пользователя = %s AND ID_Товара = %s", (session['user_id'], product_id))
-        conn.close()
+    try:
+        cart_store.remove(session['user_id'], product_id, get_db_connection)
+    except Exception as ex:
+        print("Ошибка удаления из корзины:", ex)
     return redirect(url_for('cart'))
 
 
-@app.route('/checkout', methods=['POST'])
+@routes.route('/checkout', methods=['POST'])
 def checkout():
     if 'user_id' not in session: 
         return redirect(url_for('login'))
     
+    user_id = session['user_id']
     conn = get_db_connection()
     if conn:
         try:
+            # Несохраненные изменения корзины записываем в БД до начала транзакции заказа
+            cart_store.flush(conn, [user_id])
+
+            # В запросе только записываем заказ, его позиции и задание в очередь и очищаем
+            # корзину — одной транзакцией. Ключи выдает фоновый обработчик (fulfilment.py),
+            # поэтому время ответа не зависит от числа лицензий и нагрузки на склад ключей
+            conn.begin()
             with conn.cursor() as cursor:
-                # 1. Получаем товары из корзины
-                cursor.execute("""
-                    SELECT k.ID_Товара, k.Количество, t.Цена 
-                    FROM Корзина k 
-                    JOIN Товары t ON k.ID_Товара = t.ID_Товара
-                    WHERE k.ID_Пользователя = %s
-                """, (session['user_id'],))
-                cart_items = cursor.fetchall()
-                
-                if not cart_items:
+                order_id, created = fulfilment.place_order(cursor, user_id, request.form.get('idempotency_key'),
+                                                           LICENSE_DAYS)
+            if not created:
+                conn.rollback()
+                if order_id is None:
                     flash("Корзина пуста", "error")
                     return redirect(url_for('cart'))
-
-                # 2. Считаем общую сумму
-                total_sum = sum(item['Цена'] * item['Количество'] for item in cart_items)
-
-                # 3. Создаем основной заказ
-                cursor.execute("INSERT INTO Заказы (ID_Пользователя, Дата_заказа, Статус, Итоговая_сумма) VALUES (%s, NOW(), 'Оплачен', %s)", 
-                                (session['user_id'], total_sum))
-                order_id = cursor.lastrowid
-
-                # 4. Для каждого товара в корзине...
-                for item in cart_items:
-                    # Вставляем в Состав_заказа
-                    cursor.execute("""
-                        INSERT INTO Состав_заказа (ID_Заказа, ID_Товара, Цена_продажи, Срок_лицензии_дни, Количество)
-                        VALUES (%s, %s, %s, %s, %s)
-                    """, (order_id, item['ID_Товара'], item['Цена'], 365, item['Количество']))
-                    
-                    pos_id = cursor.lastrowid # ID только что созданной строки в составе заказа
-
-                    # 5. Генерируем лицензионные ключи (по одному на каждую единицу товара)
-                    for _ in range(item['Количество']):
-                        new_key = str(uuid.uuid4()).upper()[:18] # Пример: 123E4567-E89B-12D3
-                        # Рассчитываем дату истечения (например, + год)
-                        expire_date = datetime.now() + timedelta(days=365)
-                        
-                        cursor.execute("""
-                            INSERT INTO Лицензии (ID_Позиции_заказа, Лицензионный_ключ, Дата_активации, Дата_истечения)
-                            VALUES (%s, %s, NOW(), %s)
-                        """, (pos_id, new_key, expire_date))
-
-                # 6. Очищаем корзину
-                cursor.execute("DELETE FROM Корзина WHERE ID_Пользователя = %s", (session['user_id'],))
+                cart_store.clear(user_id)
+                flash(f"Заказ #{order_id} уже оформлен", "success")
+                return redirect(url_for('orders'))
+            conn.commit()
+            cart_store.clear(user_id)
+            fulfilment_queue.notify()
             
-            flash(f"Заказ #{order_id} успешно оформлен! Ключи созданы.", "success")
+            flash(f"Заказ #{order_id} принят! Ключи появятся через несколько секунд.", "success")
         except Exception as ex:
+            conn.rollback()
             print("Ошибка оформления:", ex)
             flash("Ошибка при создании заказа", "error")
-        finally:
-            conn.close()
             
     return redirect(url_for('orders'))
 
-@app.route('/product/<int:product_id>')
-def product_detail(product_id):
+@routes.route('/orders/<int:order_id>/status')
+def order_status(order_id):
+    # Статус заказа для страницы "Мои заказы", пока ключи выдаются в фоне.
+    # Читается с основного сервера: реплика может еще не знать о выдаче
+    if 'user_id' not in session:
+        return jsonify({'error': 'Требуется вход'}), 401
     conn = get_db_connection()
+    if not conn:
+        return jsonify({'error': 'База данных недоступна'}), 503
+    with conn.cursor() as cursor:
+        cursor.execute(fulfilment.ORDER_STATUS_QUERY, (order_id, session['user_id']))
+        row = cursor.fetchone()
+    if row is None:
+        return jsonify({'error': 'Заказ не найден'}), 404
+    return jsonify({'status': row['Статус'], 'pending': row['Статус'] == fulfilment.PENDING_STATUS})
+
+# --- API проверки лицензионных ключей (серверы активации, реселлеры) ---
+def license_api_error():
+    # Ответ с ошибкой, если запрос нельзя обслужить, иначе None
+    if license_api_tokens:
+        token = request.headers.get('Authorization', '').removeprefix('Bearer ').strip()
+        if token not in license_api_tokens:
+            return jsonify({'error': 'Неверный токен'}), 401
+    license_index.refresh(get_read_connection)
+    if not license_index.loaded:
+        # Пустой индекс ответил бы "не найден" на любой ключ
+        return jsonify({'error': 'Индекс ключей еще не загружен'}), 503
+    return None
+
+@routes.route('/api/licenses/<path:key>')
+def license_check(key):
+    error = license_api_error()
+    if error:
+        return error
+    result = license_index.check(key)
+    return jsonify(result), 200 if result['found'] else 404
+
+@routes.route('/api/licenses/validate', methods=['POST'])
+def license_check_many():
+    # Тело: {"keys": ["XXXX-XXXX-XXXX", ...]} — не больше license_batch_max ключей
+    error = license_api_error()
+    if error:
+        return error
+    data = request.get_json(silent=True)
+    keys = data.get('keys') if isinstance(data, dict) else None
+    if not isinstance(keys, list) or not all(isinstance(key, str) for key in keys):
+        return jsonify({'error': 'Ожидается {"keys": [строки]}'}), 400
+    if len(keys) > license_batch_max:
+        return jsonify({'error': f'Не больше {license_batch_max} ключей за запрос'}), 413
+    return jsonify({'results': license_index.check_many(keys)})
+
+# Товар по ID (в том числе неактивный) — для прямых ссылок мимо кэша каталога
+@routes.route('/product/<int:product_id>')
+def product_detail(product_id):
     product = None
     
+    catalog = catalog_cache.get(get_read_connection, get_db_connection)
+    if catalog:
+        product = catalog.by_id.get(product_id)
+    
+    # Неактивных товаров в кэше нет — их по прямой ссылке читаем из БД, как раньше
+    conn = get_read_connection() if not product else None
     if conn:
         with conn.cursor() as cursor:
-            sql = """
-                SELECT t.*, k.Название_категории
-                FROM Товары t
-                JOIN Категории k ON t.ID_Категории = k.ID_Категории
-                WHERE t.ID_Товара = %s
-            """
-            cursor.execute(sql, (product_id,))
-            product = cursor.fetchone()
-        conn.close()
+            cursor.execute(PRODUCT_QUERY, (product_id,))
+            product = product_from_row(cursor.fetchone())
     
     if not product:
         flash("Товар не найден", "error")
         return redirect(url_for('index'))
-        
-    return render_template('product_detail.html', product=product)
+
+    render = lambda: render_template('product_detail.html', product=product)
+    # Страница товара из каталога меняется только вместе с версией товара
+    if conn is None and http_cache.cacheable(request, session):
+        return cached_page(f"p{product_id}-{product['Версия']}", product['Метка_изменения'], render)
+    return render()
+
+
+# --- JSON API каталога (мобильное приложение, партнеры) ---
+@routes.route('/api/v1/products')
+def api_products():
+    # Те же фильтры, сортировка и курсоры, что у витрины; fields= — нужные поля
+    catalog = catalog_cache.get(get_read_connection, get_db_connection)
+    if not catalog:
+        return jsonify({'error': 'Каталог недоступен'}), 503
+    try:
+        fields = catalog_api.parse_fields(request.args.get('fields'), catalog_api.LIST_FIELDS)
+    except catalog_api.ApiError as ex:
+        return jsonify({'error': str(ex)}), 400
+    args = request.args
+    per_page = page_size(args.get('per_page'), catalog_page_size, max_page_size)
+
+    def build():
+        items, sort_key = catalog.query(args.get('category'), args.get('search'), args.get('sort_price'),
+                                        args.get('sort_date'), args.get('price_min'), args.get('price_max'))
+        page = paginate_list(items, sort_key, args.get('cursor'), per_page)
+        return {
+            'items': [catalog_api.product_json(p, fields, _image_file_url) for p in page],
+            'total': len(items),
+            'next_cursor': page.next_cursor,
+            'prev_cursor': page.prev_cursor,
+        }
+
+    return cached_json(f"c{catalog.version}", catalog.changed_at, build)
+
+@routes.route('/api/v1/products/<int:product_id>')
+def api_product(product_id):
+    try:
+        fields = catalog_api.parse_fields(request.args.get('fields'), catalog_api.DETAIL_FIELDS)
+    except catalog_api.ApiError as ex:
+        return jsonify({'error': str(ex)}), 400
+    catalog = catalog_cache.get(get_read_connection, get_db_connection)
+    product = catalog.by_id.get(product_id) if catalog else None
+    if product is None:
+        conn = get_read_connection()
+        if not conn:
+            return jsonify({'error': 'База данных недоступна'}), 503
+        with conn.cursor() as cursor:
+            cursor.execute(PRODUCT_QUERY, (product_id,))
+            product = product_from_row(cursor.fetchone())
+    if not product:
+        return jsonify({'error': 'Товар не найден'}), 404
+    # Версия товара увеличивается при любой правке и при снятии с продажи
+    return cached_json(f"p{product_id}-{product['Версия']}", product.get('Метка_изменения'),
+                       lambda: catalog_api.product_json(product, fields, _image_file_url))
+
+@routes.route('/api/v1/categories')
+def api_categories():
+    catalog = catalog_cache.get(get_read_connection, get_db_connection)
+    if not catalog:
+        return jsonify({'error': 'Каталог недоступен'}), 503
+
+    def build():
+        counts = catalog.facets()['categories']
+        return {'items': [catalog_api.category_json(c, counts.get(c['ID_Категории'], 0))
+                          for c in catalog.categories]}
+
+    return cached_json(f"c{catalog.version}", catalog.changed_at, build)
 
 
 # --- ДОБАВЛЕНИЕ В КОРЗИНУ ---
-@app.route('/add_to_cart/<int:product_id>', methods=['POST'])
+@routes.route('/add_to_cart/<int:product_id>', methods=['POST'])
 def add_to_cart(product_id):
     if 'user_id' not in session:
         flash("Войдите в аккаунт, чтобы добавить товар в корзину", "error")
         return redirect(url_for('login'))
         
-    conn = get_db_connection()
-    if conn:
-        try:
-            with conn.cursor() as cursor:
-                # Проверяем, есть ли уже такой товар в корзине у этого пользователя
-                cursor.execute("SELECT * FROM Корзина WHERE ID_Пользователя = %s AND ID_Товара = %s", 
-                                (session['user_id'], product_id))
-                item = cursor.fetchone()
-                
-                if item:
-                    # Если есть — увеличиваем количество
-                    cursor.execute("UPDATE Корзина SET Количество = Количество + 1 WHERE ID_Пользователя = %s AND ID_Товара = %s", 
-                                    (session['user_id'], product_id))
-                else:
-                    # Если нет — добавляем новую запись
-                    cursor.execute("INSERT INTO Корзина (ID_Пользователя, ID_Товара, Количество) VALUES (%s, %s, 1)", 
-                                    (session['user_id'], product_id))
-            
-            flash("Товар добавлен в корзину!", "success")
-        except Exception as ex:
-            print("Ошибка добавления в корзину:", ex)
-            flash("Не удалось добавить товар", "error")
-        finally:
-            conn.close()
+    try:
+        # Только локальное хранилище — в таблицу Корзина изменение попадет в фоне
+        cart_store.add(session['user_id'], product_id, get_db_connection)
+        flash("Товар добавлен в корзину!", "success")
+    except Exception as ex:
+        print("Ошибка добавления в корзину:", ex)
+        flash("Не удалось добавить товар", "error")
             
     # Возвращаемся обратно в корзину или на ту же страницу
     return redirect(url_for('cart'))
 
-@app.route('/profile')
+@routes.route('/profile')
 def profile():
     if 'user_id' not in session:
         return redirect(url_for('login'))
@@ -328,7 +708,6 @@ def profile():
             
             cursor.execute("SELECT * FROM Заказы WHERE ID_Пользователя = %s ORDER BY Дата_заказа DESC", (session['user_id'],))
             orders = cursor.fetchall()
-        conn.close()
     
     # Рассчитываем максимальную дату (сегодня) для ограничения выбора даты рождения
     from datetime import date
@@ -350,14 +729,14 @@ def profile():
                         max_date=max_date)
 
 # --- ВЫХОД ИЗ СИСТЕМЫ ---
-@app.route('/logout')
+@routes.route('/logout')
 def logout():
     session.clear() # Полная очистка сессии
     flash("Вы вышли из системы", "success")
     return redirect(url_for('index'))
 
 # --- ОБНОВЛЕНИЕ ЛИЧНЫХ ДАННЫХ ---
-@app.route('/update_profile', methods=['POST'])
+@routes.route('/update_profile', methods=['POST'])
 def update_profile():
     if 'user_id' not in session:
         return redirect(url_for('login'))
@@ -403,13 +782,11 @@ def update_profile():
         except Exception as ex:
             print("Ошибка при обновлении профиля:", ex)
             flash("Ошибка при обновлении данных", "error")
-        finally:
-            conn.close()
             
     return redirect(url_for('profile'))
 
 # --- СМЕНА ПАРОЛЯ ---
-@app.route('/change_password', methods=['POST'])
+@routes.route('/change_password', methods=['POST'])
 def change_password():
     if 'user_id' not in session:
         return redirect(url_for('login'))
@@ -468,13 +845,11 @@ def change_password():
         except Exception as ex:
             print("Ошибка при смене пароля:", ex)
             flash("Ошибка при смене пароля", "error")
-        finally:
-            conn.close()
     
     return redirect(url_for('profile'))
 
 # --- УДАЛЕНИЕ АККАУНТА ---
-@app.route('/delete_account')
+@routes.route('/delete_account')
 def delete_account():
     if 'user_id' not in session:
         return redirect(url_for('login'))
@@ -483,6 +858,8 @@ def delete_account():
     conn = get_db_connection()
     if conn:
         try:
+            # Корзина из хранилища больше не должна попасть в БД
+            cart_store.forget(user_id)
             with conn.cursor() as cursor:
                 # Важно: если в БД нет каскадного удаления,
                 # сначала нужно удалить товары из корзины этого пользователя
@@ -496,181 +873,284 @@ def delete_account():
         except Exception as ex:
             print("Ошибка при удалении:", ex)
             flash("Не удалось удалить аккаунт (возможно, у вас есть активные заказы)", "error")
-        finally:
-            conn.close()
             
     return redirect(url_for('profile'))
 
-@app.route('/orders')
+# Заголовки заказов пользователя (постранично по дате, см. индекс Заказы_пользователь_дата)
+ORDER_HEADERS_QUERY = """
+    SELECT z.ID_Заказа, z.Дата_заказа, z.Статус, z.Итоговая_сумма
+    FROM Заказы z
+    WHERE z.ID_Пользователя = %s
+"""
+
+# Ключи одной позиции заказа — только если заказ принадлежит пользователю
+ORDER_KEYS_QUERY = """
+    SELECT l.ID_Лицензии, l.Лицензионный_ключ, l.Дата_активации, l.Дата_истечения
+    FROM Лицензии l
+    JOIN Состав_заказа sz ON l.ID_Позиции_заказа = sz.ID_Позиции
+    JOIN Заказы z ON sz.ID_Заказа = z.ID_Заказа
+    WHERE l.ID_Позиции_заказа = %s AND z.ID_Пользователя = %s
+"""
+
+# Сколько ключей читать за один запрос при выгрузке в файл
+KEYS_DOWNLOAD_BATCH = 1000
+
+def order_lines_query(order_ids):
+    # Позиции заказов страницы (без ключей: их число не ограничено)
+    placeholders = ', '.join(['%s'] * len(order_ids))
+    return f"""
+        SELECT sz.ID_Заказа, sz.ID_Позиции, sz.Количество, sz.Цена_продажи, sz.Срок_лицензии_дни, t.Название
+        FROM Состав_заказа sz
+        JOIN Товары t ON sz.ID_Товара = t.ID_Товара
+        WHERE sz.ID_Заказа IN ({placeholders})
+        ORDER BY sz.ID_Позиции
+    """
+
+def attach_order_lines(orders, lines):
+    # Раскладывает позиции по заказам и считает число позиций и ключей заказа
+    by_id = {}
+    for order in orders:
+        order['products_list'] = []
+        order['keys_count'] = 0
+        by_id[order['ID_Заказа']] = order
+    for line in lines:
+        order = by_id[line['ID_Заказа']]
+        order['products_list'].append(line)
+        order['keys_count'] += line['Количество']
+    return orders
+
+@routes.route('/orders')
 def orders():
     if 'user_id' not in session:
         return redirect(url_for('login'))
     
-    conn = get_db_connection()
-    orders_list = []
-    
-    if conn:
-        with conn.cursor() as cursor:
-            # Получаем заказы, товары и их ключи одним запросом
-            cursor.execute("""
-                SELECT
-                    z.ID_Заказа, z.Дата_заказа, z.Статус, z.Итоговая_сумма,
-                    sz.ID_Позиции, sz.Количество, sz.Цена_продажи,
-                    t.Название,
-                    l.Лицензионный_ключ
-                FROM Заказы z
-                JOIN Состав_заказа sz ON z.ID_Заказа = sz.ID_Заказа
-                JOIN Товары t ON sz.ID_Товара = t.ID_Товара
-                LEFT JOIN Лицензии l ON sz.ID_Позиции = l.ID_Позиции_заказа
-                WHERE z.ID_Пользователя = %s
-                ORDER BY z.Дата_заказа DESC
-            """, (session['user_id'],))
-            rows = cursor.fetchall()
-
-            # Группируем данные: Заказ -> Позиции -> Ключи
-            orders_dict = {}
-            for row in rows:
-                o_id = row['ID_Заказа']
-                if o_id not in orders_dict:
-                    orders_dict[o_id] = {
-                        'ID_Заказа': o_id,
-                        'Дата_заказа': row['Дата_заказа'],
-                        'Статус': row['Статус'],
-                        'Итоговая_сумма': row['Итоговая_сумма'],
-                        'products_list': {} # Используем словарь для группировки по ID позиции
-                    }
-                
-                pos_id = row['ID_Позиции']
-                if pos_id not in orders_dict[o_id]['products_list']:
-                    orders_dict[o_id]['products_list'][pos_id] = {
-                        'Название': row['Название'],
-                        'Количество': row['Количество'],
-                        'Цена_продажи': row['Цена_продажи'],
-                        'keys': []
-                    }
-                
-                # Добавляем ключ, если он есть
-                if row['Лицензионный_ключ']:
-                    orders_dict[o_id]['products_list'][pos_id]['keys'].append(row['Лицензионный_ключ'])
-
-            # Превращаем в список для шаблона
-            for o_id in orders_dict:
-                order = orders_dict[o_id]
-                # Превращаем словарь продуктов обратно в список
-                order['products_list'] = list(order['products_list'].values())
-                orders_list.append(order)
-
-        conn.close()
+    conn = get_read_connection()
+    per_page = page_size(request.args.get('per_page'), orders_page_size, max_page_size)
+    orders_page = Page([], per_page)
     
-    # Получаем данные пользователя для шапки
-    user_data = None
-    conn = get_db_connection()
     if conn:
         with conn.cursor() as cursor:
-            cursor.execute("SELECT * FROM Пользователи WHERE ID_Пользователя = %s", (session['user_id'],))
-            user_data = cursor.fetchone()
-        conn.close()
+            # Страница заголовков заказов, затем позиции только этих заказов. Ключи сюда
+            # не входят — они подгружаются при раскрытии позиции (order_keys), поэтому
+            # объем страницы не зависит от числа купленных лицензий
+            orders_page = fetch_keyset(cursor, ORDER_HEADERS_QUERY, (session['user_id'],),
+                                       ['z.Дата_заказа', 'z.ID_Заказа'], ['Дата_заказа', 'ID_Заказа'],
+                                       request.args.get('cursor'), per_page, descending=True, has_where=True)
+            order_ids = [order['ID_Заказа'] for order in orders_page]
+            if order_ids:
+                cursor.execute(order_lines_query(order_ids), order_ids)
+                attach_order_lines(orders_page.items, cursor.fetchall())
+
+    return render_template('orders.html', orders=orders_page)
 
-    return render_template('orders.html', user=user_data, orders=orders_list)
+@routes.route('/orders/keys/<int:position_id>')
+def order_keys(position_id):
+    # Порция ключей позиции заказа в JSON: {"keys": [...], "next_cursor": ...}
+    if 'user_id' not in session:
+        return jsonify({'error': 'Требуется вход'}), 401
 
+    conn = get_read_connection()
+    if not conn:
+        return jsonify({'error': 'База данных недоступна'}), 503
+    per_page = page_size(request.args.get('per_page'), keys_page_size, max_page_size)
+    with conn.cursor() as cursor:
+        page = fetch_keyset(cursor, ORDER_KEYS_QUERY, (position_id, session['user_id']),
+                            ['l.ID_Лицензии'], ['ID_Лицензии'], request.args.get('cursor'), per_page,
+                            has_where=True)
+    return jsonify({
+        'keys': [{
+            'key': row['Лицензионный_ключ'],
+            'activated': row['Дата_активации'].isoformat() if row['Дата_активации'] else None,
+            'expires': row['Дата_истечения'].isoformat() if row['Дата_истечения'] else None,
+        } for row in page],
+        'next_cursor': page.next_cursor,
+    })
 
-@app.route('/admin')
+@routes.route('/orders/keys/<int:position_id>/download')
+def download_order_keys(position_id):
+    # Все ключи позиции текстовым файлом. Читаются порциями по ключу и сразу
+    # отправляются клиенту, поэтому память не зависит от числа ключей
+    if 'user_id' not in session:
+        return redirect(url_for('login'))
+    conn = get_read_connection()
+    if not conn:
+        abort(503)
+    user_id = session['user_id']
+
+    def generate():
+        token = None
+        while True:
+            sql, params, direction = keyset_query(ORDER_KEYS_QUERY, (position_id, user_id), ['l.ID_Лицензии'],
+                                                  token, KEYS_DOWNLOAD_BATCH, has_where=True)
+            with conn.cursor() as cursor:
+                cursor.execute(sql, params)
+                page = keyset_page(cursor.fetchall(), ['ID_Лицензии'], direction, KEYS_DOWNLOAD_BATCH)
+            if page:
+                yield ''.join(row['Лицензионный_ключ'] + '\n' for row in page)
+            if not page.next_cursor:
+                break
+            token = page.next_cursor
+
+    return Response(stream_with_context(generate()), mimetype='text/plain; charset=utf-8',
+                    headers={'Content-Disposition': f'attachment; filename="keys_{position_id}.txt"'})
+
+
+@routes.route('/admin')
 def admin_dashboard():
     # Проверка на права админа (ID_Роли = 1)
     if 'user_id' not in session or session.get('role_id') != 1:
         flash("Доступ запрещен", "error")
         return redirect(url_for('index'))
 
-    conn = get_db_connection()
+    per_page = page_size(request.args.get('per_page'), admin_page_size, max_page_size)
+    conn = get_read_connection()
     stats = {}
-    products = []
-    orders = []
+    products = Page([], per_page)
+    orders = Page([], per_page)
     categories = []
     reports = {}
     if conn:
         with conn.cursor() as cursor:
-            # 1. Считаем статистику
-            cursor.execute("SELECT SUM(Итоговая_сумма) as total FROM Заказы WHERE Статус = 'Оплачен'")
-            stats['revenue'] = cursor.fetchone()['total'] or 0
-            
-            cursor.execute("SELECT COUNT(*) as count FROM Заказы")
-            stats['orders_count'] = cursor.fetchone()['count']
-            
-            cursor.execute("SELECT COUNT(*) as count FROM Товары")
-            stats['products_count'] = cursor.fetchone()['count']
-            
-            cursor.execute("SELECT COUNT(*) as count FROM Пользователи")
-            stats['users_count'] = cursor.fetchone()['count']
+            # 1. Статистика из счетчиков (без COUNT(*) по большим таблицам)
+            stats = rollups.read_stats(cursor)
 
-            # 2. Список товаров с категориями
-            cursor.execute("""
+            # 2. Список товаров с категориями (постранично, по ID)
+            products = fetch_keyset(cursor, """
                 SELECT t.*, k.Название_категории 
                 FROM Товары t 
                 LEFT JOIN Категории k ON t.ID_Категории = k.ID_Категории
                 WHERE t.Статус_активности = 1
-            """)
-            products = cursor.fetchall()
+            """, (), ['t.ID_Товара'], ['ID_Товара'],
+                request.args.get('products_cursor'), per_page, has_where=True)
 
             cursor.execute("SELECT * FROM Категории")
             categories = cursor.fetchall()
 
-            # 3. Список заказов с именами пользователей
-            cursor.execute("""
+            # 3. Список заказов с именами пользователей (постранично, от новых к старым)
+            orders = fetch_keyset(cursor, """
                 SELECT z.*, p.Имя, p.Фамилия 
                 FROM Заказы z 
-                JOIN Пользователи p ON z.ID_Пользователя = p.ID_Пользователя 
-                ORDER BY z.Дата_заказа DESC
-            """)
-            orders = cursor.fetchall()
-            
-            # 1. ТОП-5 популярных товаров
-            cursor.execute("""
-                SELECT t.Название, SUM(sz.Количество) as total_qty
-                FROM Состав_заказа sz
-                JOIN Товары t ON sz.ID_Товара = t.ID_Товара
-                GROUP BY t.ID_Товара
-                ORDER BY total_qty DESC LIMIT 5
-            """)
-            reports['top_products'] = cursor.fetchall()
-
-            # 2. Выручка по категориям
-            cursor.execute("""
-                SELECT k.Название_категории, SUM(sz.Цена_продажи * sz.Количество) as total_revenue
-                FROM Состав_заказа sz
-                JOIN Товары t ON sz.ID_Товара = t.ID_Товара
-                JOIN Категории k ON t.ID_Категории = k.ID_Категории
-                GROUP BY k.ID_Категории
-                ORDER BY total_revenue DESC
-            """)
-            reports['category_revenue'] = cursor.fetchall()
-
-            # 3. Активность продаж по дням (последние 14)
-            cursor.execute("""
-                SELECT DATE(Дата_заказа) as day, COUNT(ID_Заказа) as order_count, SUM(Итоговая_сумма) as daily_sum
-                FROM Заказы
-                WHERE Статус = 'Оплачен'
-                GROUP BY day
-                ORDER BY day DESC LIMIT 14
-            """)
-            reports['daily_sales'] = cursor.fetchall()
-
-            # 4. ТОП-5 Покупателей (Самые ценные клиенты)
-            cursor.execute("""
-                SELECT p.Имя, p.Фамилия, p.Логин, SUM(z.Итоговая_сумма) as total_spent
-                FROM Заказы z
                 JOIN Пользователи p ON z.ID_Пользователя = p.ID_Пользователя
-                WHERE z.Статус = 'Оплачен'
-                GROUP BY p.ID_Пользователя
-                ORDER BY total_spent DESC LIMIT 5
-            """)
-            reports['vip_customers'] = cursor.fetchall()
+            """, (), ['z.Дата_заказа', 'z.ID_Заказа'], ['Дата_заказа', 'ID_Заказа'],
+                request.args.get('orders_cursor'), per_page, descending=True)
             
-        conn.close()
+            # 4. Отчеты из сводных таблиц (обновляются при оформлении заказа)
+            reports = rollups.read_reports(cursor)
+
+            # 5. Товары, у которых на складе заканчиваются ключи
+            reports['low_stock'] = keystore.low_stock(cursor, key_low_stock_threshold)
     
     return render_template('admin.html', stats=stats, products=products, orders=orders, reports=reports, categories=categories)
 
+def connect_for_export():
+    # Отдельное соединение с небуферизованным курсором для выгрузки (см. exports.py),
+    # по возможности с реплики — тяжелое чтение не мешает оформлению заказов
+    conn = None
+    if read_router and not is_sticky(session, read_your_writes_seconds):
+        conn = read_router.connect(cursorclass=db.cursors.SSDictCursor)
+    if conn is None:
+        conn = db.connect(host=host, port=port, user=user, password=password, database=db_name,
+                          cursorclass=db.cursors.SSDictCursor, autocommit=True)
+    with conn.cursor(db.cursors.Cursor) as cursor:
+        cursor.execute("SET SESSION net_write_timeout = %s", (export_net_write_timeout,))
+    return conn
+
+# Выгрузка заказов, позиций или лицензий в CSV / JSON Lines с фильтрами по дате, статусу и категории
+@routes.route('/admin/export/<kind>')
+def admin_export(kind):
+    if 'user_id' not in session or session.get('role_id') != 1:
+        return redirect(url_for('login'))
+    fmt = request.args.get('format', 'csv')
+    if kind not in exports.EXPORT_QUERIES or fmt not in exports.FORMATS:
+        abort(404)
+    try:
+        filters = exports.parse_filters(request.args)
+    except exports.ExportError as ex:
+        flash(f"Ошибка выгрузки: {ex}", "error")
+        return redirect(url_for('admin_dashboard', tab='orders'))
+
+    # Соединение открывается до ответа: если БД недоступна, админ увидит ошибку, а не пустой файл
+    try:
+        conn = connect_for_export()
+    except Exception as ex:
+        print("Ошибка подключения:", ex)
+        flash("Ошибка выгрузки: база данных недоступна", "error")
+        return redirect(url_for('admin_dashboard', tab='orders'))
+
+    body = exports.stream(conn, kind, fmt, filters, export_batch_size)
+    return Response(stream_with_context(body), content_type=exports.FORMATS[fmt], headers={
+        'Content-Disposition': f'attachment; filename="{exports.file_name(kind, fmt, filters)}"',
+        'Cache-Control': 'no-store',
+        # Не буферизовать ответ в nginx — клиент получает данные по мере чтения из БД
+        'X-Accel-Buffering': 'no',
+    })
+
+# Загрузка ключей на склад из файла (по одному ключу в строке)
+@routes.route('/admin/keys/upload', methods=['POST'])
+def upload_keys():
+    if 'user_id' not in session or session.get('role_id') != 1:
+        return redirect(url_for('login'))
+
+    product_id = request.form.get('product_id', type=int)
+    file = request.files.get('keys')
+    if not product_id or not file or file.filename == '':
+        flash("Выберите товар и файл с ключами", "error")
+        return redirect(url_for('admin_dashboard', tab='products'))
+
+    conn = get_db_connection()
+    if conn:
+        try:
+            # Файл читается построчно из потока загрузки, без чтения целиком в память
+            lines = io.TextIOWrapper(file.stream, encoding='utf-8', errors='replace')
+            loaded, skipped = keystore.load_keys(conn, product_id, lines, key_load_batch_size)
+            flash(f"Загружено ключей: {loaded}, пропущено (дубликаты и ошибки): {skipped}", "success")
+        except Exception as ex:
+            print("Ошибка загрузки ключей:", ex)
+            flash("Не удалось загрузить ключи", "error")
+    return redirect(url_for('admin_dashboard', tab='products'))
+
+# Массовый импорт товаров из CSV / JSON Lines с архивом изображений (см. catalog_import.py)
+@routes.route('/admin/import', methods=['POST'])
+def admin_import():
+    if 'user_id' not in session or session.get('role_id') != 1:
+        return redirect(url_for('login'))
+
+    # Файл каталога с архивом изображений больше обычного лимита загрузки
+    request.max_content_length = import_max_upload_mb * 1024 * 1024
+    file = request.files.get('products')
+    archive_file = request.files.get('images')
+    fmt = catalog_import.file_format(file.filename) if file and file.filename else None
+    if fmt is None:
+        flash("Выберите файл товаров .csv или .jsonl", "error")
+        return redirect(url_for('admin_dashboard', tab='products'))
+
+    conn = get_db_connection()
+    if conn:
+        report = catalog_import.ImportReport()
+        try:
+            archive = None
+            if archive_file and archive_file.filename:
+                archive = catalog_import.open_archive(archive_file.stream)
+            rows = catalog_import.read_rows(catalog_import.text_stream(file.stream), fmt)
+            catalog_import.import_products(conn, rows, report, image_pipeline, archive, import_batch_size)
+        except catalog_import.ImportFileError as ex:
+            flash(f"Ошибка импорта: {ex}", "error")
+        except Exception as ex:
+            print("Ошибка импорта товаров:", ex)
+            flash("Импорт прерван из-за ошибки базы данных", "error")
+        finally:
+            # Каталог перечитывается один раз на весь импорт (в том числе прерванный)
+            if report.created or report.updated:
+                catalog_cache.bump(conn)
+                mark_written(session)
+        if report.rows:
+            flash(report.summary(), "error" if report.failed else "success")
+            for line, message in report.errors[:import_errors_shown]:
+                flash(f"Строка {line}: {message[:200]}", "error")
+    return redirect(url_for('admin_dashboard', tab='products'))
+
 # Маршрут для удаления товара
-@app.route('/admin/delete_product/<int:product_id>')
+@routes.route('/admin/delete_product/<int:product_id>')
 def delete_product(product_id):
     if 'user_id' not in session or session.get('role_id') != 1:
         return redirect(url_for('login'))
@@ -679,13 +1159,14 @@ def delete_product(product_id):
     if conn:
         with conn.cursor() as cursor:
             # Проверяем, нет ли товара в заказах, чтобы не нарушить целостность (опционально)
-            cursor.execute("UPDATE Товары SET Статус_активности = 0 WHERE ID_Товара = %s", (product_id,))
-        conn.close()
+            cursor.execute("UPDATE Товары SET Статус_активности = 0, Версия = Версия + 1 WHERE ID_Товара = %s", (product_id,))
+        catalog_cache.bump(conn)
+        mark_written(session)
         flash("Товар успешно удален", "success")
     return redirect(url_for('admin_dashboard'))
 
 # Маршрут для редактирования товара
-@app.route('/admin/edit_product', methods=['POST'])
+@routes.route('/admin/edit_product', methods=['POST'])
 def edit_product():
     if 'user_id' not in session or session.get('role_id') != 1:
         return redirect(url_for('login'))
@@ -709,26 +1190,24 @@ def edit_product():
 
     # Получаем файл изображения
     file = request.files.get('image')
-    print(f"DEBUG: Получен файл: {file}")
-    if file:
-        print(f"DEBUG: Имя файла: {file.filename}")
 
     filename_to_save = None
 
     # Если файл был загружен и у него разрешенное расширение
     if file and file.filename != '' and allowed_file(file.filename):
-        # Безопасное имя файла (защита от хакеров)
-        filename = secure_filename(file.filename)
-        # Генерируем уникальное имя, чтобы не затереть старые (добавляем ID товара)
-        filename_to_save = f"product_{p_id}_{filename}"
-        # Сохраняем файл на диск
-        file.save(os.path.join(app.config['UPLOAD_FOLDER'], filename_to_save))
+        # Имя файла — хэш содержимого: одинаковые картинки хранятся один раз,
+        # уменьшенные копии создаются в фоне
+        try:
+            filename_to_save = image_pipeline.save(file)
+        except ImageTooLarge:
+            flash(f"Файл слишком большой (не более {image_max_upload_mb} МБ)", "error")
+            return redirect(url_for('admin_dashboard'))
 
     conn = get_db_connection()
     if conn:
         with conn.cursor() as cursor:
             # Формируем SQL запрос динамически
-            sql = "UPDATE Товары SET Название = %s, Цена = %s, ID_Категории = %s, Описание = %s"
+            sql = "UPDATE Товары SET Название = %s, Цена = %s, ID_Категории = %s, Описание = %s, Версия = Версия + 1"
             params = [name, price, cat_id, desc]
 
             # Если было загружено НОВОЕ изображение, добавляем его в запрос
@@ -741,13 +1220,13 @@ def edit_product():
             params.append(p_id)
 
             cursor.execute(sql, tuple(params))
-        conn.close()
+        catalog_cache.bump(conn)
         flash("Данные товара обновлены", "success")
 
     return redirect(url_for('admin_dashboard'))
 
 # --- ДОБАВЛЕНИЕ ТОВАРА (АДМИН) ---
-@app.route('/add_product', methods=['POST'])
+@routes.route('/add_product', methods=['POST'])
 def add_product():
     if 'role_id' not in session or session['role_id'] != 1:
         return redirect(url_for('login'))
@@ -769,13 +1248,14 @@ def add_product():
     
     # Обработка изображения
     file = request.files.get('image')
-    filename_to_save = "default.jpg"
+    filename_to_save = DEFAULT_IMAGE
 
     if file and file.filename != '' and allowed_file(file.filename):
-        filename = secure_filename(file.filename)
-        # Генерируем уникальное имя
-        filename_to_save = f"new_{uuid.uuid4().hex}_{filename}"
-        file.save(os.path.join(app.config['UPLOAD_FOLDER'], filename_to_save))
+        try:
+            filename_to_save = image_pipeline.save(file)
+        except ImageTooLarge:
+            flash(f"Файл слишком большой (не более {image_max_upload_mb} МБ)", "error")
+            return redirect(url_for('admin_dashboard'))
 
 
     conn = get_db_connection()
@@ -783,10 +1263,81 @@ def add_product():
         with conn.cursor() as cursor:
             sql = "INSERT INTO Товары (Название, Цена, ID_Категории, Описание, Изображение) VALUES (%s, %s, %s, %s, %s)"
             cursor.execute(sql, (name, price, cat_id, desc, filename_to_save))
-        conn.close()
+        catalog_cache.bump(conn)
         flash("Товар успешно добавлен!", "success")
     
     return redirect(url_for('admin_dashboard'))
 
+# --- Создание приложения ---
+
+def warm_up(app):
+    # Загрузка каталога (с категориями, поисковым индексом и фильтрами) и компиляция всех
+    # шаблонов до приема запросов. Соединение после загрузки закрывается, а не возвращается
+    # в пул: прогрев может идти в мастер-процессе, который затем сделает fork().
+    # pool_min_size соединений каждый процесс откроет при первой выдаче (ConnectionPool.fill)
+    conn = None
+    catalog = None
+    try:
+        conn = db_pool.acquire()
+        catalog = catalog_cache.get(lambda: conn)
+    except Exception as ex:
+        print("Ошибка прогрева каталога:", ex)
+    finally:
+        if conn is not None:
+            db_pool.release(conn, discard=True)
+    startup_timer.mark('catalog')
+    for name in app.jinja_env.list_templates():
+        app.jinja_env.get_template(name)
+    startup_timer.mark('templates')
+    startup_timer.ready = catalog is not None
+    print(startup_timer.report())
+    return startup_timer.ready
+
+def create_app(config=None):
+    # Приложение Flask с маршрутами из этого модуля. config — словарь или объект с настройками
+    # Flask поверх значений из config.py (SECRET_KEY, MAX_CONTENT_LENGTH, WARM_UP, ...).
+    # Соединения с БД и фоновые потоки создаются при первом обращении в каждом процессе
+    if 'import' not in startup_timer.phases:
+        startup_timer.mark('import')
+    app = Flask(__name__)
+    app.config.update(
+        SECRET_KEY=secret_key,
+        UPLOAD_FOLDER=UPLOAD_FOLDER,
+        # Запрос с файлом больше лимита отклоняется, не дочитываясь до конца (плюс запас на поля формы)
+        MAX_CONTENT_LENGTH=(image_max_upload_mb + 1) * 1024 * 1024,
+        WARM_UP=warm_up_on_start,
+    )
+    if isinstance(config, dict):
+        app.config.update(config)
+    elif config is not None:
+        app.config.from_object(config)
+    routes.register(app)
+    app.view_functions['static'] = serve_static
+    fragments.setup(app.jinja_env, fragment_cache, TEMPLATE_BYTECODE_DIR)
+    startup_timer.mark('create_app')
+    if app.config['WARM_UP']:
+        warm_up(app)
+    return app
+
+_default_app = None
+
+def get_app():
+    # Приложение по умолчанию (одно на процесс) — для python app.py, async_app и app:app
+    global _default_app
+    if _default_app is None:
+        _default_app = create_app()
+    return _default_app
+
+def __getattr__(name):
+    # app.app — как до появления create_app(): gunicorn app:app, импорт из других модулей
+    if name == 'app':
+        return get_app()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 if __name__ == '__main__':
-    app.run(debug=True)
+    import sys
+    if '--async' in sys.argv:
+        # Асинхронный режим (Quart + aiomysql), см. async_app.py
+        import async_app
+        sys.exit(async_app.main([sys.argv[0]]))
+    get_app().run(debug=True)
@@ -0,0 +1,177 @@
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+import shutil
+import sys
+
+from flask import send_from_directory
+
+try:
+    import brotli
+except ImportError:  # без пакета brotli создаются только gzip-версии
+    brotli = None
+
+# Статические файлы с отпечатком содержимого в имени. Сборка (python assets.py build)
+# копирует файлы из static в static/dist под именами вида style.<хэш>.css, рядом кладет
+# сжатые версии .br и .gz и пишет манифест. url_for('static', ...) в шаблонах по манифесту
+# подставляет имя с хэшем, а такие файлы отдаются с Cache-Control: immutable на год и
+# в сжатом виде, если браузер его принимает. Файлы без отпечатка отдаются как раньше.
+#
+# Запуск из командной строки (после каждого изменения статических файлов):
+#   python assets.py build
+#   python assets.py clean    — удалить собранные файлы
+
+# Папка собранных файлов внутри static и имя манифеста в ней
+DIST_DIR = 'dist'
+MANIFEST_NAME = 'manifest.json'
+# Не собираются: уменьшенные копии изображений создаются во время работы (см. images.py)
+SKIP_DIRS = {DIST_DIR, os.path.join('images', 'variants')}
+# Типы файлов, которые имеет смысл сжимать (картинки уже сжаты)
+COMPRESSIBLE = {'.css', '.js', '.json', '.svg', '.txt', '.html', '.xml', '.map', '.ico', '.ttf', '.otf', '.eot'}
+# Файлы меньше этого размера не сжимаются: выигрыш меньше заголовков
+MIN_COMPRESS_SIZE = 512
+# Срок кэширования файлов, имя которых меняется вместе с содержимым
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+# Сжатые версии в порядке предпочтения
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+HASH_LENGTH = 12
+# Изображения товаров уже называются по хэшу содержимого (images.py) — их не копируем
+CONTENT_HASH_RE = re.compile(r'(^|/)[0-9a-f]{32}(_\d+)?\.\w+$')
+
+
+def _digest(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(64 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _compress(path, data):
+    # Пишет .br и .gz, если они заметно меньше оригинала. Возвращает список кодировок
+    encodings = []
+    variants = {'gzip': lambda: gzip.compress(data, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variants['br'] = lambda: brotli.compress(data, quality=11)
+    for encoding, suffix in ENCODINGS:
+        if encoding not in variants:
+            continue
+        compressed = variants[encoding]()
+        if len(compressed) < len(data) * 0.9:
+            with open(path + suffix, 'wb') as f:
+                f.write(compressed)
+            encodings.append(encoding)
+    return encodings
+
+
+def build(static_folder):
+    # Собирает static/dist и манифест. Старые версии файлов не удаляются: их еще могут
+    # запрашивать страницы, закэшированные браузерами до выкладки
+    dist = os.path.join(static_folder, DIST_DIR)
+    assets = {}
+    encodings = {}
+    for root, dirs, files in os.walk(static_folder):
+        relative_root = os.path.relpath(root, static_folder)
+        dirs[:] = sorted(d for d in dirs
+                         if os.path.normpath(os.path.join(relative_root, d)) not in SKIP_DIRS)
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            logical = os.path.normpath(os.path.join(relative_root, name)).replace(os.sep, '/')
+            if name.startswith('.') or name.endswith(('.upload', '.tmp')) or CONTENT_HASH_RE.search(logical):
+                continue
+            stem, extension = os.path.splitext(logical)
+            hashed = f"{DIST_DIR}/{stem}.{_digest(path)[:HASH_LENGTH]}{extension}"
+            target = os.path.join(static_folder, hashed)
+            if not os.path.exists(target):
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                shutil.copyfile(path, target)
+            assets[logical] = hashed
+            if extension.lower() in COMPRESSIBLE and os.path.getsize(path) >= MIN_COMPRESS_SIZE:
+                with open(target, 'rb') as f:
+                    found = _compress(target, f.read())
+                if found:
+                    encodings[hashed] = found
+
+    os.makedirs(dist, exist_ok=True)
+    manifest_path = os.path.join(dist, MANIFEST_NAME)
+    with open(manifest_path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump({'assets': assets, 'encodings': encodings}, f, ensure_ascii=False, indent=1, sort_keys=True)
+    os.replace(manifest_path + '.tmp', manifest_path)
+    return assets, encodings
+
+
+class Manifest:
+    """Соответствие имен статических файлов собранным версиям с отпечатком."""
+
+    def __init__(self, static_folder):
+        self.static_folder = static_folder
+        self.assets = {}
+        self.encodings = {}
+        self.load()
+
+    def load(self):
+        # Без сборки манифеста нет — все файлы отдаются под исходными именами
+        path = os.path.join(self.static_folder, DIST_DIR, MANIFEST_NAME)
+        try:
+            with open(path, encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as ex:
+            print("Ошибка чтения манифеста статических файлов:", ex)
+            return
+        self.assets = data.get('assets', {})
+        self.encodings = {name: tuple(found) for name, found in data.get('encodings', {}).items()}
+
+    def url_path(self, filename):
+        return self.assets.get(filename, filename)
+
+    def is_immutable(self, filename):
+        return filename.startswith(DIST_DIR + '/') or CONTENT_HASH_RE.search(filename) is not None
+
+
+def send_asset(manifest, filename, accept_encodings):
+    # Отдает статический файл: сжатую версию, если она есть и браузер ее принимает,
+    # и заголовки вечного кэширования для файлов с хэшем в имени
+    immutable = manifest.is_immutable(filename)
+    available = manifest.encodings.get(filename, ())
+    served, encoding = filename, None
+    for name, suffix in ENCODINGS:
+        if name in available and accept_encodings[name]:
+            served, encoding = filename + suffix, name
+            break
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    response = send_from_directory(manifest.static_folder, served, mimetype=mimetype,
+                                   max_age=IMMUTABLE_MAX_AGE if immutable else None)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    if available:
+        response.vary.add('Accept-Encoding')
+    if immutable:
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+    return response
+
+
+def main(argv):
+    static_folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+    command = argv[1] if len(argv) > 1 else 'build'
+    if command == 'build':
+        if brotli is None:
+            print("Пакет brotli не установлен — будут созданы только gzip-версии (pip install brotli)")
+        assets, encodings = build(static_folder)
+        print(f"Собрано файлов: {len(assets)}, сжатых: {len(encodings)}")
+        return 0
+    if command == 'clean':
+        shutil.rmtree(os.path.join(static_folder, DIST_DIR), ignore_errors=True)
+        return 0
+    print("Использование: python assets.py [build|clean]")
+    return 2
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,470 @@
+import asyncio
+import sys
+import time
+import uuid
+
+# Асинхронный режим: витрина, карточка товара, корзина, оформление заказа, история заказов
+# и админ-панель обслуживаются асинхронными обработчиками Quart поверх пула aiomysql,
+# поэтому ожидание БД не занимает поток. Остальные маршруты (вход, регистрация, формы
+# админки и т.д.) передаются синхронному Flask-приложению из app.py. Шаблоны, сессия
+# (тот же secret_key и формат cookie) и кэш каталога общие.
+#
+# Запуск:
+#   python app.py --async                   — встроенный сервер Hypercorn
+#   hypercorn async_app:asgi --workers 4    — боевой запуск
+# Нужны дополнительные пакеты: pip install quart aiomysql
+
+try:
+    import aiomysql
+    from hypercorn.middleware import AsyncioWSGIMiddleware
+    from quart import Quart, Response, render_template, session, request, redirect, url_for, flash
+except ImportError:  # асинхронный режим необязателен
+    aiomysql = None
+
+from werkzeug.exceptions import HTTPException
+from werkzeug.routing import Rule
+
+import app as sync_app
+import cart_store
+import db_router
+import fragments
+import fulfilment
+import http_cache
+import keystore
+import metrics
+import rollups
+from catalog import PRODUCT_QUERY, product_from_row
+from config import host, user, password, port, db_name
+from config import pool_min_size, pool_max_size, pool_recycle
+from config import catalog_page_size, admin_page_size, max_page_size, orders_page_size
+from config import key_low_stock_threshold, slow_request_threshold, read_your_writes_seconds
+from pagination import Page, page_args, page_size, paginate_list, keyset_query, keyset_page
+
+# Маршруты, которые обслуживаются асинхронно (имена как в app.py)
+ASYNC_ENDPOINTS = {'index', 'product_detail', 'cart', 'checkout', 'orders', 'admin_dashboard'}
+
+# Шаблоны асинхронных маршрутов (компилируются при запуске сервера)
+ASYNC_TEMPLATES = ('index.html', 'product_detail.html', 'cart.html', 'orders.html', 'admin.html')
+
+
+def available():
+    return aiomysql is not None
+
+
+if aiomysql is not None:
+
+    class InstrumentedCursor(aiomysql.DictCursor):
+        # Асинхронный аналог metrics.InstrumentedCursor: время запросов идет в статистику HTTP-запроса
+        async def execute(self, query, args=None):
+            started = time.perf_counter()
+            try:
+                return await super().execute(query, args)
+            finally:
+                metrics.record_query(query, time.perf_counter() - started)
+
+    # Flask-приложение (create_app() с настройками по умолчанию) обслуживает остальные маршруты
+    flask_app = sync_app.get_app()
+
+    qapp = Quart(__name__, template_folder=flask_app.template_folder,
+                 static_folder=flask_app.static_folder)
+    qapp.secret_key = flask_app.secret_key
+
+    # Ссылки на маршруты Flask-приложения нужны шаблонам (url_for('login') и т.п.),
+    # поэтому добавляем их в карту URL только для построения ссылок
+    for rule in flask_app.url_map.iter_rules():
+        if rule.endpoint not in ASYNC_ENDPOINTS and rule.endpoint != 'static':
+            qapp.url_map.add(Rule(rule.rule, endpoint=rule.endpoint, methods=rule.methods, build_only=True))
+
+    # Ссылки на статические файлы с хэшем — как в app.py (сами файлы отдает Flask)
+    qapp.url_defaults(sync_app.hashed_static_url)
+
+    # Тег {% cache %} с общим для обоих приложений кэшем фрагментов и байт-код шаблонов
+    fragments.setup(qapp.jinja_env, sync_app.fragment_cache, sync_app.TEMPLATE_BYTECODE_DIR)
+
+    @qapp.template_global()
+    def page_url(**updates):
+        return url_for(request.endpoint, **(request.view_args or {}), **page_args(request.args, updates))
+
+    def _image_file_url(name):
+        return url_for('static', filename='images/' + name)
+
+    @qapp.template_global()
+    def image_srcset(name, fmt='jpg'):
+        return sync_app.image_pipeline.srcset(name, fmt, _image_file_url)
+
+    @qapp.template_global()
+    def image_url(name, size='card'):
+        return sync_app.image_pipeline.url(name, size, _image_file_url)
+
+    # --- Пул соединений ---
+
+    @qapp.before_serving
+    async def create_pool():
+        qapp.db_pool = await aiomysql.create_pool(
+            host=host, port=port, user=user, password=password, db=db_name,
+            minsize=pool_min_size, maxsize=pool_max_size, pool_recycle=pool_recycle,
+            charset='utf8mb4', autocommit=True, cursorclass=InstrumentedCursor)
+        # Обработчики очереди выдачи ключей — как при первом запросе к Flask-приложению
+        sync_app.fulfilment_queue.start()
+        # Пулы реплик для чтения; состояние реплик (отставание, ошибки) общее с app.read_router
+        qapp.replica_pools = {}
+        for replica in sync_app.read_router.replicas:
+            settings = replica.settings
+            qapp.replica_pools[replica.name] = await aiomysql.create_pool(
+                host=settings['host'], port=settings['port'], user=settings['user'],
+                password=settings['password'], db=settings['database'], init_command=settings['init_command'],
+                minsize=0, maxsize=pool_max_size, pool_recycle=pool_recycle,
+                charset='utf8mb4', autocommit=True, cursorclass=InstrumentedCursor)
+        # Асинхронные шаблоны компилируются отдельно от шаблонов Flask — тоже до первых запросов
+        if flask_app.config['WARM_UP']:
+            for name in ASYNC_TEMPLATES:
+                qapp.jinja_env.get_template(name)
+            sync_app.startup_timer.mark('async_templates')
+
+    @qapp.after_serving
+    async def close_pool():
+        for pool in [qapp.db_pool, *qapp.replica_pools.values()]:
+            pool.close()
+            await pool.wait_closed()
+
+    async def _replica_lag(pool, standalone=False):
+        async with pool.acquire() as conn:
+            async with conn.cursor() as cursor:
+                for query in db_router.LAG_QUERIES:
+                    try:
+                        await cursor.execute(query)
+                    except aiomysql.MySQLError:
+                        continue
+                    return db_router.lag_from_row(await cursor.fetchone(), standalone)
+        return None
+
+    def _use_replicas():
+        return bool(qapp.replica_pools) and not db_router.is_sticky(session, read_your_writes_seconds)
+
+    async def read_pool():
+        # Пул подходящей реплики для запросов на чтение (как app.get_read_connection)
+        # или None — читать с основного сервера
+        if not _use_replicas():
+            return None
+        replicas = sync_app.read_router.replicas
+        for replica in replicas.candidates():
+            pool = qapp.replica_pools[replica.name]
+            if replicas.needs_check(replica):
+                try:
+                    usable = replicas.record_lag(replica, await _replica_lag(pool, replica.standalone))
+                except Exception as ex:
+                    replicas.mark_failed(replica, ex)
+                    continue
+                if not usable:
+                    continue
+            replicas.mark_read(replica)
+            return pool
+        replicas.fallbacks += 1
+        return None
+
+    async def fetch(sql, params=(), one=False, pool=None):
+        # Отдельный запрос на своем соединении — так независимые запросы идут параллельно.
+        # pool — пул реплики из read_pool(); если реплика не ответила, читаем с основного сервера
+        try:
+            async with (pool or qapp.db_pool).acquire() as conn:
+                async with conn.cursor() as cursor:
+                    await cursor.execute(sql, params)
+                    return await (cursor.fetchone() if one else cursor.fetchall())
+        except (aiomysql.OperationalError, OSError) as ex:
+            if pool is None:
+                raise
+            print("Ошибка чтения с реплики:", ex)
+            for replica in sync_app.read_router.replicas:
+                if qapp.replica_pools.get(replica.name) is pool:
+                    sync_app.read_router.replicas.mark_failed(replica, ex)
+            return await fetch(sql, params, one)
+
+    async def run_statements(cursor, statements):
+        # Как fulfilment.run_statements, но на курсоре aiomysql
+        result = None
+        while True:
+            try:
+                sql, params, mode = statements.send(result)
+            except StopIteration as stop:
+                return stop.value
+            if mode == fulfilment.MANY:
+                result = await cursor.executemany(sql, params)
+                continue
+            await cursor.execute(sql, params)
+            if mode == fulfilment.FETCH_ONE:
+                result = await cursor.fetchone()
+            elif mode == fulfilment.FETCH_ALL:
+                result = await cursor.fetchall()
+            elif mode == fulfilment.INSERT:
+                result = cursor.lastrowid
+            else:
+                result = None
+
+    def _refresh_catalog(use_replicas):
+        # Сверка версии и перезагрузка каталога (с перестройкой поискового индекса) —
+        # редкая и тяжелая для процессора операция, поэтому выполняется в потоке
+        # через синхронный пул, чтобы не останавливать цикл событий
+        conns = []
+
+        def primary():
+            try:
+                conns.append((sync_app.db_pool.acquire(), sync_app.db_pool))
+                return conns[-1][0]
+            except Exception as ex:
+                print("Ошибка подключения:", ex)
+                return None
+
+        def connect():
+            conn = sync_app.read_router.acquire() if use_replicas else None
+            if conn is not None:
+                conns.append((conn, sync_app.read_router))
+                return conn
+            return primary()
+
+        try:
+            return sync_app.catalog_cache.get(connect, primary)
+        finally:
+            for conn, owner in conns:
+                owner.release(conn)
+
+    async def get_catalog():
+        catalog = sync_app.catalog_cache.get_fresh()
+        if catalog is None:
+            catalog = await asyncio.to_thread(_refresh_catalog, _use_replicas())
+        return catalog
+
+    async def cached_page(version, last_modified, render):
+        # Как app.cached_page (и через те же функции): 304 или страница из общего кэша процесса
+        etag, key, body = sync_app.page_lookup(request, version, last_modified)
+        if key is None:
+            return sync_app.page_response(Response('', status=304), etag, last_modified)
+        if body is None:
+            body = (await render()).encode('utf-8')
+            sync_app.page_cache.put(key, etag, body)
+        return sync_app.page_response(Response(body, mimetype='text/html'), etag, last_modified)
+
+    # --- Метрики ---
+
+    @qapp.before_request
+    async def start_request_metrics():
+        metrics.start_request()
+
+    @qapp.after_request
+    async def record_request_metrics(response):
+        stats = metrics.finish_request()
+        if stats is not None:
+            metrics.observe_request(stats, request.method, request.path, request.endpoint,
+                                    response.status_code, slow_request_threshold)
+        return response
+
+    # --- Маршруты ---
+
+    @qapp.route('/index')
+    @qapp.route('/')
+    async def index():
+        per_page = page_size(request.args.get('per_page'), catalog_page_size, max_page_size)
+        catalog = await get_catalog()
+
+        async def render():
+            categories = []
+            products = Page([], per_page)
+            total = 0
+            facets = None
+            if catalog:
+                categories = catalog.categories
+                filters = (request.args.get('category'), request.args.get('search'))
+                prices = (request.args.get('price_min'), request.args.get('price_max'))
+                items, sort_key = catalog.query(*filters, request.args.get('sort_price'),
+                                                request.args.get('sort_date'), *prices)
+                total = len(items)
+                products = paginate_list(items, sort_key, request.args.get('cursor'), per_page)
+                facets = catalog.facets(*filters, *prices)
+            return await render_template('index.html', products=products, categories=categories, total=total,
+                                         facets=facets, catalog_version=catalog.version if catalog else None)
+
+        if catalog and http_cache.cacheable(request, session):
+            return await cached_page(f"c{catalog.version}", catalog.changed_at, render)
+        return await render()
+
+    @qapp.route('/product/<int:product_id>')
+    async def product_detail(product_id):
+        product = None
+        catalog = await get_catalog()
+        if catalog:
+            product = catalog.by_id.get(product_id)
+
+        from_catalog = product is not None
+        # Неактивных товаров в кэше нет — их по прямой ссылке читаем из БД
+        if not product:
+            product = product_from_row(await fetch(PRODUCT_QUERY, (product_id,), one=True, pool=await read_pool()))
+
+        if not product:
+            await flash("Товар не найден", "error")
+            return redirect(url_for('index'))
+
+        async def render():
+            return await render_template('product_detail.html', product=product)
+
+        if from_catalog and http_cache.cacheable(request, session):
+            return await cached_page(f"p{product_id}-{product['Версия']}", product['Метка_изменения'], render)
+        return await render()
+
+    @qapp.route('/cart')
+    async def cart():
+        if 'user_id' not in session:
+            await flash("Войдите, чтобы пользоваться корзиной", "error")
+            return redirect(url_for('login'))
+
+        # Как в app.cart: корзина из хранилища, цены из кэша каталога
+        user_id = session['user_id']
+        items = sync_app.cart_store.cached(user_id)
+        if items is None:
+            items = sync_app.cart_store.load(user_id, await fetch(cart_store.LOAD_QUERY, (user_id,)))
+        catalog = await get_catalog()
+        products = catalog.by_id if catalog else {}
+        missing = [product_id for product_id in items if product_id not in products]
+        if missing:
+            rows = await fetch(cart_store.products_query(missing), missing)
+            products = dict(products)
+            products.update((row['ID_Товара'], row) for row in rows)
+        items, total_price = cart_store.build_lines(items, products)
+        return await render_template('cart.html', items=items, total_price=total_price,
+                                     idempotency_key=uuid.uuid4().hex)
+
+    @qapp.route('/checkout', methods=['POST'])
+    async def checkout():
+        if 'user_id' not in session:
+            return redirect(url_for('login'))
+        user_id = session['user_id']
+
+        # Несохраненные изменения корзины записываем в БД (синхронный пул, в потоке)
+        try:
+            await asyncio.to_thread(sync_app.cart_store.flush, None, [user_id])
+        except Exception as ex:
+            print("Ошибка записи корзины:", ex)
+            await flash("Ошибка при создании заказа", "error")
+            return redirect(url_for('cart'))
+
+        # Та же транзакция, что и fulfilment.place_order, только без блокировки потока
+        form = await request.form
+        statements = fulfilment.place_order_statements(user_id, form.get('idempotency_key'), sync_app.LICENSE_DAYS)
+        async with qapp.db_pool.acquire() as conn:
+            try:
+                await conn.begin()
+                async with conn.cursor() as cursor:
+                    order_id, created = await run_statements(cursor, statements)
+                if not created:
+                    await conn.rollback()
+                    if order_id is None:
+                        await flash("Корзина пуста", "error")
+                        return redirect(url_for('cart'))
+                    sync_app.cart_store.clear(user_id)
+                    await flash(f"Заказ #{order_id} уже оформлен", "success")
+                    return redirect(url_for('orders'))
+                await conn.commit()
+                db_router.mark_written(session)
+                sync_app.cart_store.clear(user_id)
+                sync_app.fulfilment_queue.notify()
+                await flash(f"Заказ #{order_id} принят! Ключи появятся через несколько секунд.", "success")
+            except Exception as ex:
+                await conn.rollback()
+                print("Ошибка оформления:", ex)
+                await flash("Ошибка при создании заказа", "error")
+        return redirect(url_for('orders'))
+
+    @qapp.route('/orders')
+    async def orders():
+        if 'user_id' not in session:
+            return redirect(url_for('login'))
+
+        # Страница заголовков заказов и позиции только этих заказов; ключи подгружаются
+        # при раскрытии позиции (маршрут order_keys синхронного приложения)
+        per_page = page_size(request.args.get('per_page'), orders_page_size, max_page_size)
+        sql, params, direction = keyset_query(sync_app.ORDER_HEADERS_QUERY, (session['user_id'],),
+                                              ['z.Дата_заказа', 'z.ID_Заказа'], request.args.get('cursor'),
+                                              per_page, descending=True, has_where=True)
+        pool = await read_pool()
+        orders_page = keyset_page(await fetch(sql, params, pool=pool), ['Дата_заказа', 'ID_Заказа'], direction, per_page)
+        order_ids = [order['ID_Заказа'] for order in orders_page]
+        if order_ids:
+            sync_app.attach_order_lines(orders_page.items,
+                                        await fetch(sync_app.order_lines_query(order_ids), order_ids, pool=pool))
+
+        return await render_template('orders.html', orders=orders_page)
+
+    @qapp.route('/admin')
+    async def admin_dashboard():
+        if 'user_id' not in session or session.get('role_id') != 1:
+            await flash("Доступ запрещен", "error")
+            return redirect(url_for('index'))
+
+        per_page = page_size(request.args.get('per_page'), admin_page_size, max_page_size)
+        products_sql, products_params, products_direction = keyset_query("""
+            SELECT t.*, k.Название_категории
+            FROM Товары t
+            LEFT JOIN Категории k ON t.ID_Категории = k.ID_Категории
+            WHERE t.Статус_активности = 1
+        """, (), ['t.ID_Товара'], request.args.get('products_cursor'), per_page, has_where=True)
+        orders_sql, orders_params, orders_direction = keyset_query("""
+            SELECT z.*, p.Имя, p.Фамилия
+            FROM Заказы z
+            JOIN Пользователи p ON z.ID_Пользователя = p.ID_Пользователя
+        """, (), ['z.Дата_заказа', 'z.ID_Заказа'], request.args.get('orders_cursor'), per_page, descending=True)
+
+        # Все запросы панели независимы — выполняем их одновременно на разных соединениях
+        report_names = list(rollups.REPORT_QUERIES)
+        pool = await read_pool()
+        results = await asyncio.gather(
+            fetch(rollups.STATS_QUERY, pool=pool),
+            fetch(products_sql, products_params, pool=pool),
+            fetch("SELECT * FROM Категории", pool=pool),
+            fetch(orders_sql, orders_params, pool=pool),
+            fetch(keystore.LOW_STOCK_QUERY, (key_low_stock_threshold,), pool=pool),
+            *(fetch(rollups.REPORT_QUERIES[name], pool=pool) for name in report_names),
+        )
+        stats_rows, product_rows, categories, order_rows, low_stock = results[:5]
+
+        stats = rollups.stats_from_rows(stats_rows)
+        products = keyset_page(product_rows, ['ID_Товара'], products_direction, per_page)
+        orders = keyset_page(order_rows, ['Дата_заказа', 'ID_Заказа'], orders_direction, per_page)
+        reports = dict(zip(report_names, results[5:]))
+        reports['low_stock'] = low_stock
+
+        return await render_template('admin.html', stats=stats, products=products, orders=orders,
+                                     reports=reports, categories=categories)
+
+    # --- Общая точка входа ASGI ---
+
+    flask_asgi = AsyncioWSGIMiddleware(flask_app)
+    _flask_urls = flask_app.url_map.bind('localhost')
+
+    def _is_async_route(scope):
+        try:
+            endpoint, _ = _flask_urls.match(scope['path'], scope['method'])
+        except HTTPException:
+            return False
+        return endpoint in ASYNC_ENDPOINTS
+
+    async def asgi(scope, receive, send):
+        # Асинхронные маршруты и события жизненного цикла — в Quart, остальное — во Flask
+        if scope['type'] == 'http' and not _is_async_route(scope):
+            return await flask_asgi(scope, receive, send)
+        return await qapp(scope, receive, send)
+
+
+def main(argv):
+    if not available():
+        print("Для асинхронного режима установите пакеты: pip install quart aiomysql")
+        return 1
+    from hypercorn.asyncio import serve
+    from hypercorn.config import Config
+
+    config = Config()
+    config.bind = [argv[1] if len(argv) > 1 else '127.0.0.1:5000']
+    print("Асинхронный режим, адрес:", config.bind[0])
+    asyncio.run(serve(asgi, config))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,3 @@
+# Нагрузочное тестирование магазина:
+#   python -m bench.seed  — заполнить БД синтетическими данными нужного объема
+#   python -m bench.load  — прогнать пользовательские сценарии и снять задержки по маршрутам
@@ -0,0 +1,340 @@
+import argparse
+import http.client
+import json
+import math
+import platform
+import random
+import re
+import sys
+import threading
+import time
+from datetime import datetime
+from http.cookies import SimpleCookie
+from urllib.parse import urlencode, urlsplit
+
+from bench.seed import BENCH_ADMIN, BENCH_PASSWORD
+
+# Нагрузочный драйвер: виртуальные пользователи параллельно проходят сценарии
+# (просмотр каталога и поиск, покупка, админ-панель) по HTTP, а по каждому маршруту
+# считаются p50/p95/p99 и пропускная способность. Результат сохраняется в JSON,
+# чтобы сравнивать сборки между собой.
+#
+# Запуск из папки scr (приложение уже запущено, БД заполнена через bench.seed):
+#   python -m bench.load --url http://127.0.0.1:5000 --duration 60 --concurrency 20 -o new.json
+#   python -m bench.load compare base.json new.json --threshold 10
+#
+# Сравнение синхронного и асинхронного режимов: один и тот же прогон против каждого из них
+#   python -m bench.load --url http://127.0.0.1:5000 --mode sync -o sync.json
+#   python -m bench.load --url http://127.0.0.1:8000 --mode async -o async.json
+#   python -m bench.load compare sync.json async.json
+
+SEARCH_TERMS = ['office', 'антивирус', 'photoshop', 'professional', 'лицензия', 'backup',
+                'домашняя', 'kaspersky', 'редактор', 'security', 'бухгалтерия', 'studio']
+
+PRODUCT_RE = re.compile(r'/product/(\d+)')
+CATEGORY_RE = re.compile(r'[?&]category=(\d+)')
+
+
+class Client:
+    # Один виртуальный пользователь: постоянное соединение и своя cookie сессии.
+    # Редиректы не выполняются, чтобы время каждого маршрута считалось отдельно
+    def __init__(self, base_url, timeout):
+        parts = urlsplit(base_url)
+        connection_class = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+        self._connect = lambda: connection_class(parts.netloc, timeout=timeout)
+        self._prefix = parts.path.rstrip('/')
+        self._conn = self._connect()
+        self.cookies = {}
+
+    def request(self, method, path, form=None):
+        headers = {'Connection': 'keep-alive'}
+        if self.cookies:
+            headers['Cookie'] = '; '.join(f"{k}={v}" for k, v in self.cookies.items())
+        body = None
+        if form is not None:
+            body = urlencode(form)
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        for attempt in (1, 2):
+            try:
+                self._conn.request(method, self._prefix + path, body=body, headers=headers)
+                response = self._conn.getresponse()
+                data = response.read()
+                break
+            except (http.client.HTTPException, ConnectionError):
+                # Сервер закрыл keep-alive соединение — переподключаемся один раз
+                self._conn.close()
+                self._conn = self._connect()
+                if attempt == 2:
+                    raise
+        for header in response.headers.get_all('Set-Cookie') or ():
+            cookie = SimpleCookie(header)
+            for name, morsel in cookie.items():
+                self.cookies[name] = morsel.value
+        return response.status, data
+
+    def close(self):
+        self._conn.close()
+
+
+class Recorder:
+    # Задержки по маршрутам. Запросы во время прогрева не учитываются
+    def __init__(self, warmup_until):
+        self.warmup_until = warmup_until
+        self.latencies = {}
+        self.errors = {}
+        self._lock = threading.Lock()
+
+    def record(self, route, started, ok):
+        finished = time.monotonic()
+        if started < self.warmup_until:
+            return
+        with self._lock:
+            self.latencies.setdefault(route, []).append((finished - started) * 1000)
+            if not ok:
+                self.errors[route] = self.errors.get(route, 0) + 1
+
+
+class VirtualUser:
+    def __init__(self, client, recorder, rng, catalog, buyer_ids):
+        self.client = client
+        self.recorder = recorder
+        self.rng = rng
+        self.catalog = catalog
+        self.buyer_ids = buyer_ids
+
+    def call(self, route, method, path, form=None):
+        started = time.monotonic()
+        try:
+            status, body = self.client.request(method, path, form)
+            ok = status < 400
+        except Exception:
+            status, body, ok = None, b'', False
+        self.recorder.record(route, started, ok)
+        return status, body
+
+    def login(self, login):
+        self.client.cookies.clear()
+        status, _ = self.call('login', 'POST', '/login', {'login': login, 'password': BENCH_PASSWORD})
+        return status == 302
+
+    def browse(self):
+        rng = self.rng
+        self.call('index', 'GET', '/')
+        query = {'search': rng.choice(SEARCH_TERMS)}
+        if rng.random() < 0.3:
+            query['sort_price'] = rng.choice(('asc', 'desc'))
+        self.call('search', 'GET', '/?' + urlencode(query))
+        if self.catalog['categories']:
+            query = {'category': rng.choice(self.catalog['categories']), 'sort_date': 'new'}
+            self.call('index', 'GET', '/?' + urlencode(query))
+        for _ in range(rng.randint(1, 3)):
+            self.call('product_detail', 'GET', '/product/%d' % rng.choice(self.catalog['products']))
+
+    def buy(self):
+        rng = self.rng
+        if not self.login('bench%d@example.com' % rng.choice(self.buyer_ids)):
+            return
+        self.call('index', 'GET', '/')
+        for _ in range(rng.randint(1, 3)):
+            product_id = rng.choice(self.catalog['products'])
+            self.call('product_detail', 'GET', '/product/%d' % product_id)
+            self.call('add_to_cart', 'POST', '/add_to_cart/%d' % product_id, {})
+        self.call('cart', 'GET', '/cart')
+        self.call('checkout', 'POST', '/checkout', {})
+        self.call('orders', 'GET', '/orders')
+
+    def admin(self):
+        if self.login(BENCH_ADMIN):
+            self.call('admin_dashboard', 'GET', '/admin')
+
+
+def discover(base_url, timeout):
+    # ID товаров и категорий для сценариев берем с витрины, как их увидит покупатель
+    client = Client(base_url, timeout)
+    products, categories = set(), set()
+    try:
+        for path in ['/'] + ['/?' + urlencode({'search': term}) for term in SEARCH_TERMS]:
+            status, body = client.request('GET', path)
+            text = body.decode('utf-8', 'replace')
+            products.update(int(i) for i in PRODUCT_RE.findall(text))
+            categories.update(int(i) for i in CATEGORY_RE.findall(text))
+    finally:
+        client.close()
+    return {'products': sorted(products), 'categories': sorted(categories)}
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        if name not in ('browse', 'buy', 'admin'):
+            raise argparse.ArgumentTypeError("Неизвестный сценарий: %s" % name)
+        mix[name] = float(weight)
+    return mix
+
+
+def parse_range(text):
+    first, _, last = text.partition('-')
+    return range(int(first), int(last or first) + 1)
+
+
+def percentile(values, p):
+    # Ближайший ранг по отсортированному списку
+    if not values:
+        return None
+    index = max(0, min(len(values) - 1, math.ceil(p / 100.0 * len(values)) - 1))
+    return values[index]
+
+
+def summarize(latencies, errors, elapsed):
+    def stats(values, error_count):
+        values = sorted(values)
+        return {
+            'count': len(values),
+            'errors': error_count,
+            'rps': round(len(values) / elapsed, 2) if elapsed else 0,
+            'mean_ms': round(sum(values) / len(values), 2) if values else None,
+            'p50_ms': round(percentile(values, 50), 2) if values else None,
+            'p95_ms': round(percentile(values, 95), 2) if values else None,
+            'p99_ms': round(percentile(values, 99), 2) if values else None,
+            'max_ms': round(values[-1], 2) if values else None,
+        }
+
+    routes = {route: stats(values, errors.get(route, 0)) for route, values in sorted(latencies.items())}
+    everything = [v for values in latencies.values() for v in values]
+    return routes, stats(everything, sum(errors.values()))
+
+
+def run(args):
+    catalog = discover(args.url, args.timeout)
+    if not catalog['products']:
+        print("На витрине не найдено товаров — заполните БД: python -m bench.seed")
+        return None
+
+    scenarios = list(args.mix)
+    weights = [args.mix[name] for name in scenarios]
+    started = time.monotonic()
+    deadline = started + args.warmup + args.duration
+    recorder = Recorder(started + args.warmup)
+    buyer_ids = list(args.buyers)
+
+    def worker(index):
+        rng = random.Random(args.seed * 1000 + index)
+        client = Client(args.url, args.timeout)
+        user = VirtualUser(client, recorder, rng, catalog, buyer_ids)
+        try:
+            while time.monotonic() < deadline:
+                getattr(user, rng.choices(scenarios, weights)[0])()
+        finally:
+            client.close()
+
+    threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(args.concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    elapsed = time.monotonic() - recorder.warmup_until
+    routes, total = summarize(recorder.latencies, recorder.errors, elapsed)
+    return {
+        'meta': {
+            'url': args.url,
+            'mode': args.mode,
+            'started_at': datetime.now().isoformat(timespec='seconds'),
+            'duration_s': args.duration,
+            'warmup_s': args.warmup,
+            'concurrency': args.concurrency,
+            'mix': args.mix,
+            'seed': args.seed,
+            'products_seen': len(catalog['products']),
+            'python': platform.python_version(),
+        },
+        'routes': routes,
+        'total': total,
+    }
+
+
+def print_report(result):
+    print(f"{'маршрут':<18}{'запросов':>9}{'ошибок':>8}{'rps':>9}{'p50':>9}{'p95':>9}{'p99':>9}")
+    rows = list(result['routes'].items()) + [('ИТОГО', result['total'])]
+    for route, s in rows:
+        if not s['count']:
+            continue
+        print(f"{route:<18}{s['count']:>9}{s['errors']:>8}{s['rps']:>9.1f}"
+              f"{s['p50_ms']:>9.1f}{s['p95_ms']:>9.1f}{s['p99_ms']:>9.1f}")
+
+
+# Параметры прогона, которые должны совпадать, чтобы сравнение имело смысл
+COMPARABLE_META = ('duration_s', 'concurrency', 'mix', 'seed', 'products_seen')
+
+
+def compare(base, new, threshold, metric='p95_ms'):
+    # Сравнение двух прогонов: регрессия — рост метрики больше чем на threshold процентов
+    for name in COMPARABLE_META:
+        before, after = base['meta'].get(name), new['meta'].get(name)
+        if before != after:
+            print(f"Внимание: прогоны различаются параметром {name}: {before} / {after}")
+    regressions = []
+    for route, stats in new['routes'].items():
+        before = base['routes'].get(route, {}).get(metric)
+        after = stats.get(metric)
+        if not before or after is None:
+            continue
+        change = (after - before) / before * 100
+        mark = ''
+        if change > threshold:
+            mark = '  <-- регрессия'
+            regressions.append(route)
+        print(f"{route:<18}{before:>10.1f}{after:>10.1f}{change:>+9.1f}%{mark}")
+    return regressions
+
+
+def main(argv):
+    if len(argv) > 1 and argv[1] == 'compare':
+        parser = argparse.ArgumentParser(prog='python -m bench.load compare')
+        parser.add_argument('base')
+        parser.add_argument('new')
+        parser.add_argument('--threshold', type=float, default=10.0, help="допустимый рост в процентах")
+        parser.add_argument('--metric', default='p95_ms', choices=('p50_ms', 'p95_ms', 'p99_ms', 'mean_ms'))
+        args = parser.parse_args(argv[2:])
+        with open(args.base, encoding='utf-8') as f:
+            base = json.load(f)
+        with open(args.new, encoding='utf-8') as f:
+            new = json.load(f)
+        before = base['meta'].get('mode') or 'было'
+        after = new['meta'].get('mode') or 'стало'
+        print(f"{'маршрут':<18}{before:>10}{after:>10}{'изм.':>10}  ({args.metric}, мс)")
+        regressions = compare(base, new, args.threshold, args.metric)
+        print(f"{'rps':<18}{base['total']['rps']:>10.1f}{new['total']['rps']:>10.1f}")
+        return 1 if regressions else 0
+
+    parser = argparse.ArgumentParser(prog='python -m bench.load', description="Нагрузочный прогон магазина")
+    parser.add_argument('--url', default='http://127.0.0.1:5000')
+    parser.add_argument('--duration', type=float, default=60, help="длительность замера, с")
+    parser.add_argument('--warmup', type=float, default=5, help="прогрев без учета результатов, с")
+    parser.add_argument('--concurrency', type=int, default=10, help="число виртуальных пользователей")
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix('browse=70,buy=25,admin=5'),
+                        help="доли сценариев, например browse=70,buy=25,admin=5")
+    parser.add_argument('--buyers', type=parse_range, default=parse_range('4-1003'),
+                        help="диапазон ID покупателей из bench.seed (логин bench<ID>@example.com)")
+    parser.add_argument('--timeout', type=float, default=30)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--mode', choices=('sync', 'async'),
+                        help="режим запущенного приложения (для сравнения режимов в bench.load compare)")
+    parser.add_argument('-o', '--output', help="файл для результатов в JSON")
+    args = parser.parse_args(argv[1:])
+
+    result = run(args)
+    if result is None:
+        return 1
+    print_report(result)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    else:
+        print(json.dumps(result, ensure_ascii=False))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,279 @@
+import argparse
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+import pymysql as db
+
+import rollups
+from catalog import CATALOG_VERSION_KEY
+
+# Генератор синтетических данных для нагрузочного тестирования.
+# Дописывает в БД товары, пользователей, заказы, позиции и лицензии пачками
+# (многострочные INSERT), затем пересчитывает сводки и сбрасывает кэш каталога.
+# Одинаковые параметры и --seed дают одинаковый набор данных.
+#
+# Запуск из папки scr:
+#   python -m bench.seed --products 100000
+#   python -m bench.seed --products 1000000 --users 200000 --orders 500000 --stock-keys 5
+#
+# Все пользователи получают пароль BENCH_PASSWORD; администратор — BENCH_ADMIN.
+
+BENCH_PASSWORD = 'bench'
+BENCH_ADMIN = 'bench_admin@example.com'
+PAID_SHARE = 0.95      # доля оплаченных заказов
+INACTIVE_SHARE = 0.03  # доля снятых с продажи товаров
+ORDER_DAYS = 365       # заказы распределяются по последнему году
+
+CATEGORIES = [
+    'Операционные системы', 'Антивирусы', 'Офисные пакеты', 'Графика и дизайн',
+    'Разработка', 'Утилиты', 'Игры', 'Бухгалтерия', 'Видеомонтаж', 'Резервное копирование',
+    'Сетевые инструменты', 'Обучение',
+]
+BRANDS = ['Microsoft', 'Kaspersky', 'Adobe', 'JetBrains', 'Corel', 'Acronis', 'ESET', 'Dr.Web',
+          'Autodesk', 'Parallels', 'ABBYY', '1С', 'Movavi', 'Ashampoo', 'Avast', 'Norton']
+PRODUCTS = ['Office', 'Antivirus', 'Internet Security', 'Photoshop', 'Studio', 'Suite', 'Backup',
+            'Total Security', 'Editor', 'Converter', 'Cleaner', 'Recovery', 'Designer', 'IDE',
+            'Бухгалтерия', 'Видеоредактор', 'Архиватор', 'Переводчик']
+EDITIONS = ['Home', 'Professional', 'Business', 'Enterprise', 'Standard', 'Premium', 'Ultimate',
+            'Домашняя', 'Профессиональная', 'Корпоративная', 'Стандартная']
+PHRASES = [
+    'Лицензионный ключ активации для {devices} устройств.',
+    'Срок действия лицензии — {years} год.',
+    'Электронная поставка: ключ приходит сразу после оплаты.',
+    'Поддерживает обновления до последней версии.',
+    'Подходит для домашнего и офисного использования.',
+    'Защита от вирусов, шифровальщиков и фишинга.',
+    'Удобный интерфейс на русском языке.',
+    'Совместимо с Windows, macOS и Linux.',
+    'Включает облачное хранилище и техническую поддержку.',
+    'Инструменты для работы с документами, таблицами и презентациями.',
+]
+LAST_NAMES = ['Иванов', 'Петров', 'Сидорова', 'Смирнов', 'Кузнецова', 'Попов', 'Волкова',
+              'Соколов', 'Лебедева', 'Козлов', 'Новикова', 'Морозов']
+FIRST_NAMES = ['Иван', 'Петр', 'Анна', 'Мария', 'Алексей', 'Елена', 'Дмитрий', 'Ольга',
+               'Сергей', 'Наталья', 'Андрей', 'Татьяна']
+
+
+def _next_id(cursor, table, column):
+    cursor.execute(f"SELECT COALESCE(MAX({column}), 0) + 1 AS next_id FROM {table}")
+    return cursor.fetchone()['next_id']
+
+
+class Seeder:
+    def __init__(self, conn, rng, batch_size=5000):
+        self.conn = conn
+        self.rng = rng
+        self.batch_size = batch_size
+        self.products = []     # (ID_Товара, Цена) активных товаров для заказов
+        self.user_ids = []
+
+    def _insert(self, sql, rows):
+        # Многострочные INSERT пачками по batch_size, одна транзакция на пачку.
+        # rows может быть генератором — весь набор в памяти не держим
+        batch = []
+        with self.conn.cursor() as cursor:
+            for row in rows:
+                batch.append(row)
+                if len(batch) >= self.batch_size:
+                    cursor.executemany(sql, batch)
+                    self.conn.commit()
+                    batch.clear()
+            if batch:
+                cursor.executemany(sql, batch)
+                self.conn.commit()
+
+    def _report(self, table, count, started):
+        elapsed = time.monotonic() - started
+        print(f"{table}: {count} строк за {elapsed:.1f} с ({count / max(elapsed, 1e-9):.0f} строк/с)")
+
+    def categories(self):
+        with self.conn.cursor() as cursor:
+            cursor.execute("SELECT ID_Категории, Название_категории FROM Категории")
+            existing = {row['Название_категории']: row['ID_Категории'] for row in cursor.fetchall()}
+        missing = [(name,) for name in CATEGORIES if name not in existing]
+        if missing:
+            self._insert("INSERT INTO Категории (Название_категории) VALUES (%s)", missing)
+        with self.conn.cursor() as cursor:
+            cursor.execute("SELECT ID_Категории FROM Категории")
+            return [row['ID_Категории'] for row in cursor.fetchall()]
+
+    def _description(self):
+        rng = self.rng
+        phrases = rng.sample(PHRASES, rng.randint(2, 4))
+        return ' '.join(p.format(devices=rng.choice((1, 3, 5, 10)), years=rng.choice((1, 2))) for p in phrases)
+
+    def seed_products(self, count, category_ids):
+        started = time.monotonic()
+        rng = self.rng
+        with self.conn.cursor() as cursor:
+            next_id = _next_id(cursor, 'Товары', 'ID_Товара')
+
+        def rows():
+            for product_id in range(next_id, next_id + count):
+                name = f"{rng.choice(BRANDS)} {rng.choice(PRODUCTS)} {rng.choice(EDITIONS)} {rng.randint(2015, 2026)}"
+                price = Decimal(rng.choice((199, 490, 990, 1490, 1990, 2990, 4990, 9990, 14990, 29990)))
+                active = 0 if rng.random() < INACTIVE_SHARE else 1
+                if active:
+                    self.products.append((product_id, price))
+                yield (product_id, name, self._description(), price, rng.choice(category_ids), active)
+
+        self._insert("""
+            INSERT INTO Товары (ID_Товара, Название, Описание, Цена, ID_Категории, Статус_активности)
+            VALUES (%s, %s, %s, %s, %s, %s)
+        """, rows())
+        self._report('Товары', count, started)
+
+    def seed_users(self, count):
+        started = time.monotonic()
+        rng = self.rng
+        with self.conn.cursor() as cursor:
+            next_id = _next_id(cursor, 'Пользователи', 'ID_Пользователя')
+
+        def rows():
+            for user_id in range(next_id, next_id + count):
+                self.user_ids.append(user_id)
+                yield (user_id, rng.choice(LAST_NAMES), rng.choice(FIRST_NAMES),
+                       f"bench{user_id}@example.com", BENCH_PASSWORD, 2)
+
+        self._insert("""
+            INSERT INTO Пользователи (ID_Пользователя, Фамилия, Имя, Логин, Пароль, ID_Роли)
+            VALUES (%s, %s, %s, %s, %s, %s)
+        """, rows())
+        with self.conn.cursor() as cursor:
+            cursor.execute("""
+                INSERT IGNORE INTO Пользователи (Фамилия, Имя, Логин, Пароль, ID_Роли)
+                VALUES ('Нагрузка', 'Админ', %s, %s, 1)
+            """, (BENCH_ADMIN, BENCH_PASSWORD))
+        self.conn.commit()
+        self._report('Пользователи', count, started)
+
+    def _key(self):
+        # Ключ в формате keystore.generate_key, но из генератора с зерном (воспроизводимо)
+        raw = '%016X' % self.rng.getrandbits(64)
+        return f"{raw[:8]}-{raw[8:12]}-{raw[12:16]}"
+
+    def _popular_product(self):
+        # Спрос неравномерный: небольшая часть товаров собирает большую часть заказов
+        return self.products[int(len(self.products) * self.rng.random() ** 3)]
+
+    def seed_orders(self, count, max_lines, license_days=365):
+        started = time.monotonic()
+        rng = self.rng
+        with self.conn.cursor() as cursor:
+            order_id = _next_id(cursor, 'Заказы', 'ID_Заказа')
+            line_id = _next_id(cursor, 'Состав_заказа', 'ID_Позиции')
+        now = datetime.now().replace(microsecond=0)
+        lines_total = licenses_total = 0
+
+        for start in range(0, count, self.batch_size):
+            orders, lines, licenses = [], [], []
+            for _ in range(min(self.batch_size, count - start)):
+                ordered_at = now - timedelta(seconds=rng.randint(0, ORDER_DAYS * 86400))
+                status = rollups.PAID_STATUS if rng.random() < PAID_SHARE else 'Новый'
+                chosen = {}
+                for _ in range(rng.randint(1, max_lines)):
+                    product_id, price = self._popular_product()
+                    chosen[product_id] = price
+                total = Decimal(0)
+                for product_id, price in chosen.items():
+                    quantity = 1 if rng.random() < 0.85 else rng.randint(2, 3)
+                    total += price * quantity
+                    lines.append((line_id, order_id, product_id, price, license_days, quantity))
+                    for _ in range(quantity):
+                        licenses.append((line_id, self._key(), ordered_at,
+                                         ordered_at + timedelta(days=license_days)))
+                    line_id += 1
+                orders.append((order_id, rng.choice(self.user_ids), ordered_at, status, total))
+                order_id += 1
+
+            with self.conn.cursor() as cursor:
+                cursor.executemany("""
+                    INSERT INTO Заказы (ID_Заказа, ID_Пользователя, Дата_заказа, Статус, Итоговая_сумма)
+                    VALUES (%s, %s, %s, %s, %s)
+                """, orders)
+                cursor.executemany("""
+                    INSERT INTO Состав_заказа (ID_Позиции, ID_Заказа, ID_Товара, Цена_продажи, Срок_лицензии_дни, Количество)
+                    VALUES (%s, %s, %s, %s, %s, %s)
+                """, lines)
+                cursor.executemany("""
+                    INSERT INTO Лицензии (ID_Позиции_заказа, Лицензионный_ключ, Дата_активации, Дата_истечения)
+                    VALUES (%s, %s, %s, %s)
+                """, licenses)
+            self.conn.commit()
+            lines_total += len(lines)
+            licenses_total += len(licenses)
+
+        self._report('Заказы', count, started)
+        print(f"Состав_заказа: {lines_total} строк, Лицензии: {licenses_total} строк")
+
+    def seed_stock_keys(self, per_product):
+        started = time.monotonic()
+        rows = ((product_id, self._key()) for product_id, _ in self.products for _ in range(per_product))
+        self._insert("INSERT IGNORE INTO Склад_ключей (ID_Товара, Лицензионный_ключ) VALUES (%s, %s)", rows)
+        self._report('Склад_ключей', len(self.products) * per_product, started)
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog='python -m bench.seed',
+                                     description="Заполнение SoftKeyDB синтетическими данными")
+    parser.add_argument('--products', type=int, default=10000, help="число товаров (по умолчанию 10000)")
+    parser.add_argument('--users', type=int, help="число покупателей (по умолчанию как товаров)")
+    parser.add_argument('--orders', type=int, help="число заказов (по умолчанию 2 на покупателя)")
+    parser.add_argument('--max-lines', type=int, default=4, help="максимум позиций в заказе")
+    parser.add_argument('--stock-keys', type=int, default=0, help="ключей на складе на каждый товар")
+    parser.add_argument('--batch', type=int, default=5000, help="строк в одном INSERT")
+    parser.add_argument('--seed', type=int, default=42, help="зерно генератора случайных чисел")
+    args = parser.parse_args(argv)
+    if args.users is None:
+        args.users = args.products
+    if args.orders is None:
+        args.orders = args.users * 2
+    return args
+
+
+def main(argv):
+    from config import host, user, password, port, db_name
+
+    args = parse_args(argv[1:])
+    conn = db.connect(host=host, port=port, user=user, password=password,
+                      database=db_name, cursorclass=db.cursors.DictCursor, autocommit=False)
+    started = time.monotonic()
+    try:
+        with conn.cursor() as cursor:
+            # Проверки ключей на время загрузки не нужны: ID выдаются генератором по порядку
+            cursor.execute("SET SESSION foreign_key_checks = 0, unique_checks = 0")
+        seeder = Seeder(conn, random.Random(args.seed), args.batch)
+        category_ids = seeder.categories()
+        seeder.seed_products(args.products, category_ids)
+        seeder.seed_users(args.users)
+        if seeder.products and seeder.user_ids:
+            seeder.seed_orders(args.orders, args.max_lines)
+        if args.stock_keys:
+            seeder.seed_stock_keys(args.stock_keys)
+        with conn.cursor() as cursor:
+            cursor.execute("SET SESSION foreign_key_checks = 1, unique_checks = 1")
+
+        print("Пересчет сводок отчетов...")
+        rollups.rebuild(conn)
+        with conn.cursor() as cursor:
+            cursor.execute(
+                "INSERT INTO Версии_кэша (Ключ, Версия) VALUES (%s, 1) "
+                "ON DUPLICATE KEY UPDATE Версия = Версия + 1",
+                (CATALOG_VERSION_KEY,)
+            )
+        conn.commit()
+    except Exception as ex:
+        conn.rollback()
+        print("Ошибка заполнения БД:", ex)
+        return 1
+    finally:
+        conn.close()
+    print(f"Готово за {time.monotonic() - started:.1f} с")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
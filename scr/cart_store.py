@@ -0,0 +1,496 @@
+import atexit
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import pymysql as db
+
+# Корзины покупателей с отложенной записью (write-behind). Добавление, изменение количества
+# и удаление товара меняют только локальное хранилище, а фоновый поток раз в несколько секунд
+# записывает измененные корзины в таблицу Корзина пакетами. Перед оформлением заказа корзина
+# пользователя записывается в БД принудительно, поэтому транзакция заказа читает актуальные данные.
+#
+# Хранилища:
+#   MemoryBackend — словарь в памяти процесса; подходит, когда воркер один
+#   SqliteBackend — файл SQLite (WAL, чтение через mmap), общий для всех воркеров на сервере
+#
+# Таблица Корзина остается источником истины после перезапуска: корзина, которой нет
+# в хранилище, один раз читается из БД.
+
+# Корзина пользователя из БД — при первом обращении к ней в этом хранилище
+LOAD_QUERY = "SELECT ID_Товара, Количество FROM Корзина WHERE ID_Пользователя = %s ORDER BY ID_Корзины"
+
+
+def products_query(product_ids):
+    # Товары корзины, которых нет в кэше каталога (сняты с продажи)
+    placeholders = ', '.join(['%s'] * len(product_ids))
+    return f"""
+        SELECT t.ID_Товара, t.Название, t.Цена, t.Описание, t.Изображение, k.Название_категории
+        FROM Товары t
+        JOIN Категории k ON t.ID_Категории = k.ID_Категории
+        WHERE t.ID_Товара IN ({placeholders})
+    """
+
+
+def build_lines(items, products):
+    # Строки корзины для шаблона: количество из хранилища, название и цена из каталога.
+    # Товары, которых больше нет в БД, пропускаются
+    lines = []
+    for product_id, quantity in items.items():
+        product = products.get(product_id)
+        if product is None:
+            continue
+        line = dict(product)
+        line['ID_Товара'] = product_id
+        line['Количество'] = quantity
+        lines.append(line)
+    total_price = sum(line['Цена'] * line['Количество'] for line in lines)
+    return lines, total_price
+
+
+# --- Хранилища ---
+
+class MemoryBackend:
+    """Корзины в памяти процесса: {ID пользователя: {ID товара: количество}}."""
+
+    def __init__(self, max_users=100000):
+        self.max_users = max_users
+        self._carts = OrderedDict()  # порядок — давность обращения, для вытеснения
+        self._dirty = set()
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        with self._lock:
+            items = self._carts.get(user_id)
+            if items is None:
+                return None
+            self._carts.move_to_end(user_id)
+            return dict(items)
+
+    def load(self, user_id, items):
+        # Кладет корзину, прочитанную из БД, если другой поток не успел раньше
+        with self._lock:
+            current = self._carts.get(user_id)
+            if current is None:
+                current = self._carts[user_id] = dict(items)
+                self._evict(keep=user_id)
+            return dict(current)
+
+    def _evict(self, keep=None):
+        # Вытесняем давно не используемые корзины; измененные ждут записи в БД, а только что
+        # загруженная (keep) нужна вызывающему. Если вытеснить некого, хранилище временно
+        # больше max_users
+        excess = len(self._carts) - self.max_users
+        if excess <= 0:
+            return
+        for user_id in list(self._carts):
+            if excess <= 0:
+                break
+            if user_id != keep and user_id not in self._dirty:
+                del self._carts[user_id]
+                excess -= 1
+
+    def add(self, user_id, product_id, delta, minimum):
+        # Меняет количество на delta, если результат не меньше minimum.
+        # False — корзины нет в хранилище, ее нужно сначала загрузить
+        with self._lock:
+            items = self._carts.get(user_id)
+            if items is None:
+                return False
+            quantity = items.get(product_id, 0) + delta
+            if quantity >= minimum and (product_id in items or delta > 0):
+                items[product_id] = quantity
+                self._dirty.add(user_id)
+            self._carts.move_to_end(user_id)
+            return True
+
+    def remove(self, user_id, product_id):
+        with self._lock:
+            items = self._carts.get(user_id)
+            if items is None:
+                return False
+            if items.pop(product_id, None) is not None:
+                self._dirty.add(user_id)
+            return True
+
+    def replace(self, user_id, items, dirty=True):
+        with self._lock:
+            self._carts[user_id] = dict(items)
+            self._carts.move_to_end(user_id)
+            if dirty:
+                self._dirty.add(user_id)
+            else:
+                self._dirty.discard(user_id)
+
+    def forget(self, user_id):
+        with self._lock:
+            self._carts.pop(user_id, None)
+            self._dirty.discard(user_id)
+
+    def take_dirty(self, limit, user_ids=None):
+        # Забирает до limit измененных корзин для записи в БД и снимает с них отметку
+        with self._lock:
+            candidates = self._dirty if user_ids is None else self._dirty.intersection(user_ids)
+            batch = []
+            for user_id in list(candidates)[:limit]:
+                self._dirty.discard(user_id)
+                batch.append((user_id, dict(self._carts.get(user_id, {}))))
+            return batch
+
+    def mark_dirty(self, user_ids):
+        # Запись не удалась — вернем корзины в очередь (если их не успели удалить)
+        with self._lock:
+            self._dirty.update(u for u in user_ids if u in self._carts)
+
+    def stats(self):
+        with self._lock:
+            return {'cached': len(self._carts), 'dirty': len(self._dirty)}
+
+
+class SqliteBackend:
+    """Корзины в файле SQLite, общем для всех воркеров на одном сервере."""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._pid = os.getpid()
+        self._conn().executescript("""
+            CREATE TABLE IF NOT EXISTS carts (
+                user_id INTEGER PRIMARY KEY,
+                dirty INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE TABLE IF NOT EXISTS cart_items (
+                user_id INTEGER NOT NULL,
+                product_id INTEGER NOT NULL,
+                quantity INTEGER NOT NULL,
+                UNIQUE (user_id, product_id)
+            );
+            CREATE INDEX IF NOT EXISTS carts_dirty ON carts (dirty);
+        """)
+
+    def _conn(self):
+        # Свое соединение на поток; после fork() соединения родителя не используем
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._local = threading.local()
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA mmap_size=67108864")
+            self._local.conn = conn
+        return conn
+
+    def _connection(self, write=True):
+        return _Transaction(self._conn(), write)
+
+    @staticmethod
+    def _items(conn, user_id):
+        rows = conn.execute("SELECT product_id, quantity FROM cart_items WHERE user_id = ? ORDER BY rowid",
+                            (user_id,))
+        return dict(rows.fetchall())
+
+    @staticmethod
+    def _exists(conn, user_id):
+        return conn.execute("SELECT 1 FROM carts WHERE user_id = ?", (user_id,)).fetchone() is not None
+
+    def get(self, user_id):
+        with self._connection(write=False) as conn:
+            if not self._exists(conn, user_id):
+                return None
+            return self._items(conn, user_id)
+
+    def load(self, user_id, items):
+        with self._connection() as conn:
+            if not self._exists(conn, user_id):
+                conn.execute("INSERT INTO carts (user_id) VALUES (?)", (user_id,))
+                conn.executemany("INSERT INTO cart_items (user_id, product_id, quantity) VALUES (?, ?, ?)",
+                                 [(user_id, p, q) for p, q in items.items()])
+            return self._items(conn, user_id)
+
+    def add(self, user_id, product_id, delta, minimum):
+        with self._connection() as conn:
+            if not self._exists(conn, user_id):
+                return False
+            row = conn.execute("SELECT quantity FROM cart_items WHERE user_id = ? AND product_id = ?",
+                               (user_id, product_id)).fetchone()
+            quantity = (row[0] if row else 0) + delta
+            if quantity >= minimum and (row or delta > 0):
+                if row:
+                    conn.execute("UPDATE cart_items SET quantity = ? WHERE user_id = ? AND product_id = ?",
+                                 (quantity, user_id, product_id))
+                else:
+                    conn.execute("INSERT INTO cart_items (user_id, product_id, quantity) VALUES (?, ?, ?)",
+                                 (user_id, product_id, quantity))
+                conn.execute("UPDATE carts SET dirty = 1 WHERE user_id = ?", (user_id,))
+            return True
+
+    def remove(self, user_id, product_id):
+        with self._connection() as conn:
+            if not self._exists(conn, user_id):
+                return False
+            deleted = conn.execute("DELETE FROM cart_items WHERE user_id = ? AND product_id = ?",
+                                   (user_id, product_id)).rowcount
+            if deleted:
+                conn.execute("UPDATE carts SET dirty = 1 WHERE user_id = ?", (user_id,))
+            return True
+
+    def replace(self, user_id, items, dirty=True):
+        with self._connection() as conn:
+            conn.execute("INSERT OR REPLACE INTO carts (user_id, dirty) VALUES (?, ?)", (user_id, int(dirty)))
+            conn.execute("DELETE FROM cart_items WHERE user_id = ?", (user_id,))
+            conn.executemany("INSERT INTO cart_items (user_id, product_id, quantity) VALUES (?, ?, ?)",
+                             [(user_id, p, q) for p, q in items.items()])
+
+    def forget(self, user_id):
+        with self._connection() as conn:
+            conn.execute("DELETE FROM carts WHERE user_id = ?", (user_id,))
+            conn.execute("DELETE FROM cart_items WHERE user_id = ?", (user_id,))
+
+    def take_dirty(self, limit, user_ids=None):
+        # Отметку снимаем в той же транзакции — каждую корзину запишет только один воркер
+        with self._connection() as conn:
+            if user_ids is None:
+                rows = conn.execute("SELECT user_id FROM carts WHERE dirty = 1 LIMIT ?", (limit,))
+            else:
+                user_ids = list(user_ids)[:limit]
+                placeholders = ', '.join('?' * len(user_ids))
+                rows = conn.execute(f"SELECT user_id FROM carts WHERE dirty = 1 AND user_id IN ({placeholders})",
+                                    user_ids)
+            batch = [(user_id, self._items(conn, user_id)) for (user_id,) in rows.fetchall()]
+            conn.executemany("UPDATE carts SET dirty = 0 WHERE user_id = ?", [(u,) for u, _ in batch])
+            return batch
+
+    def mark_dirty(self, user_ids):
+        with self._connection() as conn:
+            conn.executemany("UPDATE carts SET dirty = 1 WHERE user_id = ?", [(u,) for u in user_ids])
+
+    def stats(self):
+        with self._connection(write=False) as conn:
+            cached, dirty = conn.execute("SELECT COUNT(*), COALESCE(SUM(dirty), 0) FROM carts").fetchone()
+            return {'cached': cached, 'dirty': dirty}
+
+
+class _Transaction:
+    # Изменения начинаются с BEGIN IMMEDIATE: блокировка записи берется сразу, чтобы чтение
+    # и запись корзины в разных воркерах не перемешивались. Чтение в WAL не блокирует запись
+    def __init__(self, conn, write):
+        self.conn = conn
+        self.write = write
+
+    def __enter__(self):
+        self.conn.execute("BEGIN IMMEDIATE" if self.write else "BEGIN")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+
+
+# --- Корзины с записью в БД ---
+
+class CartStore:
+    """Корзины покупателей: локальное хранилище и фоновая запись в таблицу Корзина."""
+
+    def __init__(self, backend, pool, flush_interval=2, batch_size=500):
+        self.backend = backend
+        self.pool = pool
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.flushed = 0        # сколько корзин записано в БД
+        self.flush_errors = 0   # сколько раз запись в БД не удалась
+        self._flush_lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+    # --- Чтение ---
+
+    def cached(self, user_id):
+        # Корзина из хранилища или None, если ее нужно прочитать из БД (LOAD_QUERY)
+        return self.backend.get(user_id)
+
+    def load(self, user_id, rows):
+        return self.backend.load(user_id, {row['ID_Товара']: row['Количество'] for row in rows})
+
+    def items(self, user_id, connect):
+        # {ID товара: количество}; connect вызывается, только если корзины нет в хранилище
+        items = self.backend.get(user_id)
+        if items is not None:
+            return items
+        conn = connect()
+        if conn is None:
+            raise RuntimeError("нет соединения с БД")
+        with conn.cursor() as cursor:
+            cursor.execute(LOAD_QUERY, (user_id,))
+            return self.load(user_id, cursor.fetchall())
+
+    def lines(self, user_id, catalog, connect):
+        # Строки корзины и сумма. Цены берутся из кэша каталога, к БД обращаемся только
+        # за корзиной, которой нет в хранилище, и за снятыми с продажи товарами
+        items = self.items(user_id, connect)
+        products = catalog.by_id if catalog else {}
+        missing = [product_id for product_id in items if product_id not in products]
+        if missing:
+            conn = connect()
+            if conn is not None:
+                with conn.cursor() as cursor:
+                    cursor.execute(products_query(missing), missing)
+                    products = dict(products)
+                    products.update((row['ID_Товара'], row) for row in cursor.fetchall())
+                # Товары, удаленные из БД, убираем из корзины, чтобы не искать их каждый раз
+                for product_id in missing:
+                    if product_id not in products:
+                        self.backend.remove(user_id, product_id)
+        return build_lines(items, products)
+
+    # --- Изменение ---
+
+    def _change(self, operation, user_id, connect):
+        # Если корзины нет в хранилище (или ее вытеснили), загружаем из БД и повторяем один раз
+        if not operation():
+            self.items(user_id, connect)
+            if not operation():
+                raise RuntimeError("корзина вытеснена из хранилища сразу после загрузки")
+        self._ensure_flusher()
+
+    def add(self, user_id, product_id, connect, delta=1, minimum=1):
+        self._change(lambda: self.backend.add(user_id, product_id, delta, minimum), user_id, connect)
+
+    def remove(self, user_id, product_id, connect):
+        self._change(lambda: self.backend.remove(user_id, product_id), user_id, connect)
+
+    def clear(self, user_id):
+        # После оформления заказа: корзина в БД уже очищена транзакцией заказа, но
+        # отметка об изменении гарантирует, что опоздавшая фоновая запись ее не вернет
+        self.backend.replace(user_id, {}, dirty=True)
+        self._ensure_flusher()
+
+    def forget(self, user_id):
+        # Удаление аккаунта: дожидаемся текущей записи и забываем корзину без записи в БД
+        with self._flush_lock:
+            self.backend.forget(user_id)
+
+    # --- Запись в БД ---
+
+    def flush(self, conn=None, user_ids=None):
+        # Записывает измененные корзины (или только корзины user_ids) в таблицу Корзина.
+        # Соединение берется из пула, только если есть что записывать. Возвращает число корзин
+        own = None
+        written = 0
+        try:
+            with self._flush_lock:
+                while True:
+                    batch = self.backend.take_dirty(self.batch_size, user_ids)
+                    if not batch:
+                        break
+                    if conn is None:
+                        try:
+                            conn = own = self.pool.acquire()
+                        except Exception:
+                            self.backend.mark_dirty([user_id for user_id, _ in batch])
+                            raise
+                    written += self._write_batch(conn, batch)
+                    if len(batch) < self.batch_size:
+                        break
+        finally:
+            if own is not None:
+                self.pool.release(own)
+        return written
+
+    def _write_batch(self, conn, batch):
+        try:
+            self._write(conn, batch)
+            written = len(batch)
+        except db.IntegrityError:
+            # Пользователя удалили, пока корзина ждала записи: пишем по одной и
+            # пропускаем корзины, которые записать нельзя
+            conn.rollback()
+            written = 0
+            for user_id, items in batch:
+                try:
+                    self._write(conn, [(user_id, items)])
+                    written += 1
+                except db.IntegrityError as ex:
+                    conn.rollback()
+                    self.flush_errors += 1
+                    print("Ошибка записи корзины пользователя", user_id, ex)
+        except Exception:
+            # БД недоступна — вернем корзины в очередь до следующей попытки
+            try:
+                conn.rollback()
+            except Exception:
+                pass
+            self.flush_errors += 1
+            self.backend.mark_dirty([user_id for user_id, _ in batch])
+            raise
+        self.flushed += written
+        return written
+
+    @staticmethod
+    def _write(conn, batch):
+        # Корзины пользователей пакета заменяются целиком: один DELETE и один многострочный INSERT
+        user_ids = [user_id for user_id, _ in batch]
+        rows = [(user_id, product_id, quantity)
+                for user_id, items in batch for product_id, quantity in items.items()]
+        conn.begin()
+        with conn.cursor() as cursor:
+            placeholders = ', '.join(['%s'] * len(user_ids))
+            cursor.execute(f"DELETE FROM Корзина WHERE ID_Пользователя IN ({placeholders})", user_ids)
+            if rows:
+                # Товары, удаленные из БД, в корзину не пишем (внешний ключ)
+                product_ids = sorted({row[1] for row in rows})
+                placeholders = ', '.join(['%s'] * len(product_ids))
+                cursor.execute(f"SELECT ID_Товара FROM Товары WHERE ID_Товара IN ({placeholders})", product_ids)
+                existing = {row['ID_Товара'] for row in cursor.fetchall()}
+                rows = [row for row in rows if row[1] in existing]
+            if rows:
+                cursor.executemany(
+                    "INSERT INTO Корзина (ID_Пользователя, ID_Товара, Количество) VALUES (%s, %s, %s)", rows)
+        conn.commit()
+
+    # --- Фоновая запись ---
+
+    def _ensure_flusher(self):
+        # Поток запускается при первом изменении (и заново в дочернем процессе после fork)
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='cart-flusher', daemon=True)
+            self._thread.start()
+            atexit.register(self._flush_at_exit)
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception as ex:
+                print("Ошибка записи корзин в БД:", ex)
+
+    def _flush_at_exit(self):
+        try:
+            self.flush()
+        except Exception as ex:
+            print("Ошибка записи корзин в БД при остановке:", ex)
+
+    def stats(self):
+        stats = self.backend.stats()
+        stats['flushed'] = self.flushed
+        stats['flush_errors'] = self.flush_errors
+        return stats
+
+
+def create_store(backend, pool, path='carts.sqlite3', max_users=100000, flush_interval=2, batch_size=500):
+    if backend == 'sqlite':
+        storage = SqliteBackend(path)
+    elif backend == 'memory':
+        storage = MemoryBackend(max_users)
+    else:
+        raise ValueError("Неизвестное хранилище корзин: %s" % backend)
+    return CartStore(storage, pool, flush_interval, batch_size)
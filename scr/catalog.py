@@ -0,0 +1,249 @@
+import threading
+import time
+from datetime import datetime, timezone
+
+from facets import FacetIndex, in_range, parse_price
+from search import SearchIndex
+
+# Ключ строки в таблице Версии_кэша, по которому воркеры узнают об изменении каталога
+CATALOG_VERSION_KEY = 'catalog'
+
+
+class Catalog:
+    # Неизменяемый снимок каталога: активные товары и категории на момент загрузки
+    def __init__(self, version, categories, products, search_index, changed_at=None, facet_index=None):
+        self.version = version
+        self.changed_at = changed_at  # время последнего изменения каталога (Last-Modified витрины)
+        self.categories = categories
+        self.products = products  # отсортированы по ID_Товара
+        self.by_id = {p['ID_Товара']: p for p in products}
+        self.search_index = search_index
+        self.facet_index = facet_index
+
+    def _found(self, search_query):
+        # Полнотекстовый поиск возвращает товары в порядке релевантности. Индекс общий
+        # для всех снимков, поэтому отбрасываем товары, которых нет в этом снимке
+        by_id = self.by_id
+        return [i for i in self.search_index.search(search_query) if i in by_id]
+
+    def query(self, category_id=None, search_query=None, sort_price=None, sort_date=None,
+              price_min=None, price_max=None):
+        # Повторяет логику SQL-запроса витрины, но по данным в памяти.
+        # Возвращает отсортированный список и функцию ключа сортировки (для пагинации)
+        category_id = _category(category_id)
+        if category_id is False:
+            return [], _id_key
+        price_min, price_max = parse_price(price_min), parse_price(price_max)
+
+        if search_query:
+            ranked = self._found(search_query)
+            rank = {product_id: pos for pos, product_id in enumerate(ranked)}
+            products = [self.by_id[i] for i in ranked]
+            tie_break = lambda p: rank[p['ID_Товара']]
+        else:
+            products = self.products
+            tie_break = _id_key_value
+        result = [p for p in products
+                  if (category_id is None or p['ID_Категории'] == category_id)
+                  and in_range(p['Цена'], price_min, price_max)]
+
+        # Сортировка: сначала по цене, затем по дате добавления (ID), как ORDER BY в SQL;
+        # при равенстве — по релевантности поиска или по ID
+        def key(p):
+            parts = []
+            if sort_price == 'asc':
+                parts.append(p['Цена'])
+            elif sort_price == 'desc':
+                parts.append(-p['Цена'])
+            if sort_date == 'new':
+                parts.append(-p['ID_Товара'])
+            elif sort_date == 'old':
+                parts.append(p['ID_Товара'])
+            parts.append(tie_break(p))
+            return tuple(parts)
+
+        result.sort(key=key)
+        return result, key
+
+    def filter_products(self, category_id=None, search_query=None, sort_price=None, sort_date=None):
+        return self.query(category_id, search_query, sort_price, sort_date)[0]
+
+    def facets(self, category_id=None, search_query=None, price_min=None, price_max=None):
+        # Счетчики категорий и гистограмма цен для тех же фильтров, что и query()
+        category_id = _category(category_id)
+        if self.facet_index is None or category_id is False:
+            return {'categories': {}, 'total': 0, 'price': None}
+        ids = self._found(search_query) if search_query else None
+        return self.facet_index.facets(category_id, ids, parse_price(price_min), parse_price(price_max))
+
+
+def _category(category_id):
+    # ID категории из параметра запроса: None — все категории, False — неверное значение
+    if not category_id or category_id == 'all':
+        return None
+    try:
+        return int(category_id)
+    except (TypeError, ValueError):
+        return False
+
+
+def _utc(timestamp):
+    return datetime.fromtimestamp(int(timestamp), timezone.utc) if timestamp is not None else None
+
+
+# Все товары на витрине — каталог загружается в память целиком
+CATALOG_QUERY = """
+    SELECT t.*, k.Название_категории, UNIX_TIMESTAMP(t.Дата_изменения) AS Метка_изменения
+    FROM Товары t
+    JOIN Категории k ON t.ID_Категории = k.ID_Категории
+    WHERE t.Статус_активности = 1
+    ORDER BY t.ID_Товара
+"""
+
+# Один товар по ID, в том числе снятый с продажи (таких нет в кэше каталога)
+PRODUCT_QUERY = """
+    SELECT t.*, k.Название_категории, UNIX_TIMESTAMP(t.Дата_изменения) AS Метка_изменения
+    FROM Товары t
+    JOIN Категории k ON t.ID_Категории = k.ID_Категории
+    WHERE t.ID_Товара = %s
+"""
+
+
+def product_from_row(row):
+    # Строка PRODUCT_QUERY с временем изменения в UTC, как у товаров каталога
+    if row:
+        row['Метка_изменения'] = _utc(row['Метка_изменения'])
+    return row
+
+
+def _id_key_value(product):
+    return product['ID_Товара']
+
+
+def _id_key(product):
+    return (product['ID_Товара'],)
+
+
+class CatalogCache:
+    """Кэш каталога в памяти процесса с версионной инвалидацией через БД."""
+
+    def __init__(self, ttl=300, check_interval=2):
+        self.ttl = ttl                        # перезагрузка не реже, чем раз в ttl секунд
+        self.check_interval = check_interval  # как часто сверять версию с БД
+        self._catalog = None
+        self._loaded_at = 0
+        self._checked_at = 0
+        # Версия, которую этот процесс сам записал в bump(): снимок старше нее устарел,
+        # даже если источник чтения (реплика) еще не получил изменение
+        self._required = 0
+        self._lock = threading.Lock()
+        self.search_index = SearchIndex()
+        self.facet_index = FacetIndex()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _read_version(cursor):
+        # Версия каталога и время ее последнего увеличения
+        cursor.execute("SELECT Версия, UNIX_TIMESTAMP(Дата_изменения) AS Метка_изменения "
+                       "FROM Версии_кэша WHERE Ключ = %s", (CATALOG_VERSION_KEY,))
+        row = cursor.fetchone()
+        if not row:
+            return 0, None
+        return row['Версия'], _utc(row['Метка_изменения'])
+
+    def _load(self, cursor, version, changed_at=None):
+        cursor.execute("SELECT * FROM Категории")
+        categories = cursor.fetchall()
+        cursor.execute(CATALOG_QUERY)
+        products = cursor.fetchall()
+        for p in products:
+            # Время изменения в UTC (для Last-Modified) независимо от часового пояса сервера БД
+            p['Метка_изменения'] = _utc(p['Метка_изменения'])
+        self._update_indexes(products)
+        return Catalog(version, categories, products, self.search_index, changed_at, self.facet_index)
+
+    def _update_indexes(self, products):
+        # Переиндексируем только добавленные, измененные и исчезнувшие (деактивированные) товары
+        old = self._catalog.by_id if self._catalog else {}
+        new_ids = set()
+        for p in products:
+            product_id = p['ID_Товара']
+            new_ids.add(product_id)
+            before = old.get(product_id)
+            if (before is None or before['Название'] != p['Название']
+                    or before['Описание'] != p['Описание']):
+                self.search_index.add(product_id, p['Название'], p['Описание'])
+            if (before is None or before['ID_Категории'] != p['ID_Категории']
+                    or before['Цена'] != p['Цена']):
+                self.facet_index.add(product_id, p['ID_Категории'], p['Цена'])
+        for product_id in old:
+            if product_id not in new_ids:
+                self.search_index.remove(product_id)
+                self.facet_index.remove(product_id)
+
+    def _is_fresh(self, catalog, now):
+        return (catalog is not None and catalog.version >= self._required
+                and now - self._loaded_at < self.ttl
+                and now - self._checked_at < self.check_interval)
+
+    def get_fresh(self):
+        # Снимок без обращения к БД, если сверять версию еще рано; иначе None
+        catalog = self._catalog
+        if self._is_fresh(catalog, time.monotonic()):
+            self.hits += 1
+            return catalog
+        return None
+
+    def get(self, connect, primary=None):
+        # Возвращает актуальный снимок каталога. connect вызывается, только если нужно
+        # сверить версию с БД; при недоступной БД отдаем последний известный снимок.
+        # Снимок заменяется только более новой версией (или той же по истечении ttl), поэтому
+        # отстающая реплика не вернет каталог назад. primary — соединение с основным сервером
+        # на случай, если реплика еще не получила версию, записанную этим процессом
+        catalog = self.get_fresh()
+        if catalog is not None:
+            return catalog
+
+        with self._lock:
+            # Пока ждали блокировку, другой поток мог уже обновить каталог
+            catalog = self._catalog
+            now = time.monotonic()
+            if self._is_fresh(catalog, now):
+                self.hits += 1
+                return catalog
+            conn = connect()
+            if conn is None:
+                return catalog
+            try:
+                with conn.cursor() as cursor:
+                    version, changed_at = self._read_version(cursor)
+                if version < self._required and primary is not None:
+                    conn = primary() or conn
+                    with conn.cursor() as cursor:
+                        version, changed_at = self._read_version(cursor)
+                with conn.cursor() as cursor:
+                    if (catalog is None or version > catalog.version
+                            or (version == catalog.version and now - self._loaded_at >= self.ttl)):
+                        catalog = self._load(cursor, version, changed_at)
+                        self._catalog = catalog
+                        self._loaded_at = now
+                        self.misses += 1
+                    else:
+                        self.hits += 1
+                    self._checked_at = now
+            except Exception as ex:
+                print("Ошибка загрузки каталога:", ex)
+            return catalog
+
+    def bump(self, conn):
+        # Вызывается после изменения товаров (conn — основной сервер): увеличиваем версию,
+        # чтобы все воркеры перечитали каталог, а свою копию помечаем устаревшей сразу
+        with conn.cursor() as cursor:
+            cursor.execute(
+                "INSERT INTO Версии_кэша (Ключ, Версия) VALUES (%s, 1) "
+                "ON DUPLICATE KEY UPDATE Версия = Версия + 1",
+                (CATALOG_VERSION_KEY,)
+            )
+            version, _ = self._read_version(cursor)
+        self._required = max(self._required, version)
@@ -0,0 +1,88 @@
+import gzip
+import json
+
+from exports import json_value
+
+# JSON API каталога (/api/v1) для мобильного приложения и партнеров. Товары берутся из
+# того же снимка каталога и тем же Catalog.query(), что и витрина, поэтому API и HTML
+# всегда показывают одно и то же. Ответ зависит только от адреса и версии каталога:
+# ETag строится из версии, готовые (и сжатые) тела хранятся в кэше страниц.
+
+# Поля товара в API -> столбцы Товары
+PRODUCT_FIELDS = {
+    'id': 'ID_Товара',
+    'name': 'Название',
+    'description': 'Описание',
+    'price': 'Цена',
+    'category_id': 'ID_Категории',
+    'category': 'Название_категории',
+    'image': 'Изображение',
+    'active': 'Статус_активности',
+    'updated_at': 'Метка_изменения',
+}
+
+# Список товаров по умолчанию — без тяжелого описания, карточка товара — со всеми полями
+LIST_FIELDS = tuple(name for name in PRODUCT_FIELDS if name != 'description')
+DETAIL_FIELDS = tuple(PRODUCT_FIELDS)
+
+# Ответы меньше этого размера не сжимаются: заголовки gzip съедят выигрыш
+GZIP_MIN_SIZE = 512
+GZIP_LEVEL = 6
+GZIP_MAGIC = b'\x1f\x8b'
+
+
+class ApiError(ValueError):
+    pass
+
+
+def parse_fields(value, default):
+    # Поля из параметра fields=id,name,price; id есть всегда. Неизвестное поле — ApiError
+    if not value:
+        return default
+    fields = ['id']
+    for name in value.split(','):
+        name = name.strip()
+        if not name:
+            continue
+        if name not in PRODUCT_FIELDS:
+            raise ApiError(f"Неизвестное поле: {name}")
+        if name not in fields:
+            fields.append(name)
+    return tuple(fields)
+
+
+def product_json(product, fields, image_url=None):
+    # Товар в виде словаря API с выбранными полями; image_url строит ссылку на картинку
+    item = {}
+    for name in fields:
+        value = product.get(PRODUCT_FIELDS[name])
+        if name == 'image' and value and image_url is not None:
+            value = image_url(value)
+        elif name == 'active' and value is not None:
+            value = bool(value)
+        item[name] = value
+    return item
+
+
+def category_json(category, count=None):
+    item = {'id': category['ID_Категории'], 'name': category['Название_категории']}
+    if count is not None:
+        item['products'] = count
+    return item
+
+
+def dumps(data):
+    # Суммы — строкой, даты — в ISO 8601 (как в выгрузках)
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':'), default=json_value).encode('utf-8')
+
+
+def encode(body, accept_encodings):
+    # Тело, сжатое gzip, если клиент его принимает и ответ не слишком мал
+    if len(body) >= GZIP_MIN_SIZE and accept_encodings['gzip']:
+        return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+    return body
+
+
+def is_gzip(body):
+    # JSON не начинается с этих байтов, поэтому по ним видно, сжато ли тело из кэша
+    return body[:2] == GZIP_MAGIC
@@ -0,0 +1,376 @@
+import csv
+import io
+import json
+import os
+import sys
+import time
+import zipfile
+from decimal import Decimal
+
+import pymysql as db
+
+from facets import parse_price
+from images import DEFAULT_IMAGE, EXTENSIONS, ImageTooLarge
+
+# Массовый импорт товаров из CSV или JSON Lines (каталог нового поставщика — тысячи позиций).
+# Файл читается потоком по строкам; проверенные товары копятся в пачку и записываются
+# одним многострочным INSERT ... ON DUPLICATE KEY UPDATE в отдельной транзакции, поэтому
+# память и число запросов не растут с размером файла. Товар с уже известным артикулом
+# обновляется, без артикула — всегда создается новый. Категории сопоставляются по названию
+# без учета регистра, недостающие создаются. Изображения берутся из загруженного zip-архива
+# (по имени файла) или из уже загруженных в папку изображений.
+#
+# Ошибка в строке (нет цены, слишком длинное название, нет изображения) не останавливает
+# импорт: строка пропускается и попадает в отчет. Версия каталога увеличивается один раз —
+# вызывающий код делает это после импорта, а не после каждой строки.
+#
+# Запуск из командной строки:
+#   python catalog_import.py <файл.csv|файл.jsonl> [архив_изображений.zip]
+
+# Столбцы файла (заголовок CSV или ключи JSON) -> поля товара. Обязательны name, price, category
+IMPORT_COLUMNS = {
+    'sku': 'sku', 'артикул': 'sku',
+    'name': 'name', 'название': 'name',
+    'description': 'description', 'описание': 'description',
+    'price': 'price', 'цена': 'price',
+    'category': 'category', 'категория': 'category',
+    'image': 'image', 'изображение': 'image',
+    'active': 'active', 'активен': 'active',
+}
+REQUIRED_FIELDS = ('name', 'price', 'category')
+
+# Расширение файла -> формат
+FORMATS = {'csv': 'csv', 'jsonl': 'jsonl', 'ndjson': 'jsonl'}
+
+# Сколько товаров записывать за один запрос (и одну транзакцию)
+IMPORT_BATCH = 500
+
+# Сколько ошибок по строкам хранить в отчете (остальные только считаются)
+MAX_ERRORS = 100
+
+# Ограничения столбцов Товары и Категории
+MAX_LENGTHS = {'sku': 64, 'name': 255, 'category': 100, 'image': 255}
+MAX_PRICE = Decimal('99999999.99')  # DECIMAL(10, 2)
+CENT = Decimal('0.01')
+
+TRUE_VALUES = {'1', 'true', 'yes', 'да', 'y'}
+FALSE_VALUES = {'0', 'false', 'no', 'нет', 'n'}
+
+# Пустые описание, изображение и признак активности у существующего товара не затирают
+# текущие значения. pymysql.executemany отправляет такой INSERT одним запросом на всю пачку
+UPSERT_QUERY = """
+    INSERT INTO Товары (Артикул, Название, Описание, Цена, ID_Категории, Изображение, Статус_активности)
+    VALUES (%s, %s, %s, %s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE
+        Название = VALUES(Название),
+        Описание = COALESCE(VALUES(Описание), Описание),
+        Цена = VALUES(Цена),
+        ID_Категории = VALUES(ID_Категории),
+        Изображение = COALESCE(VALUES(Изображение), Изображение),
+        Статус_активности = COALESCE(VALUES(Статус_активности), Статус_активности),
+        Версия = Версия + 1
+"""
+
+
+def existing_query(count):
+    return "SELECT Артикул FROM Товары WHERE Артикул IN (%s)" % ", ".join(["%s"] * count)
+
+
+class ImportFileError(ValueError):
+    pass
+
+
+class ImportReport:
+    """Итоги импорта: созданные и обновленные товары, ошибки по строкам, скорость."""
+
+    def __init__(self, max_errors=MAX_ERRORS):
+        self.max_errors = max_errors
+        self.rows = 0         # строк с данными в файле
+        self.created = 0
+        self.updated = 0
+        self.failed = 0
+        self.categories = 0   # созданных категорий
+        self.images = 0       # сохраненных изображений из архива
+        self.errors = []      # (номер строки, сообщение) — не больше max_errors
+        self.started = time.perf_counter()
+        self.seconds = 0
+
+    def error(self, line, message):
+        self.failed += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append((line, message))
+
+    def finish(self):
+        self.seconds = time.perf_counter() - self.started
+
+    @property
+    def rate(self):
+        # Строк в секунду
+        return self.rows / self.seconds if self.seconds else 0
+
+    def summary(self):
+        return (f"Импорт: создано {self.created}, обновлено {self.updated}, с ошибками {self.failed} "
+                f"из {self.rows} строк; новых категорий {self.categories}, изображений {self.images}; "
+                f"{self.seconds:.1f} с ({self.rate:.0f} строк/с)")
+
+
+def file_format(filename):
+    # Формат по расширению файла или None
+    extension = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+    return FORMATS.get(extension)
+
+
+def _field(column):
+    # Поле товара для столбца файла или None (лишние столбцы пропускаются)
+    return IMPORT_COLUMNS.get(str(column).strip().lower())
+
+
+def read_rows(lines, fmt):
+    # Генератор (номер строки, значения полей) по текстовому потоку. Значения — словарь
+    # поле -> строка (или значение JSON); вместо словаря может прийти текст ошибки строки
+    if fmt == 'csv':
+        reader = csv.reader(lines)
+        try:
+            header = next(reader, None)
+            if header is None:
+                raise ImportFileError("файл пуст")
+            columns = [_field(name) for name in header]
+            missing = [name for name in REQUIRED_FIELDS if name not in columns]
+            if missing:
+                raise ImportFileError("нет обязательных столбцов: " + ", ".join(missing))
+            for row in reader:
+                if not any(value.strip() for value in row):
+                    continue
+                yield reader.line_num, {field: value for field, value in zip(columns, row) if field}
+        except csv.Error as ex:
+            raise ImportFileError(f"строка {reader.line_num}: {ex}")
+    else:
+        for number, line in enumerate(lines, 1):
+            if not line.strip():
+                continue
+            try:
+                item = json.loads(line, parse_float=Decimal)
+            except ValueError:
+                yield number, "неверный JSON"
+                continue
+            if not isinstance(item, dict):
+                yield number, "ожидался объект JSON"
+                continue
+            yield number, {_field(name): value for name, value in item.items() if _field(name)}
+
+
+def _text(values, field):
+    value = values.get(field)
+    if value is None:
+        return None
+    value = str(value).strip()
+    if not value:
+        return None
+    if field in MAX_LENGTHS and len(value) > MAX_LENGTHS[field]:
+        raise ImportFileError(f"{field}: длиннее {MAX_LENGTHS[field]} символов")
+    return value
+
+
+def _active(value):
+    if value is None or value == '':
+        return None
+    if isinstance(value, bool):
+        return int(value)
+    value = str(value).strip().lower()
+    if value in TRUE_VALUES:
+        return 1
+    if value in FALSE_VALUES:
+        return 0
+    raise ImportFileError(f"active: неверное значение «{value}»")
+
+
+def parse_product(values):
+    # Проверенный товар из значений строки. Ошибка — ImportFileError с текстом для отчета
+    product = {field: _text(values, field) for field in ('sku', 'name', 'description', 'category', 'image')}
+    for field in REQUIRED_FIELDS:
+        if field != 'price' and product[field] is None:
+            raise ImportFileError(f"{field}: не заполнено")
+    price = values.get('price')
+    if isinstance(price, str):
+        price = price.replace(' ', '').replace('\u00a0', '')  # разделители тысяч: "1 999,50"
+    price = parse_price(price)
+    if price is None:
+        raise ImportFileError(f"price: неверная цена «{values.get('price')}»")
+    if price > MAX_PRICE:
+        raise ImportFileError(f"price: больше {MAX_PRICE}")
+    product['price'] = price.quantize(CENT)
+    product['active'] = _active(values.get('active'))
+    return product
+
+
+def open_archive(stream):
+    # Архив изображений из загруженного файла (поток с произвольным доступом)
+    try:
+        return zipfile.ZipFile(stream)
+    except (zipfile.BadZipFile, OSError) as ex:
+        raise ImportFileError(f"архив изображений: {ex}")
+
+
+class _Images:
+    # Изображения товаров: файл из архива сохраняется один раз, даже если он указан у многих товаров
+    def __init__(self, pipeline, archive, report):
+        self.pipeline = pipeline
+        self.report = report
+        self._saved = {}
+        self._archive = {}  # имя файла -> запись архива
+        if archive is not None:
+            for info in archive.infolist():
+                if not info.is_dir():
+                    self._archive.setdefault(os.path.basename(info.filename), (archive, info))
+                    self._archive.setdefault(info.filename, (archive, info))
+
+    def resolve(self, name):
+        # Имя сохраненного изображения для поля image. Ошибка — ImportFileError
+        if name in self._saved:
+            return self._saved[name]
+        extension = name.rsplit('.', 1)[-1].lower() if '.' in name else ''
+        if extension not in EXTENSIONS:
+            raise ImportFileError(f"image: недопустимый формат «{name}»")
+        entry = self._archive.get(name)
+        if entry is not None and self.pipeline is not None:
+            archive, info = entry
+            try:
+                with archive.open(info) as stream:
+                    saved = self.pipeline.save_stream(stream, extension)
+            except ImageTooLarge:
+                raise ImportFileError(f"image: файл «{name}» слишком большой")
+            except (zipfile.BadZipFile, OSError, RuntimeError) as ex:
+                raise ImportFileError(f"image: не удалось прочитать «{name}»: {ex}")
+            self.report.images += 1
+        elif self.pipeline is not None and os.path.isfile(os.path.join(self.pipeline.folder, os.path.basename(name))):
+            saved = os.path.basename(name)
+        else:
+            raise ImportFileError(f"image: файл «{name}» не найден")
+        self._saved[name] = saved
+        return saved
+
+
+def _category_id(conn, categories, name, report):
+    key = name.lower()
+    if key not in categories:
+        with conn.cursor() as cursor:
+            cursor.execute("INSERT INTO Категории (Название_категории) VALUES (%s)", (name,))
+            categories[key] = cursor.lastrowid
+        conn.commit()
+        report.categories += 1
+    return categories[key]
+
+
+def _flush(conn, batch, report):
+    # Записывает пачку (номер строки, товар) одной транзакцией
+    skus = [product['sku'] for _, product in batch if product['sku']]
+    conn.begin()
+    try:
+        with conn.cursor() as cursor:
+            existing = set()
+            if skus:
+                cursor.execute(existing_query(len(skus)), skus)
+                existing = {row['Артикул'].lower() for row in cursor.fetchall()}
+            values = []
+            for _, product in batch:
+                is_new = not product['sku'] or product['sku'].lower() not in existing
+                values.append((product['sku'], product['name'], product['description'], product['price'],
+                               product['category_id'],
+                               product['image'] or (DEFAULT_IMAGE if is_new else None),
+                               product['active'] if product['active'] is not None or not is_new else 1))
+            cursor.executemany(UPSERT_QUERY, values)
+        conn.commit()
+    except Exception as ex:
+        conn.rollback()
+        print("Ошибка записи товаров при импорте:", ex)
+        for line, _ in batch:
+            report.error(line, f"не записано: {ex}")
+        batch.clear()
+        return
+    report.updated += len(existing)
+    report.created += len(batch) - len(existing)
+    batch.clear()
+
+
+def import_products(conn, rows, report, pipeline=None, archive=None, batch_size=IMPORT_BATCH):
+    # Импортирует товары из read_rows() в БД (соединение с autocommit и DictCursor).
+    # pipeline — ImagePipeline для изображений, archive — zipfile.ZipFile или None.
+    # Итоги пишутся в report; ImportFileError из файла прерывает импорт после записанных пачек
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT ID_Категории, Название_категории FROM Категории")
+        categories = {}
+        for row in cursor.fetchall():
+            categories.setdefault(row['Название_категории'].strip().lower(), row['ID_Категории'])
+    images = _Images(pipeline, archive, report)
+    batch = []
+    batch_skus = set()
+    try:
+        for line, values in rows:
+            report.rows += 1
+            try:
+                if isinstance(values, str):
+                    raise ImportFileError(values)
+                product = parse_product(values)
+                if product['image']:
+                    product['image'] = images.resolve(product['image'])
+            except ImportFileError as ex:
+                report.error(line, str(ex))
+                continue
+            product['category_id'] = _category_id(conn, categories, product['category'], report)
+            sku = product['sku'].lower() if product['sku'] else None
+            if sku in batch_skus:
+                # Повтор артикула в одной пачке: сначала записываем предыдущий, этот его обновит
+                _flush(conn, batch, report)
+                batch_skus.clear()
+            batch.append((line, product))
+            if sku:
+                batch_skus.add(sku)
+            if len(batch) >= batch_size:
+                _flush(conn, batch, report)
+                batch_skus.clear()
+    finally:
+        if batch:
+            _flush(conn, batch, report)
+        report.finish()
+    return report
+
+
+def text_stream(stream):
+    # Текст загруженного файла: BOM (Excel) отбрасывается, переводы строк внутри полей CSV сохраняются
+    return io.TextIOWrapper(stream, encoding='utf-8-sig', errors='replace', newline='')
+
+
+def main(argv):
+    from config import host, user, password, port, db_name, import_batch_size, image_max_upload_mb, upload_folder
+    from catalog import CatalogCache
+    from images import ImagePipeline
+
+    if len(argv) not in (2, 3) or file_format(argv[1]) is None:
+        print("Использование: python catalog_import.py <файл.csv|файл.jsonl> [архив_изображений.zip]")
+        return 2
+
+    folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), upload_folder)
+    pipeline = ImagePipeline(folder, max_bytes=image_max_upload_mb * 1024 * 1024)
+    conn = db.connect(host=host, port=port, user=user, password=password,
+                      database=db_name, cursorclass=db.cursors.DictCursor, autocommit=True)
+    report = ImportReport()
+    try:
+        archive = open_archive(argv[2]) if len(argv) == 3 else None
+        with open(argv[1], 'rb') as f:
+            import_products(conn, read_rows(text_stream(f), file_format(argv[1])), report,
+                            pipeline, archive, import_batch_size)
+    except ImportFileError as ex:
+        print("Ошибка импорта:", ex)
+        return 1
+    finally:
+        if report.created or report.updated:
+            CatalogCache().bump(conn)
+        conn.close()
+    for line, message in report.errors:
+        print(f"Строка {line}: {message}")
+    print(report.summary())
+    return 1 if report.failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -1,5 +1,93 @@
+import os
+
 host = "localhost"
 user = "root"
 password = ""
 port = 3306
-db_name = "SoftKeyDB"
\ No newline at end of file
+db_name = "SoftKeyDB"
+
+# Приложение (см. create_app() в app.py)
+secret_key = os.environ.get('SOFTKEY_SECRET_KEY', 'softkey_secret_key')  # ключ подписи сессий; в продакшене — своя переменная окружения
+upload_folder = os.path.join('static', 'images')  # папка изображений товаров (относительно папки приложения)
+warm_up_on_start = True   # загружать каталог и компилировать шаблоны при создании приложения
+
+# Пул соединений с БД
+pool_min_size = 2          # сколько соединений держать открытыми постоянно
+pool_max_size = 20         # верхняя граница одновременно открытых соединений
+pool_timeout = 5           # сколько секунд ждать свободное соединение
+pool_recycle = 3600        # пересоздавать соединение старше N секунд
+pool_idle_timeout = 300    # закрывать соединение, простаивавшее дольше N секунд
+pool_ping_interval = 30    # проверять (ping) соединение, если оно простаивало дольше N секунд
+
+# Реплики только для чтения (витрина, карточка товара, история заказов, отчеты и выгрузки админки).
+# Пустой список — все запросы идут на основной сервер. Не указанные параметры берутся у основного:
+# db_replicas = [{'host': '127.0.0.1', 'port': 3307}, {'host': '10.0.0.12', 'port': 3306, 'user': 'reader'}]
+# Сервер без репликации (пустой SHOW REPLICA STATUS) не используется; копию для чтения, которую обновляют
+# иначе, нужно объявить явно: {'host': '10.0.0.13', 'standalone': True}
+db_replicas = []
+replica_max_lag = 5              # не читать с реплики, отстающей больше N секунд
+replica_lag_check_interval = 2   # как часто проверять отставание реплики (секунды)
+replica_retry_after = 30         # не обращаться к реплике N секунд после ошибки подключения
+read_your_writes_seconds = 10    # после записи сессия N секунд читает с основного сервера (не меньше replica_max_lag)
+
+# Кэш каталога
+catalog_cache_ttl = 300               # принудительно перечитывать каталог раз в N секунд
+catalog_version_check_interval = 2    # как часто сверять версию каталога с БД (секунды)
+
+# Кэш готовых страниц каталога для анонимных посетителей
+page_cache_max_entries = 2000   # сколько страниц (адрес + параметры) хранить
+page_cache_max_mb = 64          # ограничение суммарного размера страниц (МБ)
+
+# Кэш фрагментов шаблонов ({% cache %}, см. fragments.py) и скомпилированные шаблоны на диске
+fragment_cache_max_entries = 5000             # сколько фрагментов хранить
+fragment_cache_max_mb = 32                    # ограничение суммарного размера фрагментов (млн символов)
+fragment_cache_ttl = 300                      # срок жизни фрагмента, если в теге не указан свой (секунды)
+template_bytecode_dir = '.template_cache'     # папка байт-кода шаблонов в папке приложения (None — не сохранять)
+
+# Размеры страниц (параметр per_page в запросе ограничен max_page_size)
+catalog_page_size = 24
+admin_page_size = 50
+orders_page_size = 10       # заказов на странице "Мои заказы"
+keys_page_size = 50         # ключей в одной порции при раскрытии позиции заказа
+max_page_size = 100
+
+# Склад лицензионных ключей
+key_low_stock_threshold = 20   # предупреждать, если свободных ключей товара меньше N
+key_load_batch_size = 1000     # сколько ключей вставлять за один INSERT при загрузке
+export_batch_size = 1000       # сколько строк выгрузки читать из БД и отправлять за раз
+export_net_write_timeout = 600 # сек: сколько сервер MySQL ждет медленного клиента выгрузки
+
+# Импорт товаров из CSV / JSON Lines (/admin/import, см. catalog_import.py)
+import_batch_size = 500        # сколько товаров записывать одним INSERT (и одной транзакцией)
+import_max_upload_mb = 200     # максимальный размер файла импорта вместе с архивом изображений (МБ)
+import_errors_shown = 5        # сколько ошибок по строкам показывать в админ-панели (все — в консоли сервера)
+
+# Выдача ключей оформленным заказам в фоне (см. fulfilment.py)
+fulfilment_workers = 2          # потоков-обработчиков в каждом процессе (0 — только python fulfilment.py worker)
+fulfilment_poll_interval = 1    # как часто проверять очередь, если новых заказов нет (секунды)
+fulfilment_batch_size = 10      # сколько заданий забирать за раз
+fulfilment_max_attempts = 5     # после стольких неудачных попыток заказ получает статус 'Ошибка'
+fulfilment_lease_seconds = 60   # задание упавшего обработчика возвращается в очередь через N секунд
+fulfilment_retry_delay = 5      # пауза перед первым повтором (секунды), дальше удваивается
+
+# Проверка лицензионных ключей (/api/licenses, см. licenses.py)
+license_index_check_interval = 1   # как часто догружать из БД новые выданные ключи (секунды)
+license_index_ttl = 3600           # полностью перестраивать индекс ключей раз в N секунд
+license_batch_max = 1000           # сколько ключей можно проверить одним запросом
+license_api_tokens = []            # токены для заголовка Authorization: Bearer (пустой список — доступ всем)
+
+# Корзины: изменения копятся в локальном хранилище и записываются в БД в фоне
+cart_store_backend = 'memory'        # 'memory' — в памяти процесса (один воркер), 'sqlite' — общий файл для воркеров сервера
+cart_store_path = 'carts.sqlite3'    # файл хранилища 'sqlite'
+cart_store_max_users = 100000        # сколько корзин держать в памяти ('memory')
+cart_flush_interval = 2              # как часто записывать измененные корзины в БД (секунды)
+cart_flush_batch_size = 500          # сколько корзин записывать за одну транзакцию
+
+# Изображения товаров
+image_max_upload_mb = 10    # максимальный размер загружаемого изображения (МБ)
+image_workers = 2           # процессы для нарезки уменьшенных копий
+
+# Метрики и журнал медленных запросов
+slow_request_threshold = 0.5              # записывать в журнал запросы дольше N секунд (0 — не писать)
+slow_request_log = 'slow_requests.log'    # файл журнала (None — вывод в консоль)
+metrics_allowed_ips = ['127.0.0.1', '::1']  # кому доступен /metrics (пустой список — всем)
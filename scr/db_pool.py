@@ -0,0 +1,230 @@
+import os
+import threading
+import time
+from collections import deque
+
+import pymysql as db
+from pymysql.constants import SERVER_STATUS
+
+# Как часто (в секундах) проверять свободные соединения на устаревание
+PRUNE_INTERVAL = 60
+
+
+class PoolTimeout(Exception):
+    # Все соединения заняты и ни одно не освободилось за отведенное время
+    pass
+
+
+class _PooledConnection:
+    # Обертка над соединением: помним, когда оно создано и когда вернулось в пул
+    __slots__ = ('conn', 'created_at', 'released_at')
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.created_at = time.monotonic()
+        self.released_at = self.created_at
+
+
+class ConnectionPool:
+    """Пул соединений с MySQL: min/max размер, проверка при выдаче, переработка старых соединений."""
+
+    def __init__(self, connect_kwargs, min_size=1, max_size=10, timeout=5.0,
+                 recycle=3600, idle_timeout=300, ping_interval=30):
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError("Неверные размеры пула: min=%s, max=%s" % (min_size, max_size))
+        self.connect_kwargs = connect_kwargs
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.recycle = recycle
+        self.idle_timeout = idle_timeout
+        self.ping_interval = ping_interval
+
+        self._lock = threading.Condition(threading.Lock())
+        self._idle = deque()
+        self._in_use = {}  # id(conn) -> _PooledConnection
+        self._size = 0     # выданные + свободные + создающиеся прямо сейчас
+        self._pid = os.getpid()
+        self._filled = False  # min_size соединений уже открывались в этом процессе
+        self._last_prune = time.monotonic()
+        self.timeouts = 0  # сколько раз не дождались свободного соединения
+
+    # --- Служебные методы ---
+
+    def _connect(self):
+        return _PooledConnection(db.connect(**self.connect_kwargs))
+
+    @staticmethod
+    def _close_quietly(pooled):
+        try:
+            pooled.conn.close()
+        except Exception:
+            pass
+
+    def _check_fork(self):
+        # После fork() сокеты родителя нельзя использовать (и нельзя закрывать через COM_QUIT),
+        # поэтому просто забываем о них и начинаем с пустого пула
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._lock = threading.Condition(threading.Lock())
+            self._idle = deque()
+            self._in_use = {}
+            self._size = 0
+            self._filled = False
+
+    def _is_expired(self, pooled, now, idle=True):
+        if self.recycle and now - pooled.created_at > self.recycle:
+            return True
+        if idle and self.idle_timeout and now - pooled.released_at > self.idle_timeout:
+            return True
+        return False
+
+    def _is_healthy(self, pooled, now):
+        # Пингуем только соединения, которые простаивали дольше ping_interval,
+        # чтобы не добавлять лишний запрос к каждой выдаче
+        if now - pooled.released_at < self.ping_interval:
+            return pooled.conn.open
+        try:
+            pooled.conn.ping(reconnect=False)
+            return True
+        except Exception:
+            return False
+
+    # --- Публичный интерфейс ---
+
+    def fill(self):
+        # Заранее открываем min_size соединений; acquire() вызывает его при первой выдаче в процессе
+        self._check_fork()
+        self._filled = True
+        while True:
+            with self._lock:
+                if self._size >= self.min_size:
+                    return
+                self._size += 1
+            try:
+                pooled = self._connect()
+            except Exception:
+                with self._lock:
+                    self._size -= 1
+                    self._lock.notify()
+                raise
+            with self._lock:
+                self._idle.append(pooled)
+                self._lock.notify()
+
+    def acquire(self):
+        self._check_fork()
+        if not self._filled:
+            # Первая выдача в процессе (в том числе в воркере после fork): сразу открываем
+            # min_size соединений. Если БД недоступна, ошибку покажет обычная выдача ниже
+            self._filled = True
+            try:
+                self.fill()
+            except Exception:
+                pass
+        deadline = time.monotonic() + self.timeout
+
+        while True:
+            pooled = None
+            create = False
+            with self._lock:
+                while True:
+                    if self._idle:
+                        pooled = self._idle.pop()  # LIFO: самые "теплые" соединения
+                        break
+                    if self._size < self.max_size:
+                        self._size += 1
+                        create = True
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.timeouts += 1
+                        raise PoolTimeout("Нет свободных соединений за %.1f с" % self.timeout)
+                    self._lock.wait(remaining)
+
+            if create:
+                try:
+                    pooled = self._connect()
+                except Exception:
+                    with self._lock:
+                        self._size -= 1
+                        self._lock.notify()
+                    raise
+            else:
+                now = time.monotonic()
+                if self._is_expired(pooled, now) or not self._is_healthy(pooled, now):
+                    self._close_quietly(pooled)
+                    with self._lock:
+                        self._size -= 1
+                        self._lock.notify()
+                    continue
+
+            with self._lock:
+                self._in_use[id(pooled.conn)] = pooled
+            return pooled.conn
+
+    def release(self, conn, discard=False):
+        if self._pid != os.getpid():
+            return
+        with self._lock:
+            pooled = self._in_use.pop(id(conn), None)
+        if pooled is None:
+            return
+
+        if not discard and conn.open:
+            # Незавершенная транзакция не должна уехать к следующему запросу
+            try:
+                if conn.server_status & SERVER_STATUS.SERVER_STATUS_IN_TRANS:
+                    conn.rollback()
+            except Exception:
+                discard = True
+        if discard or not conn.open or self._is_expired(pooled, time.monotonic(), idle=False):
+            self._close_quietly(pooled)
+            with self._lock:
+                self._size -= 1
+                self._lock.notify()
+            return
+
+        pooled.released_at = time.monotonic()
+        with self._lock:
+            self._idle.append(pooled)
+            self._lock.notify()
+
+        if pooled.released_at - self._last_prune > PRUNE_INTERVAL:
+            self._last_prune = pooled.released_at
+            self.prune()
+
+    def prune(self):
+        # Закрываем простаивающие соединения сверх min_size, которые пора переработать
+        now = time.monotonic()
+        expired = []
+        with self._lock:
+            keep = deque()
+            for pooled in self._idle:
+                if self._size - len(expired) > self.min_size and self._is_expired(pooled, now):
+                    expired.append(pooled)
+                else:
+                    keep.append(pooled)
+            self._idle = keep
+            self._size -= len(expired)
+            if expired:
+                self._lock.notify_all()
+        for pooled in expired:
+            self._close_quietly(pooled)
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = list(self._idle), deque()
+            self._size -= len(idle)
+        for pooled in idle:
+            self._close_quietly(pooled)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': self._size,
+                'idle': len(self._idle),
+                'in_use': len(self._in_use),
+                'max_size': self.max_size,
+                'timeouts': self.timeouts,
+            }
@@ -0,0 +1,214 @@
+import threading
+import time
+
+import pymysql as db
+
+# Чтение с реплик. Запросы только на чтение (витрина, карточка товара, история заказов,
+# отчеты админки, выгрузки) идут на реплики из config.db_replicas по очереди, запись и
+# все остальное — на основной сервер. Реплика пропускается, если она отстает больше
+# max_lag секунд (отставание проверяется не чаще check_interval) или к ней не удалось
+# подключиться (тогда она не используется retry_after секунд). Если подходящей реплики
+# нет, чтение идет на основной сервер.
+#
+# Чтобы после записи пользователь сразу видел свои изменения (новый заказ, правку товара),
+# время записи сохраняется в сессии, и в течение sticky-интервала эта сессия читает
+# только с основного сервера.
+
+# Запросы состояния репликации: новое название (MySQL 8.0.22+, MariaDB 10.5.1+) и старое
+LAG_QUERIES = ("SHOW REPLICA STATUS", "SHOW SLAVE STATUS")
+LAG_COLUMNS = ('Seconds_Behind_Source', 'Seconds_Behind_Master')
+
+# Реплика отвечает только на чтение: случайная запись завершится ошибкой, а не разойдется с основным сервером
+READ_ONLY_INIT = "SET SESSION TRANSACTION READ ONLY"
+
+# Параметр реплики в config.db_replicas: сервер без репликации (копия для чтения,
+# которую обновляют вручную) — разрешает читать с него, хотя состояние репликации пустое
+STANDALONE_KEY = 'standalone'
+
+# Ключ сессии с временем последней записи (время по часам сервера, общее для всех воркеров)
+WRITTEN_AT_KEY = 'db_written_at'
+
+
+def mark_written(session):
+    session[WRITTEN_AT_KEY] = time.time()
+
+
+def is_sticky(session, seconds):
+    written_at = session.get(WRITTEN_AT_KEY)
+    return written_at is not None and time.time() - written_at < seconds
+
+
+def replica_settings(primary, replica):
+    # Параметры подключения к реплике: как у основного сервера, кроме указанных в config.db_replicas
+    settings = dict(primary)
+    settings.update(replica)
+    settings['init_command'] = READ_ONLY_INIT
+    return settings
+
+
+def lag_from_row(row, standalone=False):
+    # Отставание в секундах по строке SHOW REPLICA STATUS; None — репликация остановлена.
+    # Пустой ответ — сервер не реплика (репликацию сбросили или адрес указан с ошибкой),
+    # с него не читаем, если он явно не объявлен копией для чтения (standalone)
+    if not row:
+        return 0 if standalone else None
+    for column in LAG_COLUMNS:
+        if column in row:
+            return row[column]
+    return None
+
+
+def replica_lag(cursor, standalone=False):
+    for query in LAG_QUERIES:
+        try:
+            cursor.execute(query)
+        except db.MySQLError:
+            continue  # старый сервер не знает SHOW REPLICA, MySQL 8.4 — SHOW SLAVE
+        return lag_from_row(cursor.fetchone(), standalone)
+    return None
+
+
+class Replica:
+    # Состояние одной реплики: последнее отставание и время, до которого она отключена
+    def __init__(self, name, settings):
+        self.name = name
+        self.settings = dict(settings)  # параметры подключения
+        self.standalone = bool(self.settings.pop(STANDALONE_KEY, False))
+        self.lag = None
+        self.lagging = False
+        self.checked_at = None
+        self.down_until = 0
+        self.reads = 0
+        self.failures = 0
+
+
+class ReplicaSet:
+    """Реплики для чтения и выбор подходящей: по очереди, без отстающих и недоступных."""
+
+    def __init__(self, replicas, max_lag=5, check_interval=2, retry_after=30):
+        self.replicas = [Replica(f"{r.get('host')}:{r.get('port')}", r) for r in replicas]
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.retry_after = retry_after
+        self.fallbacks = 0  # сколько раз читали с основного сервера из-за отсутствия реплики
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def __bool__(self):
+        return bool(self.replicas)
+
+    def __iter__(self):
+        return iter(self.replicas)
+
+    def candidates(self):
+        # Реплики в порядке очереди; отстающие — только если пора снова проверить отставание
+        now = time.monotonic()
+        with self._lock:
+            start = self._next
+            self._next = (self._next + 1) % max(len(self.replicas), 1)
+        ordered = self.replicas[start:] + self.replicas[:start]
+        return [r for r in ordered
+                if r.down_until <= now and (not r.lagging or self.needs_check(r, now))]
+
+    def needs_check(self, replica, now=None):
+        now = time.monotonic() if now is None else now
+        return replica.checked_at is None or now - replica.checked_at >= self.check_interval
+
+    def record_lag(self, replica, lag):
+        # Запоминает отставание; возвращает True, если с реплики можно читать
+        replica.lag = lag
+        replica.checked_at = time.monotonic()
+        replica.lagging = lag is None or lag > self.max_lag
+        return not replica.lagging
+
+    def mark_failed(self, replica, ex):
+        print(f"Ошибка реплики {replica.name}:", ex)
+        replica.failures += 1
+        replica.down_until = time.monotonic() + self.retry_after
+
+    def mark_read(self, replica):
+        replica.reads += 1
+
+    def stats(self):
+        now = time.monotonic()
+        return {replica.name: {
+            'lag': replica.lag,
+            'checked': replica.checked_at is not None,
+            'available': replica.down_until <= now and not replica.lagging,
+            'reads': replica.reads,
+            'failures': replica.failures,
+        } for replica in self.replicas}
+
+
+class ReadRouter:
+    """Соединения для чтения из пулов реплик (db_pool.ConnectionPool на каждую реплику)."""
+
+    def __init__(self, replica_set, pool_factory):
+        self.replicas = replica_set
+        self._pools = {replica.name: pool_factory(replica.settings) for replica in replica_set}
+        self._owners = {}  # id(conn) -> пул, из которого оно взято
+
+    def __bool__(self):
+        return bool(self.replicas)
+
+    def _check(self, replica, conn):
+        if not self.replicas.needs_check(replica):
+            return True
+        with conn.cursor() as cursor:
+            return self.replicas.record_lag(replica, replica_lag(cursor, replica.standalone))
+
+    def acquire(self):
+        # Соединение с подходящей репликой или None — тогда читать с основного сервера
+        for replica in self.replicas.candidates():
+            pool = self._pools[replica.name]
+            try:
+                conn = pool.acquire()
+            except Exception as ex:
+                self.replicas.mark_failed(replica, ex)
+                continue
+            try:
+                usable = self._check(replica, conn)
+            except Exception as ex:
+                pool.release(conn, discard=True)
+                self.replicas.mark_failed(replica, ex)
+                continue
+            if not usable:
+                pool.release(conn)
+                continue
+            self.replicas.mark_read(replica)
+            self._owners[id(conn)] = pool
+            return conn
+        self.replicas.fallbacks += 1
+        return None
+
+    def release(self, conn, discard=False):
+        pool = self._owners.pop(id(conn), None)
+        if pool is not None:
+            pool.release(conn, discard)
+
+    def connect(self, **overrides):
+        # Отдельное соединение (не из пула) с подходящей репликой или None — для долгих выгрузок
+        for replica in self.replicas.candidates():
+            try:
+                conn = db.connect(**dict(replica.settings, **overrides))
+            except Exception as ex:
+                self.replicas.mark_failed(replica, ex)
+                continue
+            try:
+                with conn.cursor(db.cursors.DictCursor) as cursor:
+                    usable = (not self.replicas.needs_check(replica)
+                              or self.replicas.record_lag(replica, replica_lag(cursor, replica.standalone)))
+            except Exception as ex:
+                conn.close()
+                self.replicas.mark_failed(replica, ex)
+                continue
+            if usable:
+                self.replicas.mark_read(replica)
+                return conn
+            conn.close()
+        self.replicas.fallbacks += 1
+        return None
+
+    def close(self):
+        for pool in self._pools.values():
+            pool.close()
@@ -0,0 +1,277 @@
+import ast
+import os
+import re
+import sys
+from datetime import date
+
+import pymysql as db
+
+import exports
+
+# Проверка планов запросов: выполняет EXPLAIN для каждого SQL-запроса приложения и
+# сообщает о полных просмотрах больших таблиц (type = ALL). Запросы берутся прямо из
+# исходного кода, поэтому новый запрос без подходящего индекса будет замечен сразу.
+#
+# Запускать на базе с реалистичным объемом данных: на нескольких тестовых строках
+# оптимизатор честно выбирает полный просмотр, и такие таблицы пропускаются (--min-rows).
+#
+# Запуск из командной строки:
+#   python explain_check.py [--min-rows N] [-v]
+# Код возврата 1, если найден хотя бы один полный просмотр.
+# Та же проверка как тест (пропускается, если БД недоступна): python -m pytest tests
+
+# Модули, из которых собираются запросы. db_router.py не проверяется: в нем только
+# SHOW REPLICA STATUS, для которого EXPLAIN не строится
+MODULES = ['app.py', 'async_app.py', 'catalog.py', 'cart_store.py', 'rollups.py', 'keystore.py', 'fulfilment.py',
+           'licenses.py', 'catalog_import.py', 'exports.py']
+
+# Классы, запросы которых идут не в MySQL (локальное хранилище корзин на SQLite)
+SKIP_CLASSES = {'SqliteBackend'}
+
+# Константы с запросами, которые читают всю таблицу намеренно: пересчет сводок из истории,
+# выгрузка без фильтров (выгрузки за период проверяются отдельно, см. export_statements),
+# загрузка всего каталога в память (catalog.py) и полная загрузка индекса лицензий (licenses.py)
+SKIP_CONSTANTS = {'HISTORY_QUERIES', 'EXPORT_QUERIES', 'CATALOG_QUERY', 'LICENSES_QUERY'}
+
+# Период, с которым проверяются запросы выгрузок
+EXPORT_SAMPLE_FILTERS = {'date_from': date(2024, 1, 1), 'date_to': date(2024, 1, 31)}
+
+# Справочники, которые всегда маленькие: их полный просмотр не считается ошибкой
+SMALL_TABLES = {'Роли', 'Категории', 'Счетчики', 'Версии_кэша', 'Сводка_категории', 'Миграции'}
+
+# Полный просмотр таблицы меньше этого числа строк (по оценке EXPLAIN) не считается ошибкой
+MIN_ROWS = 1000
+
+SQL_START_RE = re.compile(r'^\s*(SELECT|UPDATE|DELETE|INSERT|REPLACE)\b', re.IGNORECASE)
+TABLE_RE = re.compile(r'\b(?:FROM|JOIN|UPDATE|INTO)\s+(\w+)(?:\s+(?:AS\s+)?(\w+))?', re.IGNORECASE)
+# Заменяются за один проход: %s — параметр; %%s — параметр в шаблоне, который сначала
+# форматируется через % (fulfilment.lease_query); %% — литеральный процент
+PLACEHOLDER_RE = re.compile(r'%%s|%%|%s')
+LOCKING_RE = re.compile(r'\s+FOR\s+UPDATE(\s+SKIP\s+LOCKED|\s+NOWAIT)?', re.IGNORECASE)
+KEYWORDS = {'where', 'join', 'left', 'right', 'inner', 'on', 'group', 'order', 'limit', 'set',
+            'values', 'select', 'for', 'having', 'union', 'and', 'or', 'using', 'straight_join'}
+
+
+class Statement:
+    def __init__(self, module, line, sql):
+        self.module = module
+        self.line = line
+        self.sql = sql
+
+    @property
+    def location(self):
+        return f"{self.module}:{self.line}"
+
+
+# --- Сбор запросов из исходного кода ---
+
+def _string_value(node):
+    # Строковая константа, в том числе "..." % (...) — берем шаблон слева
+    if isinstance(node, ast.Constant) and isinstance(node.value, str):
+        return node.value
+    if isinstance(node, ast.BinOp) and isinstance(node.op, ast.Mod):
+        return _string_value(node.left)
+    return None
+
+
+def _assigned_strings(func):
+    # Имя переменной -> SQL, собранный из всех присваиваний в функции (sql = ...; sql += ...)
+    values = {}
+    nodes = [n for n in ast.walk(func) if isinstance(n, (ast.Assign, ast.AugAssign))]
+    for node in sorted(nodes, key=lambda n: (n.lineno, n.col_offset)):
+        if isinstance(node, ast.Assign) and len(node.targets) == 1 and isinstance(node.targets[0], ast.Name):
+            text = _string_value(node.value)
+            if text is not None:
+                values[node.targets[0].id] = text
+        elif isinstance(node, ast.AugAssign) and isinstance(node.target, ast.Name):
+            text = _string_value(node.value)
+            if text is not None and node.target.id in values:
+                values[node.target.id] += text
+    return values
+
+
+def _keyset_sql(call, sql, columns_arg):
+    # fetch_keyset(cursor, sql, params, columns, ...) и keyset_query(sql, params, columns, ...)
+    # дописывают ORDER BY по columns и LIMIT
+    try:
+        columns = ast.literal_eval(call.args[columns_arg])
+    except (IndexError, ValueError):
+        return sql
+    return sql + " ORDER BY " + ", ".join(columns) + " LIMIT %s"
+
+
+def _is_sql(text):
+    return text is not None and SQL_START_RE.match(text)
+
+
+def _constant_statements(tree, module):
+    # Запросы, вынесенные в константы модуля (строки и словари строк) и в функции,
+    # которые возвращают текст запроса
+    statements = []
+    for node in tree.body:
+        if not (isinstance(node, ast.Assign) and len(node.targets) == 1
+                and isinstance(node.targets[0], ast.Name)) or node.targets[0].id in SKIP_CONSTANTS:
+            continue
+        values = node.value.values if isinstance(node.value, ast.Dict) else [node.value]
+        for value in values:
+            text = _string_value(value)
+            if _is_sql(text):
+                statements.append(Statement(module, value.lineno, text))
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Return) and node.value is not None:
+            text = _string_value(node.value)
+            if _is_sql(text):
+                statements.append(Statement(module, node.lineno, text))
+    return statements
+
+
+def collect_statements(path):
+    with open(path, encoding='utf-8') as f:
+        tree = ast.parse(f.read(), path)
+    tree.body = [node for node in tree.body
+                 if not (isinstance(node, ast.ClassDef) and node.name in SKIP_CLASSES)]
+    module = os.path.basename(path)
+    statements = _constant_statements(tree, module)
+    functions = [n for n in ast.walk(tree) if isinstance(n, (ast.FunctionDef, ast.AsyncFunctionDef))]
+    for func in functions:
+        variables = _assigned_strings(func)
+        for node in ast.walk(func):
+            if not isinstance(node, ast.Call) or not node.args:
+                continue
+            name = getattr(node.func, 'attr', None) or getattr(node.func, 'id', None)
+            if name in ('execute', 'executemany'):
+                arg = node.args[0]
+            elif name == 'fetch_keyset' and len(node.args) > 1:
+                arg = node.args[1]
+            elif name == 'keyset_query':
+                arg = node.args[0]
+            else:
+                continue
+            sql = _string_value(arg)
+            if sql is None and isinstance(arg, ast.Name):
+                sql = variables.get(arg.id)
+            if not _is_sql(sql):
+                continue
+            if name == 'fetch_keyset':
+                sql = _keyset_sql(node, sql, 3)
+            elif name == 'keyset_query':
+                sql = _keyset_sql(node, sql, 2)
+            statements.append(Statement(module, node.lineno, sql))
+    # Вложенные функции обходятся дважды — оставляем по одному запросу на строку
+    unique = {(s.module, s.line): s for s in statements}
+    return sorted(unique.values(), key=lambda s: s.line)
+
+
+def export_statements():
+    # Запросы выгрузок собираются из частей (exports.export_query) — проверяем их
+    # в обычном виде: за период, с настоящими датами вместо заглушек bind_sample
+    statements = []
+    for kind in exports.EXPORT_QUERIES:
+        sql, params = exports.export_query(kind, EXPORT_SAMPLE_FILTERS)
+        statements.append(Statement('exports.py', kind, sql % tuple(f"'{value}'" for value in params)))
+    return statements
+
+
+def all_statements():
+    # Все проверяемые запросы приложения (для main и tests/test_explain.py)
+    here = os.path.dirname(os.path.abspath(__file__))
+    statements = []
+    for module in MODULES:
+        statements.extend(collect_statements(os.path.join(here, module)))
+    statements.extend(export_statements())
+    return statements
+
+
+def explainable(sql):
+    # INSERT ... VALUES ничего не читает, план есть только у INSERT ... SELECT
+    head = sql.lstrip().split(None, 1)[0].upper()
+    return head not in ('INSERT', 'REPLACE') or re.search(r'\bSELECT\b', sql, re.IGNORECASE)
+
+
+def bind_sample(sql):
+    # EXPLAIN нужен запрос с конкретными значениями: подставляем одинаковые заглушки.
+    # Строка '1' подходит и для числовых, и для строковых колонок и не мешает индексу
+    sql = LOCKING_RE.sub('', sql)
+    sql = re.sub(r'\bLIMIT\s+%s', 'LIMIT 10', sql, flags=re.IGNORECASE)
+    return PLACEHOLDER_RE.sub(lambda m: '%' if m.group() == '%%' else "'1'", sql)
+
+
+def table_aliases(sql):
+    aliases = {}
+    for table, alias in TABLE_RE.findall(LOCKING_RE.sub('', sql)):
+        aliases[table] = table
+        if alias and alias.lower() not in KEYWORDS:
+            aliases[alias] = table
+    return aliases
+
+
+# --- Проверка планов ---
+
+def full_scans(cursor, statement, min_rows=MIN_ROWS):
+    # Возвращает строки плана с полным просмотром большой таблицы
+    cursor.execute("EXPLAIN " + bind_sample(statement.sql))
+    aliases = table_aliases(statement.sql)
+    problems = []
+    for row in cursor.fetchall():
+        alias = row.get('table') or ''
+        if alias.startswith('<'):
+            continue  # производные таблицы и UNION — их источники проверяются отдельными строками
+        table = aliases.get(alias, alias)
+        if row.get('type') == 'ALL' and table not in SMALL_TABLES and (row.get('rows') or 0) >= min_rows:
+            row['real_table'] = table
+            problems.append(row)
+    return problems
+
+
+def check(conn, statements, min_rows=MIN_ROWS, verbose=False):
+    # Возвращает число запросов с полным просмотром
+    failed = 0
+    with conn.cursor() as cursor:
+        for statement in statements:
+            if not explainable(statement.sql):
+                continue
+            try:
+                problems = full_scans(cursor, statement, min_rows)
+            except db.MySQLError as ex:
+                print(f"{statement.location}: не удалось выполнить EXPLAIN: {ex}")
+                failed += 1
+                continue
+            if problems:
+                failed += 1
+                for row in problems:
+                    print(f"{statement.location}: полный просмотр {row['real_table']} "
+                          f"(~{row.get('rows')} строк, possible_keys={row.get('possible_keys')})")
+                if verbose:
+                    print(statement.sql.strip())
+            elif verbose:
+                print(f"{statement.location}: OK")
+    return failed
+
+
+def main(argv):
+    from config import host, user, password, port, db_name
+
+    min_rows = MIN_ROWS
+    verbose = '-v' in argv
+    if '--min-rows' in argv:
+        try:
+            min_rows = int(argv[argv.index('--min-rows') + 1])
+        except (IndexError, ValueError):
+            print("Использование: python explain_check.py [--min-rows N] [-v]")
+            return 2
+
+    statements = all_statements()
+    conn = db.connect(host=host, port=port, user=user, password=password,
+                      database=db_name, cursorclass=db.cursors.DictCursor, autocommit=True)
+    try:
+        failed = check(conn, statements, min_rows, verbose)
+    finally:
+        conn.close()
+
+    checked = sum(1 for s in statements if explainable(s.sql))
+    print(f"Проверено запросов: {checked}, с полным просмотром: {failed}")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,163 @@
+import csv
+import io
+import json
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+# Выгрузка заказов, позиций и лицензий для бухгалтерии (CSV или JSON Lines).
+# Выгрузка за длинный период — миллионы строк, поэтому запрос читается небуферизованным
+# курсором (SSDictCursor) на отдельном соединении: строки приходят с сервера по мере
+# чтения и сразу уходят клиенту, память воркера не зависит от объема выгрузки.
+# Соединение не берется из пула: пока результат не дочитан, по нему нельзя выполнять
+# другие запросы, а выгрузка может идти долго.
+
+# Запросы выгрузок: условия фильтров дописываются в WHERE, порядок — по дате заказа
+EXPORT_QUERIES = {
+    'orders': """
+        SELECT z.ID_Заказа, z.Дата_заказа, z.Статус, z.Итоговая_сумма,
+               z.ID_Пользователя, p.Логин, p.Фамилия, p.Имя
+        FROM Заказы z
+        JOIN Пользователи p ON z.ID_Пользователя = p.ID_Пользователя
+    """,
+    'lines': """
+        SELECT sz.ID_Позиции, sz.ID_Заказа, z.Дата_заказа, z.Статус, sz.ID_Товара, t.Название,
+               k.Название_категории, sz.Количество, sz.Цена_продажи, sz.Срок_лицензии_дни
+        FROM Заказы z
+        JOIN Состав_заказа sz ON sz.ID_Заказа = z.ID_Заказа
+        JOIN Товары t ON sz.ID_Товара = t.ID_Товара
+        LEFT JOIN Категории k ON t.ID_Категории = k.ID_Категории
+    """,
+    'licenses': """
+        SELECT l.ID_Лицензии, l.Лицензионный_ключ, l.Дата_активации, l.Дата_истечения,
+               sz.ID_Позиции, z.ID_Заказа, z.Дата_заказа, z.Статус, t.Название
+        FROM Заказы z
+        JOIN Состав_заказа sz ON sz.ID_Заказа = z.ID_Заказа
+        JOIN Товары t ON sz.ID_Товара = t.ID_Товара
+        JOIN Лицензии l ON l.ID_Позиции_заказа = sz.ID_Позиции
+    """,
+}
+
+# Сортировка выгрузок (индекс Заказы_дата), внутри заказа — по позициям и лицензиям
+EXPORT_ORDER = {
+    'orders': "z.Дата_заказа, z.ID_Заказа",
+    'lines': "z.Дата_заказа, z.ID_Заказа, sz.ID_Позиции",
+    'licenses': "z.Дата_заказа, z.ID_Заказа, sz.ID_Позиции, l.ID_Лицензии",
+}
+
+# Фильтр по категории: у заказа — хотя бы одна позиция из категории
+ORDER_CATEGORY_FILTER = """EXISTS (
+    SELECT 1 FROM Состав_заказа c_sz JOIN Товары c_t ON c_sz.ID_Товара = c_t.ID_Товара
+    WHERE c_sz.ID_Заказа = z.ID_Заказа AND c_t.ID_Категории = %s)"""
+
+FORMATS = {'csv': 'text/csv; charset=utf-8', 'jsonl': 'application/x-ndjson; charset=utf-8'}
+
+# Сколько строк читать с сервера и отправлять клиенту за раз
+EXPORT_BATCH = 1000
+
+
+class ExportError(ValueError):
+    pass
+
+
+def parse_filters(args):
+    # Фильтры из параметров запроса: date_from, date_to (ГГГГ-ММ-ДД, включительно),
+    # status, category. Неверное значение — ExportError
+    filters = {}
+    for name in ('date_from', 'date_to'):
+        value = (args.get(name) or '').strip()
+        if value:
+            try:
+                filters[name] = datetime.strptime(value, '%Y-%m-%d').date()
+            except ValueError:
+                raise ExportError(f"Неверная дата {name}: {value}")
+    status = (args.get('status') or '').strip()
+    if status:
+        filters['status'] = status
+    category = (args.get('category') or '').strip()
+    if category:
+        if not category.isdigit():
+            raise ExportError(f"Неверная категория: {category}")
+        filters['category'] = int(category)
+    return filters
+
+
+def export_query(kind, filters):
+    # Текст запроса выгрузки kind и параметры для фильтров
+    conditions = []
+    params = []
+    if 'date_from' in filters:
+        conditions.append("z.Дата_заказа >= %s")
+        params.append(filters['date_from'])
+    if 'date_to' in filters:
+        conditions.append("z.Дата_заказа < %s")
+        params.append(filters['date_to'] + timedelta(days=1))
+    if 'status' in filters:
+        conditions.append("z.Статус = %s")
+        params.append(filters['status'])
+    if 'category' in filters:
+        conditions.append(ORDER_CATEGORY_FILTER if kind == 'orders' else "t.ID_Категории = %s")
+        params.append(filters['category'])
+    sql = EXPORT_QUERIES[kind]
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    sql += " ORDER BY " + EXPORT_ORDER[kind]
+    return sql, tuple(params)
+
+
+def file_name(kind, fmt, filters):
+    period = '-'.join(filters[name].strftime('%Y%m%d') for name in ('date_from', 'date_to') if name in filters)
+    return f"{kind}_{period or 'all'}.{fmt}"
+
+
+def json_value(value):
+    # Суммы — строкой, чтобы не терять копейки на float
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} не сериализуется в JSON")
+
+
+def _csv_chunk(rows, header=None):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(header)
+    for row in rows:
+        writer.writerow(['' if value is None else value for value in row.values()])
+    return buffer.getvalue()
+
+
+def _jsonl_chunk(rows):
+    return ''.join(json.dumps(row, ensure_ascii=False, default=json_value) + '\n' for row in rows)
+
+
+def stream(conn, kind, fmt, filters, batch_size=EXPORT_BATCH):
+    # Генератор частей файла выгрузки. conn — отдельное соединение с курсором SSDictCursor,
+    # генератор закрывает его по окончании или при обрыве загрузки
+    sql, params = export_query(kind, filters)
+    try:
+        cursor = conn.cursor()
+        cursor.execute(sql, params)
+        first = True
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if fmt == 'csv':
+                if first:
+                    # BOM — чтобы Excel открыл файл в UTF-8; заголовок есть и у пустой выгрузки
+                    header = [column[0] for column in cursor.description]
+                    yield '\ufeff' + _csv_chunk(rows, header)
+                elif rows:
+                    yield _csv_chunk(rows)
+            elif rows:
+                yield _jsonl_chunk(rows)
+            first = False
+            if len(rows) < batch_size:
+                break
+    finally:
+        # Курсор не закрываем: SSCursor.close() дочитывает оставшиеся строки, а при
+        # обрыве загрузки их могут быть миллионы. Закрытие соединения прерывает запрос
+        try:
+            conn.close()
+        except Exception as ex:
+            print("Ошибка закрытия соединения выгрузки:", ex)
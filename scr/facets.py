@@ -0,0 +1,128 @@
+import threading
+from bisect import bisect_left, bisect_right, insort
+from decimal import Decimal, InvalidOperation
+
+# Счетчики для фильтров витрины: сколько активных товаров в каждой категории, диапазон цен
+# и гистограмма цен. Индекс хранит отсортированные списки цен по категориям и обновляется
+# вместе с поисковым индексом при перезагрузке каталога — только для добавленных,
+# измененных и исчезнувших товаров. Число товаров категории в диапазоне цен — два бинарных
+# поиска по ее списку; при поиске по тексту считаются только найденные товары.
+#
+# Счетчик категории учитывает поиск и диапазон цен, но не выбранную категорию (чтобы было
+# видно, сколько товаров в соседних); гистограмма — поиск и категорию, но не диапазон цен.
+
+# Сколько столбцов в гистограмме цен (примерно: границы округляются до "круглых" чисел)
+PRICE_BUCKETS = 8
+
+# Шаги гистограммы: 1, 2, 5, 10, 20, 50... рублей
+NICE_STEPS = (1, 2, 5, 10)
+
+
+def parse_price(value):
+    # Граница цены из параметра запроса или None (пусто, не число, отрицательное)
+    if value is None or isinstance(value, Decimal):
+        return value
+    try:
+        price = Decimal(str(value).strip().replace(',', '.'))
+    except InvalidOperation:
+        return None
+    return price if price.is_finite() and price >= 0 else None
+
+
+def in_range(price, price_min=None, price_max=None):
+    return (price_min is None or price >= price_min) and (price_max is None or price <= price_max)
+
+
+def _count(prices, price_min=None, price_max=None):
+    # Число цен в отсортированном списке, попадающих в диапазон (границы включительно)
+    left = bisect_left(prices, price_min) if price_min is not None else 0
+    right = bisect_right(prices, price_max) if price_max is not None else len(prices)
+    return max(right - left, 0)
+
+
+def price_edges(low, high, buckets=PRICE_BUCKETS):
+    # Границы столбцов гистограммы: шаг 1/2/5 x 10^n, первая граница кратна шагу
+    if high <= low:
+        return [low, high]
+    raw = (high - low) / buckets
+    magnitude = Decimal(10) ** raw.adjusted()
+    step = max(next(m * magnitude for m in NICE_STEPS if m * magnitude >= raw), Decimal(1))
+    edge = (low // step) * step
+    edges = [edge.quantize(Decimal(1))]
+    while edges[-1] < high:
+        edges.append((edges[-1] + step).quantize(Decimal(1)))
+    return edges
+
+
+def price_summary(prices, price_min=None, price_max=None, buckets=PRICE_BUCKETS):
+    # Минимальная и максимальная цена и гистограмма по отсортированному списку цен
+    if not prices:
+        return None
+    edges = price_edges(prices[0], prices[-1], buckets)
+    histogram = []
+    for i, (start, end) in enumerate(zip(edges, edges[1:])):
+        last = i == len(edges) - 2
+        # Столбец [start, end), последний — включая правую границу
+        count = (bisect_right(prices, end) if last else bisect_left(prices, end)) - bisect_left(prices, start)
+        histogram.append({
+            'from': start,
+            'to': end,
+            'count': count,
+            'selected': (price_min is None or end >= price_min) and (price_max is None or start <= price_max),
+        })
+    return {'min': prices[0], 'max': prices[-1], 'histogram': histogram,
+            'peak': max(bucket['count'] for bucket in histogram)}
+
+
+class FacetIndex:
+    """Счетчики фильтров витрины: активные товары и их цены по категориям."""
+
+    def __init__(self, buckets=PRICE_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._products = {}  # ID товара -> (ID категории, цена)
+        self._prices = {}    # ID категории -> отсортированный список цен
+        self._all = []       # цены всех товаров, отсортированы
+
+    def __len__(self):
+        return len(self._products)
+
+    def _remove(self, product_id):
+        entry = self._products.pop(product_id, None)
+        if entry is None:
+            return
+        category_id, price = entry
+        prices = self._prices[category_id]
+        del prices[bisect_left(prices, price)]
+        if not prices:
+            del self._prices[category_id]
+        del self._all[bisect_left(self._all, price)]
+
+    def add(self, product_id, category_id, price):
+        with self._lock:
+            self._remove(product_id)
+            self._products[product_id] = (category_id, price)
+            insort(self._prices.setdefault(category_id, []), price)
+            insort(self._all, price)
+
+    def remove(self, product_id):
+        with self._lock:
+            self._remove(product_id)
+
+    def facets(self, category_id=None, ids=None, price_min=None, price_max=None):
+        # Счетчики для текущих фильтров. ids — ID найденных поиском товаров или None (все товары)
+        with self._lock:
+            if ids is None:
+                counts = {c: _count(prices, price_min, price_max) for c, prices in self._prices.items()}
+                prices = self._all if category_id is None else self._prices.get(category_id, [])
+                price = price_summary(prices, price_min, price_max, self.buckets)
+            else:
+                entries = [self._products[i] for i in ids if i in self._products]
+                counts = {}
+                for c, p in entries:
+                    if in_range(p, price_min, price_max):
+                        counts[c] = counts.get(c, 0) + 1
+                prices = sorted(p for c, p in entries if category_id is None or c == category_id)
+                price = price_summary(prices, price_min, price_max, self.buckets)
+        counts = {c: n for c, n in counts.items() if n}
+        return {'categories': counts, 'total': sum(counts.values()), 'price': price}
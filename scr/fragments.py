@@ -0,0 +1,114 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from jinja2 import FileSystemBytecodeCache, nodes
+from jinja2.ext import Extension
+
+# Кэш фрагментов шаблонов и байт-код скомпилированных шаблонов на диске.
+#
+# Тег {% cache key, ttl %}...{% endcache %} запоминает отрендеренный фрагмент (сетку
+# товаров, карточку товара, блоки отчетов) и при следующем рендеринге с тем же ключом
+# подставляет готовый HTML. Ключ — любое выражение (обычно кортеж из версии каталога
+# и параметров запроса); к нему добавляется имя шаблона и строка тега. ttl в секундах
+# можно не указывать. Кэш общий для шаблонов процесса, вытесняет давно не использованные
+# фрагменты и ограничен по числу и суммарной длине.
+#
+# Байт-код шаблонов сохраняется в папку (FileSystemBytecodeCache): новый воркер не
+# компилирует шаблоны заново, пока их исходники не изменились.
+
+
+class FragmentCache:
+    """LRU-кэш отрендеренных фрагментов шаблонов со сроком жизни записей."""
+
+    def __init__(self, max_entries=5000, max_chars=32 * 1024 * 1024, ttl=300):
+        self.max_entries = max_entries
+        self.max_chars = max_chars
+        self.ttl = ttl  # срок жизни по умолчанию (секунды)
+        self._entries = OrderedDict()  # ключ -> (истекает, HTML)
+        self._chars = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= time.monotonic():
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value, ttl=None):
+        if len(value) > self.max_chars:
+            return
+        expires = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._chars -= len(old[1])
+            self._entries[key] = (expires, value)
+            self._chars += len(value)
+            while self._entries and (len(self._entries) > self.max_entries or self._chars > self.max_chars):
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._chars -= len(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._chars = 0
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'chars': self._chars}
+
+
+class FragmentCacheExtension(Extension):
+    # {% cache key[, ttl] %} ... {% endcache %}
+    tags = {'cache'}
+
+    def __init__(self, environment):
+        super().__init__(environment)
+        environment.extend(fragment_cache=None)
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        args = [nodes.Const(f"{parser.name}:{lineno}"), parser.parse_expression()]
+        args.append(parser.parse_expression() if parser.stream.skip_if('comma') else nodes.Const(None))
+        body = parser.parse_statements(('name:endcache',), drop_needle=True)
+        return nodes.CallBlock(self.call_method('_cached', args), [], [], body).set_lineno(lineno)
+
+    def _cached(self, place, key, ttl, caller):
+        cache = self.environment.fragment_cache
+        if cache is None:
+            return caller()
+        key = (place, key)
+        value = cache.get(key)
+        if value is not None:
+            return value
+        if self.environment.is_async:
+            # В асинхронном окружении (Quart) тело блока — корутина
+            return self._render_async(cache, key, ttl, caller)
+        value = caller()
+        cache.put(key, value, ttl)
+        return value
+
+    @staticmethod
+    async def _render_async(cache, key, ttl, caller):
+        value = await caller()
+        cache.put(key, value, ttl)
+        return value
+
+
+def setup(environment, fragment_cache, bytecode_dir=None):
+    # Подключает тег {% cache %} и байт-код шаблонов на диске к окружению Jinja приложения
+    environment.add_extension(FragmentCacheExtension)
+    environment.fragment_cache = fragment_cache
+    if bytecode_dir:
+        os.makedirs(bytecode_dir, exist_ok=True)
+        # Асинхронное окружение (Quart) компилирует шаблоны в другой код — храним его отдельно
+        pattern = '__jinja2_%s.async.cache' if environment.is_async else '__jinja2_%s.cache'
+        environment.bytecode_cache = FileSystemBytecodeCache(bytecode_dir, pattern)
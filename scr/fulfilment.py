@@ -0,0 +1,362 @@
+import os
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+
+import keystore
+import rollups
+
+# Оформление заказа в два этапа. В запросе покупателя (place_order) заказ записывается
+# в статусе 'В обработке' вместе с позициями, корзина очищается и в таблицу
+# Очередь_выполнения ставится задание — это несколько коротких запросов. Ключи выдает
+# фоновый обработчик (FulfilmentQueue): забирает задания (FOR UPDATE SKIP LOCKED, поэтому
+# обработчики в разных процессах не мешают друг другу), выдает лицензии и переводит заказ
+# в 'Оплачен'. Неудачное задание повторяется с растущей паузой, после max_attempts
+# заказ получает статус 'Ошибка'. Задание, обработчик которого упал, возвращается
+# в очередь по истечении аренды (lease_seconds).
+#
+# Обработчики запускаются в каждом процессе приложения (config.fulfilment_workers) или
+# отдельно из командной строки:
+#   python fulfilment.py worker [--threads N]
+#   python fulfilment.py status   — число заданий по состояниям
+
+PENDING_STATUS = 'В обработке'
+FAILED_STATUS = 'Ошибка'
+
+# --- Запросы этапа оформления ---
+
+# Корзина покупателя; строки блокируются до конца транзакции, чтобы повторное
+# нажатие "Оформить" не создало второй заказ из той же корзины
+CART_QUERY = """
+    SELECT k.ID_Товара, k.Количество, t.Цена, t.ID_Категории
+    FROM Корзина k
+    JOIN Товары t ON k.ID_Товара = t.ID_Товара
+    WHERE k.ID_Пользователя = %s
+    FOR UPDATE
+"""
+
+ORDER_BY_KEY_QUERY = "SELECT ID_Заказа FROM Заказы WHERE ID_Пользователя = %s AND Ключ_идемпотентности = %s"
+
+INSERT_ORDER_QUERY = """
+    INSERT INTO Заказы (ID_Пользователя, Дата_заказа, Статус, Итоговая_сумма, Ключ_идемпотентности)
+    VALUES (%s, NOW(), %s, %s, %s)
+"""
+
+INSERT_LINES_QUERY = """
+    INSERT INTO Состав_заказа (ID_Заказа, ID_Товара, Цена_продажи, Срок_лицензии_дни, Количество)
+    VALUES (%s, %s, %s, %s, %s)
+"""
+
+CLEAR_CART_QUERY = "DELETE FROM Корзина WHERE ID_Пользователя = %s"
+
+ENQUEUE_QUERY = "INSERT INTO Очередь_выполнения (ID_Заказа) VALUES (%s)"
+
+ORDER_STATUS_QUERY = "SELECT Статус FROM Заказы WHERE ID_Заказа = %s AND ID_Пользователя = %s"
+
+# --- Запросы обработчика ---
+
+# Готовые к выполнению задания и задания, аренда которых истекла (обработчик упал)
+CLAIM_JOBS_QUERY = """
+    SELECT ID_Задания, ID_Заказа, Попытки
+    FROM Очередь_выполнения
+    WHERE Статус IN ('Ожидает', 'Выполняется') AND Выполнить_после <= NOW()
+    ORDER BY Выполнить_после
+    LIMIT %s
+    FOR UPDATE SKIP LOCKED
+"""
+
+LOCK_ORDER_QUERY = """
+    SELECT ID_Пользователя, Статус, Итоговая_сумма, DATE(Дата_заказа) AS День_заказа
+    FROM Заказы
+    WHERE ID_Заказа = %s
+    FOR UPDATE
+"""
+
+ORDER_POSITIONS_QUERY = """
+    SELECT ID_Позиции, ID_Товара, Количество, Срок_лицензии_дни
+    FROM Состав_заказа
+    WHERE ID_Заказа = %s
+"""
+
+INSERT_LICENSES_QUERY = """
+    INSERT INTO Лицензии (ID_Позиции_заказа, Лицензионный_ключ, Дата_активации, Дата_истечения)
+    VALUES (%s, %s, %s, %s)
+"""
+
+JOB_DONE_QUERY = "UPDATE Очередь_выполнения SET Статус = 'Выполнено', Ошибка = NULL WHERE ID_Задания = %s"
+
+JOB_RETRY_QUERY = """
+    UPDATE Очередь_выполнения
+    SET Статус = 'Ожидает', Выполнить_после = NOW() + INTERVAL %s SECOND, Ошибка = %s
+    WHERE ID_Задания = %s
+"""
+
+JOB_FAILED_QUERY = "UPDATE Очередь_выполнения SET Статус = 'Ошибка', Ошибка = %s WHERE ID_Задания = %s"
+
+JOB_COUNTS_QUERY = "SELECT Статус, COUNT(*) AS Количество FROM Очередь_выполнения GROUP BY Статус"
+
+
+def lease_query(job_ids):
+    return ("UPDATE Очередь_выполнения SET Статус = 'Выполняется', Попытки = Попытки + 1, "
+            "Выполнить_после = NOW() + INTERVAL %%s SECOND WHERE ID_Задания IN (%s)"
+            % ", ".join(["%s"] * len(job_ids)))
+
+
+# --- Этап оформления ---
+
+# Как выполнить запрос из place_order_statements и что вернуть генератору
+EXECUTE = 'execute'    # cursor.execute, результат не нужен
+MANY = 'many'          # cursor.executemany
+FETCH_ONE = 'one'      # cursor.execute + fetchone
+FETCH_ALL = 'all'      # cursor.execute + fetchall
+INSERT = 'insert'      # cursor.execute, генератор получает lastrowid
+
+
+def place_order_statements(user_id, idempotency_key, license_days):
+    # Запросы транзакции оформления заказа: генератор отдает (sql, параметры, как выполнить)
+    # и получает результат запроса. Возвращает (ID заказа, создан ли он сейчас):
+    # (ID, False) — заказ с этим ключом уже оформлен, (None, False) — корзина пуста.
+    # Выполняют его run_statements (pymysql) и async_app (aiomysql) — логика оформления одна
+    cart_items = yield CART_QUERY, (user_id,), FETCH_ALL
+
+    # Проверка ключа после блокировки корзины: параллельная отправка той же формы ждет
+    # завершения первой и находит уже созданный заказ
+    if idempotency_key:
+        existing = yield ORDER_BY_KEY_QUERY, (user_id, idempotency_key), FETCH_ONE
+        if existing:
+            return existing['ID_Заказа'], False
+    if not cart_items:
+        return None, False
+
+    total_sum = sum(item['Цена'] * item['Количество'] for item in cart_items)
+    order_id = yield INSERT_ORDER_QUERY, (user_id, PENDING_STATUS, total_sum, idempotency_key or None), INSERT
+    yield INSERT_LINES_QUERY, [
+        (order_id, item['ID_Товара'], item['Цена'], license_days, item['Количество']) for item in cart_items], MANY
+    yield CLEAR_CART_QUERY, (user_id,), EXECUTE
+    yield ENQUEUE_QUERY, (order_id,), EXECUTE
+    # Сводки по товарам и категориям учитывают заказ сразу, выручка — после оплаты (fulfil_order)
+    for sql, params, many in rollups.order_statements(user_id, total_sum, cart_items, status=PENDING_STATUS):
+        yield sql, params, MANY if many else EXECUTE
+    return order_id, True
+
+
+def run_statements(cursor, statements):
+    # Выполняет генератор запросов на курсоре pymysql; возвращает то, что вернул генератор
+    result = None
+    while True:
+        try:
+            sql, params, mode = statements.send(result)
+        except StopIteration as stop:
+            return stop.value
+        if mode == MANY:
+            result = cursor.executemany(sql, params)
+            continue
+        cursor.execute(sql, params)
+        if mode == FETCH_ONE:
+            result = cursor.fetchone()
+        elif mode == FETCH_ALL:
+            result = cursor.fetchall()
+        elif mode == INSERT:
+            result = cursor.lastrowid
+        else:
+            result = None
+
+
+def place_order(cursor, user_id, idempotency_key, license_days):
+    # Выполняется в транзакции вызывающего, см. place_order_statements
+    return run_statements(cursor, place_order_statements(user_id, idempotency_key, license_days))
+
+
+# --- Этап выполнения ---
+
+def fulfil_order(cursor, order_id):
+    # Выдает ключи и переводит заказ в 'Оплачен'. Выполняется в транзакции вызывающего.
+    # Повторный вызов для уже выполненного заказа ничего не делает: заказ блокируется
+    # и проверяется его статус, а ключи и новый статус записываются одной транзакцией
+    cursor.execute(LOCK_ORDER_QUERY, (order_id,))
+    order = cursor.fetchone()
+    if order is None or order['Статус'] != PENDING_STATUS:
+        return False
+
+    cursor.execute(ORDER_POSITIONS_QUERY, (order_id,))
+    positions = cursor.fetchall()
+    # Сначала ключи со склада (одним запросом на позицию), недостающие генерируем.
+    # Дата активации одинакова для всего заказа
+    activated_at = datetime.now().replace(microsecond=0)
+    licenses = [
+        (pos['ID_Позиции'], key, activated_at, activated_at + timedelta(days=pos['Срок_лицензии_дни']))
+        for pos in positions
+        for key in keystore.issue_keys(cursor, pos['ID_Товара'], pos['Количество'])
+    ]
+    if licenses:
+        cursor.executemany(INSERT_LICENSES_QUERY, licenses)
+    cursor.execute("UPDATE Заказы SET Статус = %s WHERE ID_Заказа = %s", (rollups.PAID_STATUS, order_id))
+    # Выручка учитывается за день оформления заказа, а не оплаты (см. rollups.payment_statements)
+    rollups.apply_payment(cursor, order['ID_Пользователя'], order['Итоговая_сумма'], order['День_заказа'])
+    return True
+
+
+class FulfilmentQueue:
+    """Фоновые обработчики очереди выполнения заказов (потоки процесса)."""
+
+    def __init__(self, pool, workers=2, poll_interval=1, batch_size=10, max_attempts=5,
+                 lease_seconds=60, retry_delay=5):
+        self.pool = pool
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.lease_seconds = lease_seconds
+        self.retry_delay = retry_delay
+        self.done = 0      # выполненные задания
+        self.retried = 0   # неудачные попытки, которые будут повторены
+        self.failed = 0    # задания, исчерпавшие попытки
+        self._wake = threading.Event()
+        self._threads = []
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+    # --- Запуск ---
+
+    def start(self):
+        # Потоки запускаются при первом запросе (и заново в дочернем процессе после fork)
+        if self._pid == os.getpid() or not self.workers:
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._wake = threading.Event()
+            self._threads = [threading.Thread(target=self._run, name=f'fulfilment-{n}', daemon=True)
+                             for n in range(self.workers)]
+            for thread in self._threads:
+                thread.start()
+
+    def notify(self):
+        # Новое задание в очереди — будим обработчики, не дожидаясь следующего опроса
+        self.start()
+        self._wake.set()
+
+    def _run(self):
+        while True:
+            processed = 0
+            try:
+                conn = self.pool.acquire()
+                try:
+                    processed = self.run_once(conn)
+                finally:
+                    self.pool.release(conn)
+            except Exception as ex:
+                print("Ошибка обработки очереди заказов:", ex)
+            if processed < self.batch_size:
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+
+    # --- Обработка ---
+
+    def claim(self, conn):
+        # Забирает пачку заданий и продлевает их аренду. Возвращает список заданий
+        conn.begin()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(CLAIM_JOBS_QUERY, (self.batch_size,))
+                jobs = cursor.fetchall()
+                if jobs:
+                    ids = [job['ID_Задания'] for job in jobs]
+                    cursor.execute(lease_query(ids), [self.lease_seconds] + ids)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        for job in jobs:
+            job['Попытки'] += 1
+        return jobs
+
+    def process(self, conn, job):
+        try:
+            conn.begin()
+            with conn.cursor() as cursor:
+                fulfil_order(cursor, job['ID_Заказа'])
+                cursor.execute(JOB_DONE_QUERY, (job['ID_Задания'],))
+            conn.commit()
+            self.done += 1
+        except Exception as ex:
+            conn.rollback()
+            print(f"Ошибка выполнения заказа #{job['ID_Заказа']}:", ex)
+            self._fail(conn, job, ex)
+
+    def _fail(self, conn, job, ex):
+        error = str(ex)[:1000]
+        with conn.cursor() as cursor:
+            if job['Попытки'] >= self.max_attempts:
+                cursor.execute(JOB_FAILED_QUERY, (error, job['ID_Задания']))
+                cursor.execute("UPDATE Заказы SET Статус = %s WHERE ID_Заказа = %s AND Статус = %s",
+                               (FAILED_STATUS, job['ID_Заказа'], PENDING_STATUS))
+                self.failed += 1
+            else:
+                # Пауза растет вдвое с каждой попыткой: 5, 10, 20... секунд
+                delay = self.retry_delay * 2 ** (job['Попытки'] - 1)
+                cursor.execute(JOB_RETRY_QUERY, (delay, error, job['ID_Задания']))
+                self.retried += 1
+
+    def run_once(self, conn):
+        # Одна пачка заданий. Возвращает число обработанных
+        jobs = self.claim(conn)
+        for job in jobs:
+            self.process(conn, job)
+        return len(jobs)
+
+    def stats(self):
+        return {'done': self.done, 'retried': self.retried, 'failed': self.failed}
+
+
+def main(argv):
+    from config import host, user, password, port, db_name
+    from config import fulfilment_workers, fulfilment_poll_interval, fulfilment_batch_size
+    from config import fulfilment_max_attempts, fulfilment_lease_seconds, fulfilment_retry_delay
+    from db_pool import ConnectionPool
+    import pymysql as db
+
+    usage = "Использование: python fulfilment.py [worker [--threads N] | status]"
+    command = argv[1] if len(argv) > 1 else 'worker'
+    connect_kwargs = dict(host=host, port=port, user=user, password=password,
+                          database=db_name, cursorclass=db.cursors.DictCursor, autocommit=True)
+
+    if command == 'status':
+        conn = db.connect(**connect_kwargs)
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(JOB_COUNTS_QUERY)
+                for row in cursor.fetchall():
+                    print(f"{row['Статус']}: {row['Количество']}")
+        finally:
+            conn.close()
+        return 0
+    if command != 'worker':
+        print(usage)
+        return 2
+
+    threads = fulfilment_workers or 1
+    if '--threads' in argv:
+        try:
+            threads = int(argv[argv.index('--threads') + 1])
+        except (IndexError, ValueError):
+            print(usage)
+            return 2
+    pool = ConnectionPool(connect_kwargs, min_size=0, max_size=threads)
+    queue = FulfilmentQueue(pool, workers=threads, poll_interval=fulfilment_poll_interval,
+                            batch_size=fulfilment_batch_size, max_attempts=fulfilment_max_attempts,
+                            lease_seconds=fulfilment_lease_seconds, retry_delay=fulfilment_retry_delay)
+    queue.start()
+    print(f"Обработчиков заказов: {threads}. Остановка — Ctrl+C")
+    try:
+        while True:
+            time.sleep(60)
+            print("Выполнено: {done}, повторов: {retried}, ошибок: {failed}".format(**queue.stats()))
+    except KeyboardInterrupt:
+        return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,90 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from urllib.parse import urlencode
+
+# Кэш готовых HTML-страниц каталога для анонимных посетителей и условные запросы.
+# Страница витрины или товара одинакова для всех анонимных посетителей, пока не изменился
+# каталог, поэтому ее ETag строится из версии данных (версия каталога или товара) и
+# отпечатка шаблонов. Если браузер прислал тот же ETag — отвечаем 304 без рендеринга,
+# если страница с этим ETag уже есть в кэше — отдаем ее без обращения к БД и Jinja.
+
+
+def templates_fingerprint(folder):
+    # Отпечаток всех шаблонов: после выкладки новых шаблонов старые ETag перестают совпадать.
+    # Считается по содержимому, поэтому одинаков во всех воркерах
+    digest = hashlib.sha256()
+    for root, dirs, files in os.walk(folder):
+        dirs.sort()
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            digest.update(os.path.relpath(path, folder).encode('utf-8'))
+            with open(path, 'rb') as f:
+                digest.update(f.read())
+    return digest.hexdigest()[:10]
+
+
+def cacheable(request, session):
+    # Страница одинакова для всех, только если посетитель не вошел и не ждет flash-сообщений
+    return request.method == 'GET' and 'user_id' not in session and '_flashes' not in session
+
+
+def page_key(request):
+    # Адрес с параметрами в одном порядке: ?a=1&b=2 и ?b=2&a=1 — одна страница
+    return request.path + '?' + urlencode(sorted(request.args.items(multi=True)))
+
+
+def not_modified(request, etag, last_modified=None):
+    # Сравнение с If-None-Match (приоритетнее) или If-Modified-Since
+    if request.if_none_match:
+        return request.if_none_match.contains(etag)
+    if last_modified is not None and request.if_modified_since is not None:
+        return last_modified <= request.if_modified_since
+    return False
+
+
+class ResponseCache:
+    """Ограниченный LRU-кэш готовых страниц: ключ — адрес с параметрами, значение — (ETag, HTML)."""
+
+    def __init__(self, max_entries=1000, max_bytes=64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, etag):
+        # Страница, отрендеренная для того же ETag, или None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != etag:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, etag, body):
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old[1])
+            self._entries[key] = (etag, body)
+            self._bytes += len(body)
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'bytes': self._bytes}
@@ -0,0 +1,279 @@
+import hashlib
+import os
+import re
+import sys
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # без Pillow уменьшенные копии не создаются, отдаются оригиналы
+    Image = None
+
+# Обработка изображений товаров: загруженный файл сохраняется потоково с ограничением размера
+# под именем по хэшу содержимого (одинаковые картинки хранятся один раз), а пул процессов
+# в фоне нарезает уменьшенные копии в WebP и JPEG для srcset. Пока копии не готовы,
+# шаблоны показывают оригинал.
+#
+# Запуск из командной строки (перевести уже загруженные изображения на новую схему):
+#   python images.py backfill [--workers N]
+# Нужен пакет Pillow: pip install Pillow
+
+# Ширина уменьшенных копий (px): миниатюра в корзине, карточка витрины, страница товара
+VARIANT_WIDTHS = {'thumb': 160, 'card': 400, 'detail': 800}
+# Форматы копий: WebP для браузеров, которые его понимают, JPEG — для остальных
+VARIANT_FORMATS = {'webp': ('WEBP', {'quality': 80, 'method': 4}),
+                   'jpg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True})}
+# Папка для копий внутри папки изображений
+VARIANTS_DIR = 'variants'
+# Изображение товара без картинки (app.add_product) — его имя не меняется
+DEFAULT_IMAGE = 'default.jpg'
+
+EXTENSIONS = {'png': 'png', 'jpg': 'jpg', 'jpeg': 'jpg', 'gif': 'gif', 'webp': 'webp'}
+HASH_NAME_RE = re.compile(r'^[0-9a-f]{32}\.\w+$')
+CHUNK_SIZE = 64 * 1024
+
+
+class ImageTooLarge(Exception):
+    pass
+
+
+def content_name(digest, extension):
+    return f"{digest[:32]}.{EXTENSIONS.get(extension.lower(), extension.lower())}"
+
+
+def variant_name(name, size, fmt):
+    # Путь копии относительно папки изображений
+    stem = os.path.splitext(name)[0]
+    return f"{VARIANTS_DIR}/{stem}_{VARIANT_WIDTHS[size]}.{fmt}"
+
+
+def save_upload(stream, folder, extension, max_bytes):
+    # Копирует загрузку на диск блоками, считая хэш на лету. Превышение max_bytes — ImageTooLarge.
+    # Возвращает имя файла по хэшу содержимого; если такой файл уже есть, копия удаляется
+    digest = hashlib.sha256()
+    size = 0
+    fd, temp_path = tempfile.mkstemp(dir=folder, suffix='.upload')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            while True:
+                chunk = stream.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if max_bytes and size > max_bytes:
+                    raise ImageTooLarge("файл больше %d байт" % max_bytes)
+                digest.update(chunk)
+                f.write(chunk)
+        name = content_name(digest.hexdigest(), extension)
+        target = os.path.join(folder, name)
+        if os.path.exists(target):
+            os.remove(temp_path)
+        else:
+            os.replace(temp_path, target)
+        return name
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# --- Нарезка копий (выполняется в процессах пула) ---
+
+def _prepare(image, fmt):
+    # JPEG не поддерживает прозрачность — подкладываем белый фон
+    if fmt == 'jpg':
+        if image.mode in ('RGBA', 'LA', 'P'):
+            image = image.convert('RGBA')
+            background = Image.new('RGB', image.size, (255, 255, 255))
+            background.paste(image, mask=image.getchannel('A'))
+            return background
+        return image.convert('RGB') if image.mode != 'RGB' else image
+    if image.mode not in ('RGB', 'RGBA'):
+        return image.convert('RGBA' if 'A' in image.getbands() or image.mode == 'P' else 'RGB')
+    return image
+
+
+def make_variants(folder, name):
+    # Создает недостающие копии изображения name. Копия detail.jpg пишется последней:
+    # по ней шаблоны узнают, что набор готов. Возвращает число созданных файлов
+    if Image is None:
+        return 0
+    os.makedirs(os.path.join(folder, VARIANTS_DIR), exist_ok=True)
+    created = 0
+    with Image.open(os.path.join(folder, name)) as original:
+        original.seek(0)  # у анимированных GIF берем первый кадр
+        image = ImageOps.exif_transpose(original)
+        image.load()
+    for size, width in sorted(VARIANT_WIDTHS.items(), key=lambda item: item[1]):
+        resized = image.copy()
+        # Только уменьшаем: маленькие картинки сохраняются в исходном размере
+        resized.thumbnail((width, width * 4), Image.LANCZOS)
+        for fmt, (pil_format, options) in VARIANT_FORMATS.items():
+            target = os.path.join(folder, variant_name(name, size, fmt))
+            if os.path.exists(target):
+                continue
+            temp_path = target + '.tmp'
+            _prepare(resized, fmt).save(temp_path, pil_format, **options)
+            os.replace(temp_path, target)
+            created += 1
+    return created
+
+
+# --- Пул обработки и ссылки для шаблонов ---
+
+class ImagePipeline:
+    """Загрузка изображений товаров и фоновая нарезка уменьшенных копий."""
+
+    def __init__(self, folder, max_bytes=10 * 1024 * 1024, workers=2):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.workers = workers
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._ready = set()  # изображения, у которых все копии уже есть на диске
+
+    def _pool(self):
+        # Пул создается при первой загрузке (и заново в дочернем процессе после fork)
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+                self._pid = os.getpid()
+            return self._executor
+
+    def save(self, file):
+        # Сохраняет загруженный файл (werkzeug FileStorage) и ставит нарезку копий в очередь
+        extension = file.filename.rsplit('.', 1)[1]
+        return self.save_stream(file.stream, extension)
+
+    def save_stream(self, stream, extension):
+        # То же для любого файлового потока (например, файла из zip-архива импорта)
+        name = save_upload(stream, self.folder, extension, self.max_bytes)
+        self.submit(name)
+        return name
+
+    def submit(self, name):
+        if Image is None or self.is_ready(name):
+            return None
+        future = self._pool().submit(make_variants, self.folder, name)
+        future.add_done_callback(lambda f: self._report(name, f))
+        return future
+
+    @staticmethod
+    def _report(name, future):
+        if future.exception() is not None:
+            print("Ошибка обработки изображения", name + ":", future.exception())
+
+    def is_ready(self, name):
+        if name in self._ready:
+            return True
+        if os.path.exists(os.path.join(self.folder, variant_name(name, 'detail', 'jpg'))):
+            self._ready.add(name)
+            return True
+        return False
+
+    def srcset(self, name, fmt, url):
+        # Строка srcset со всеми размерами или '' (копии еще не готовы).
+        # url — функция, строящая ссылку по пути внутри папки изображений
+        if not name or not self.is_ready(name):
+            return ''
+        return ', '.join(f"{url(variant_name(name, size, fmt))} {width}w"
+                         for size, width in VARIANT_WIDTHS.items())
+
+    def url(self, name, size, url):
+        # Ссылка на JPEG-копию нужного размера или на оригинал
+        if name and self.is_ready(name):
+            return url(variant_name(name, size, 'jpg'))
+        return url(name)
+
+
+# --- Перевод существующих изображений ---
+
+def backfill(conn, folder, workers=2):
+    # Каждое изображение в папке получает имя по хэшу (ссылки в Товары обновляются,
+    # старые файлы остаются на диске) и набор уменьшенных копий.
+    # Возвращает (переименовано, обработано)
+    renamed = {}
+    names = []
+    for entry in sorted(os.listdir(folder)):
+        path = os.path.join(folder, entry)
+        extension = entry.rsplit('.', 1)[-1].lower() if '.' in entry else ''
+        if not os.path.isfile(path) or extension not in EXTENSIONS:
+            continue
+        name = entry
+        if entry != DEFAULT_IMAGE and not HASH_NAME_RE.match(entry):
+            name = content_name(file_digest(path), extension)
+            target = os.path.join(folder, name)
+            if not os.path.exists(target):
+                try:
+                    os.link(path, target)
+                except OSError:
+                    with open(path, 'rb') as src, open(target, 'wb') as dst:
+                        for chunk in iter(lambda: src.read(CHUNK_SIZE), b''):
+                            dst.write(chunk)
+            renamed[entry] = name
+        if name not in names:
+            names.append(name)
+
+    if renamed:
+        with conn.cursor() as cursor:
+            cursor.executemany("UPDATE Товары SET Изображение = %s, Версия = Версия + 1 WHERE Изображение = %s",
+                               [(new, old) for old, new in renamed.items()])
+
+    processed = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {name: pool.submit(make_variants, folder, name) for name in names}
+        for name, future in futures.items():
+            try:
+                future.result()
+                processed += 1
+            except Exception as ex:
+                print("Ошибка обработки изображения", name + ":", ex)
+    return len(renamed), processed
+
+
+def main(argv):
+    import pymysql as db
+    from catalog import CatalogCache
+    from config import host, user, password, port, db_name, image_workers, upload_folder
+
+    if len(argv) < 2 or argv[1] != 'backfill':
+        print("Использование: python images.py backfill [--workers N]")
+        return 2
+    if Image is None:
+        print("Для обработки изображений установите Pillow: pip install Pillow")
+        return 1
+    workers = image_workers
+    if '--workers' in argv:
+        try:
+            workers = int(argv[argv.index('--workers') + 1])
+        except (IndexError, ValueError):
+            print("Использование: python images.py backfill [--workers N]")
+            return 2
+
+    folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), upload_folder)
+    conn = db.connect(host=host, port=port, user=user, password=password,
+                      database=db_name, cursorclass=db.cursors.DictCursor, autocommit=True)
+    try:
+        renamed, processed = backfill(conn, folder, workers)
+        if renamed:
+            # Имена картинок в каталоге изменились — воркеры перечитают его
+            CatalogCache().bump(conn)
+    finally:
+        conn.close()
+    print(f"Переименовано по хэшу: {renamed}, обработано изображений: {processed}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
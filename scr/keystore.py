@@ -0,0 +1,159 @@
+import sys
+import uuid
+
+import pymysql as db
+
+# Склад заранее загруженных лицензионных ключей (например, ключей от поставщика).
+#
+# Запуск из командной строки:
+#   python keystore.py load <ID_Товара> <файл>  — загрузить ключи из файла (по одному в строке)
+#   python keystore.py stock [порог]            — показать товары, у которых ключи заканчиваются
+
+
+def generate_key():
+    # Собственный ключ магазина, если на складе нет ключей поставщика
+    return str(uuid.uuid4()).upper()[:18] # Пример: 123E4567-E89B-12D3
+
+
+# Свободные ключи товара по порядку загрузки. SKIP LOCKED пропускает ключи, которые
+# прямо сейчас забирают другие покупатели, поэтому параллельные заказы одного товара
+# не ждут друг друга
+CLAIM_QUERY = """
+    SELECT ID_Ключа, Лицензионный_ключ
+    FROM Склад_ключей
+    WHERE ID_Товара = %s AND Выдан = 0
+    ORDER BY ID_Ключа
+    LIMIT %s
+    FOR UPDATE SKIP LOCKED
+"""
+
+
+def mark_issued_query(ids):
+    return "UPDATE Склад_ключей SET Выдан = 1, Дата_выдачи = NOW() WHERE ID_Ключа IN (%s)" % ", ".join(["%s"] * len(ids))
+
+
+# Счетчик свободных ключей товара (Остатки_ключей) меняется в той же транзакции, что и склад
+ADD_STOCK_QUERY = """
+    INSERT INTO Остатки_ключей (ID_Товара, Доступно) VALUES (%s, %s)
+    ON DUPLICATE KEY UPDATE Доступно = Доступно + VALUES(Доступно)
+"""
+TAKE_STOCK_QUERY = "UPDATE Остатки_ключей SET Доступно = Доступно - %s WHERE ID_Товара = %s"
+
+
+def claim_keys(cursor, product_id, count):
+    # Забирает до count свободных ключей товара. Возвращает список ключей (может быть короче count)
+    cursor.execute(CLAIM_QUERY, (product_id, count))
+    rows = cursor.fetchall()
+    if not rows:
+        return []
+    ids = [row['ID_Ключа'] for row in rows]
+    cursor.execute(mark_issued_query(ids), ids)
+    cursor.execute(TAKE_STOCK_QUERY, (len(ids), product_id))
+    return [row['Лицензионный_ключ'] for row in rows]
+
+
+def issue_keys(cursor, product_id, count):
+    # Ключи для позиции заказа: сначала со склада, недостающие — генерируем
+    keys = claim_keys(cursor, product_id, count)
+    keys.extend(generate_key() for _ in range(count - len(keys)))
+    return keys
+
+
+# Повторяющиеся ключи пропускаются (обновление-пустышка не считается измененной строкой).
+# В отличие от INSERT IGNORE, остальные ошибки (например, несуществующий товар) не скрываются
+LOAD_KEYS_QUERY = """
+    INSERT INTO Склад_ключей (ID_Товара, Лицензионный_ключ) VALUES (%s, %s)
+    ON DUPLICATE KEY UPDATE ID_Ключа = ID_Ключа
+"""
+
+
+def load_keys(conn, product_id, lines, batch_size=1000):
+    # Потоково загружает ключи из итератора строк пачками по batch_size.
+    # Пустые строки и строки, начинающиеся с #, пропускаются; повторяющиеся ключи игнорируются.
+    # Возвращает (загружено, дубликатов)
+    loaded = duplicates = 0
+    batch = []
+
+    def flush():
+        nonlocal loaded, duplicates
+        conn.begin()
+        try:
+            with conn.cursor() as cursor:
+                inserted = cursor.executemany(LOAD_KEYS_QUERY, [(product_id, key) for key in batch])
+                if inserted:
+                    cursor.execute(ADD_STOCK_QUERY, (product_id, inserted))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        loaded += inserted or 0
+        duplicates += len(batch) - (inserted or 0)
+        batch.clear()
+
+    for line in lines:
+        if isinstance(line, bytes):
+            line = line.decode('utf-8')
+        key = line.strip()
+        if not key or key.startswith('#'):
+            continue
+        if len(key) > 100:
+            duplicates += 1  # в колонку не поместится — считаем отброшенным
+            continue
+        batch.append(key)
+        if len(batch) >= batch_size:
+            flush()
+    if batch:
+        flush()
+    return loaded, duplicates
+
+
+# Товары со складом ключей (строка в Остатки_ключей есть у всех, кому загружали ключи),
+# у которых свободных ключей меньше порога — по счетчикам, без подсчета строк склада
+LOW_STOCK_QUERY = """
+    SELECT o.ID_Товара, t.Название, o.Доступно AS available
+    FROM Остатки_ключей o
+    JOIN Товары t ON o.ID_Товара = t.ID_Товара
+    WHERE o.Доступно < %s AND t.Статус_активности = 1
+    ORDER BY o.Доступно, o.ID_Товара
+"""
+
+
+def low_stock(cursor, threshold):
+    cursor.execute(LOW_STOCK_QUERY, (threshold,))
+    return cursor.fetchall()
+
+
+def main(argv):
+    from config import host, user, password, port, db_name, key_low_stock_threshold, key_load_batch_size
+
+    command = argv[1] if len(argv) > 1 else ''
+    if command == 'load' and len(argv) == 4:
+        product_id, path = int(argv[2]), argv[3]
+    elif command == 'stock' and len(argv) <= 3:
+        threshold = int(argv[2]) if len(argv) == 3 else key_low_stock_threshold
+    else:
+        print("Использование: python keystore.py load <ID_Товара> <файл> | stock [порог]")
+        return 2
+
+    conn = db.connect(host=host, port=port, user=user, password=password,
+                      database=db_name, cursorclass=db.cursors.DictCursor, autocommit=True)
+    try:
+        if command == 'load':
+            with open(path, encoding='utf-8') as f:
+                try:
+                    loaded, duplicates = load_keys(conn, product_id, f, key_load_batch_size)
+                except db.MySQLError as ex:
+                    print("Ошибка загрузки ключей:", ex)
+                    return 1
+            print(f"Загружено ключей: {loaded}, пропущено: {duplicates}")
+        else:
+            with conn.cursor() as cursor:
+                for row in low_stock(cursor, threshold):
+                    print(f"#{row['ID_Товара']} {row['Название']}: осталось {row['available']}")
+        return 0
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
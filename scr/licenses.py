@@ -0,0 +1,183 @@
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from datetime import datetime, timezone
+
+# Проверка лицензионных ключей для серверов активации и реселлеров (/api/licenses).
+# Все выданные ключи держатся в памяти процесса, поэтому проверка — и существующего,
+# и несуществующего ключа — не обращается к MySQL.
+#
+# Основная часть индекса — три параллельных массива, отсортированных по хэшу ключа:
+# 64-битный хэш, ID товара и срок действия (около 20 байт на ключ против ~200 байт у
+# словаря строк). Ключи, выданные после полной загрузки, догружаются по возрастанию
+# ID_Лицензии (не чаще check_interval) в небольшой словарь; раз в ttl секунд индекс
+# перестраивается целиком, и словарь сливается с массивами.
+#
+# Хэш — встроенный hash() строки (SipHash, 64 бита, свой в каждом процессе). Вероятность,
+# что случайная строка совпадет по хэшу с одним из 10 млн ключей, — около 5e-13.
+
+# Ключи с ID_Лицензии не больше последнего прочитанного перечитываются с таким запасом:
+# транзакции выдачи, получившие ID раньше, могут зафиксироваться позже соседних
+REFRESH_OVERLAP = 100
+
+# Сколько ключей читать из БД за один запрос
+LOAD_BATCH = 10000
+
+LICENSES_QUERY = """
+    SELECT l.ID_Лицензии, l.Лицензионный_ключ, sz.ID_Товара, t.Название,
+           UNIX_TIMESTAMP(l.Дата_истечения) AS Истекает
+    FROM Лицензии l
+    JOIN Состав_заказа sz ON l.ID_Позиции_заказа = sz.ID_Позиции
+    JOIN Товары t ON sz.ID_Товара = t.ID_Товара
+    WHERE l.ID_Лицензии > %s
+    ORDER BY l.ID_Лицензии
+    LIMIT %s
+"""
+
+
+def normalize(key):
+    # Ключи сравниваются без учета регистра и пробелов по краям (как UNIQUE в MySQL)
+    return key.strip().upper() if isinstance(key, str) else ''
+
+
+def _expires(value):
+    # Срок действия в секундах Unix; 0 — бессрочная лицензия
+    return int(value) if value is not None else 0
+
+
+class LicenseIndex:
+    """Выданные лицензионные ключи в памяти процесса с догрузкой новых из БД."""
+
+    def __init__(self, ttl=3600, check_interval=1, batch_size=LOAD_BATCH):
+        self.ttl = ttl
+        self.check_interval = check_interval
+        self.batch_size = batch_size
+        # (хэши, ID товаров, сроки) — заменяются одним присваиванием после перестройки
+        self._base = (array('q'), array('i'), array('q'))
+        self._recent = {}         # ключ -> (ID товара, срок) — выданные после полной загрузки
+        self._products = {}       # ID товара -> название
+        self._last_id = 0
+        self._loaded_at = None
+        self._checked_at = 0
+        self._lock = threading.Lock()
+        self.found = 0
+        self.missing = 0
+
+    def __len__(self):
+        return len(self._base[0]) + len(self._recent)
+
+    @property
+    def loaded(self):
+        return self._loaded_at is not None
+
+    # --- Загрузка ---
+
+    def _read(self, cursor, after):
+        cursor.execute(LICENSES_QUERY, (after, self.batch_size))
+        return cursor.fetchall()
+
+    def _load(self, cursor):
+        # Полная загрузка порциями по ID_Лицензии; пока она идет, запросы видят старый индекс
+        entries = {}
+        products = {}
+        last_id = 0
+        while True:
+            rows = self._read(cursor, last_id)
+            for row in rows:
+                products[row['ID_Товара']] = row['Название']
+                entries[hash(normalize(row['Лицензионный_ключ']))] = (row['ID_Товара'], _expires(row['Истекает']))
+            if rows:
+                last_id = rows[-1]['ID_Лицензии']
+            if len(rows) < self.batch_size:
+                break
+        hashes = array('q', sorted(entries))
+        self._products = products
+        self._base = (hashes, array('i', (entries[h][0] for h in hashes)),
+                      array('q', (entries[h][1] for h in hashes)))
+        self._recent = {}
+        self._last_id = last_id
+
+    def _load_new(self, cursor):
+        # Ключи, выданные после последней проверки (с запасом REFRESH_OVERLAP)
+        after = max(self._last_id - REFRESH_OVERLAP, 0)
+        while True:
+            rows = self._read(cursor, after)
+            for row in rows:
+                key = normalize(row['Лицензионный_ключ'])
+                if self._find(key) is None:  # перечитанные из запаса уже есть в массивах
+                    self._products[row['ID_Товара']] = row['Название']
+                    self._recent[key] = (row['ID_Товара'], _expires(row['Истекает']))
+            if rows:
+                after = rows[-1]['ID_Лицензии']
+                self._last_id = max(self._last_id, after)
+            if len(rows) < self.batch_size:
+                break
+
+    def refresh(self, connect):
+        # Догружает новые ключи, если пора. connect вызывается, только если нужно читать БД.
+        # Пока один поток обновляет индекс, остальные отвечают по текущему и не ждут
+        now = time.monotonic()
+        if self.loaded and now - self._checked_at < self.check_interval:
+            return
+        if not self._lock.acquire(blocking=not self.loaded):
+            return
+        try:
+            now = time.monotonic()
+            if self.loaded and now - self._checked_at < self.check_interval:
+                return
+            conn = connect()
+            if conn is None:
+                return
+            with conn.cursor() as cursor:
+                if not self.loaded or now - self._loaded_at >= self.ttl:
+                    self._load(cursor)
+                    self._loaded_at = now
+                else:
+                    self._load_new(cursor)
+            self._checked_at = now
+        except Exception as ex:
+            print("Ошибка загрузки лицензионных ключей:", ex)
+        finally:
+            self._lock.release()
+
+    # --- Проверка ---
+
+    def _find(self, key):
+        # Поиск нормализованного ключа в отсортированных массивах
+        hashes, products, expires = self._base
+        h = hash(key)
+        i = bisect_left(hashes, h)
+        if i < len(hashes) and hashes[i] == h:
+            return products[i], expires[i]
+        return None
+
+    def lookup(self, key):
+        # (ID товара, срок действия) или None, если такой ключ не выдавался
+        key = normalize(key)
+        return self._recent.get(key) or self._find(key)
+
+    def check(self, key, now=None):
+        # Ответ API для одного ключа
+        entry = self.lookup(key)
+        if entry is None:
+            self.missing += 1
+            return {'key': key, 'found': False, 'valid': False}
+        self.found += 1
+        product_id, expires = entry
+        now = time.time() if now is None else now
+        return {
+            'key': key,
+            'found': True,
+            'valid': not expires or expires > now,
+            'product_id': product_id,
+            'product': self._products.get(product_id),
+            'expires': datetime.fromtimestamp(expires, timezone.utc).isoformat() if expires else None,
+        }
+
+    def check_many(self, keys):
+        now = time.time()
+        return [self.check(key, now) for key in keys]
+
+    def stats(self):
+        return {'keys': len(self), 'recent': len(self._recent), 'found': self.found, 'missing': self.missing}
@@ -0,0 +1,299 @@
+import contextvars
+import json
+import logging
+import re
+import threading
+import time
+from bisect import bisect_left
+
+import pymysql as db
+
+# Инструментирование: счетчики запросов к БД на каждый HTTP-запрос, гистограммы задержек
+# маршрутов и текстовый формат Prometheus для /metrics. Метрики хранятся в памяти
+# процесса — при нескольких воркерах Prometheus опрашивает каждый воркер отдельно.
+#
+# Накладные расходы на SQL-запрос — два вызова perf_counter и пара сложений;
+# нормализация SQL выполняется только для запросов, попавших в журнал медленных.
+
+# Границы корзин гистограмм задержки (секунды)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Границы корзин для числа SQL-запросов на один HTTP-запрос
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+# Сколько SQL-запросов одного HTTP-запроса помнить для журнала медленных запросов
+MAX_STATEMENTS = 200
+
+slow_log = logging.getLogger('softkey.slow_requests')
+
+
+# --- Метрики в формате Prometheus ---
+
+def _format_labels(names, values):
+    if not names:
+        return ''
+    pairs = []
+    for name, value in zip(names, values):
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{name}="{value}"')
+    return '{' + ','.join(pairs) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for label_values, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labels, label_values)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._values = {}  # значения меток -> [счетчики по корзинам (+Inf последним), сумма, количество]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(label_values)
+            if state is None:
+                state = self._values[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((k, ([*v[0]], v[1], v[2])) for k, v in self._values.items())
+        for label_values, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labels + ('le',), label_values + (_format_value(float(bound)),))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labels, label_values)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Gauge:
+    # Значение вычисляется в момент опроса: callback возвращает число или {метки: число}.
+    # kind='counter' — для накопительных значений, которые считает сам объект (пул, кэш)
+    def __init__(self, name, help, callback, labels=(), kind='gauge'):
+        self.name = name
+        self.help = help
+        self.callback = callback
+        self.labels = tuple(labels)
+        self.kind = kind
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        value = self.callback()
+        if isinstance(value, dict):
+            for label_values, item in sorted(value.items()):
+                lines.append(f"{self.name}{_format_labels(self.labels, label_values)} {_format_value(item)}")
+        else:
+            lines.append(f"{self.name} {_format_value(value)}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            try:
+                lines.extend(metric.render())
+            except Exception as ex:
+                print("Ошибка сбора метрики", metric.name + ":", ex)
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+http_requests = registry.register(Histogram(
+    'softkey_http_request_duration_seconds', "Время обработки HTTP-запроса",
+    ('endpoint', 'method', 'status')))
+db_queries = registry.register(Counter(
+    'softkey_db_queries_total', "Число SQL-запросов", ('endpoint',)))
+db_time = registry.register(Counter(
+    'softkey_db_query_seconds_total', "Суммарное время SQL-запросов", ('endpoint',)))
+db_queries_per_request = registry.register(Histogram(
+    'softkey_db_queries_per_request', "Число SQL-запросов на один HTTP-запрос",
+    ('endpoint',), QUERY_COUNT_BUCKETS))
+slow_requests = registry.register(Counter(
+    'softkey_slow_requests_total', "HTTP-запросы дольше порога журнала медленных запросов", ('endpoint',)))
+
+
+# --- Статистика SQL в рамках одного HTTP-запроса ---
+
+class RequestStats:
+    __slots__ = ('started', 'queries', 'db_time', 'slowest', 'slowest_time', 'statements')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.slowest = None
+        self.slowest_time = 0.0
+        self.statements = []
+
+    def add(self, query, elapsed):
+        self.queries += 1
+        self.db_time += elapsed
+        if elapsed >= self.slowest_time:
+            self.slowest, self.slowest_time = query, elapsed
+        if len(self.statements) < MAX_STATEMENTS:
+            self.statements.append((query, elapsed))
+
+
+_current = contextvars.ContextVar('softkey_request_stats', default=None)
+
+
+def start_request():
+    stats = RequestStats()
+    _current.set(stats)
+    return stats
+
+
+def current_request():
+    return _current.get()
+
+
+def finish_request():
+    stats = _current.get()
+    _current.set(None)
+    return stats
+
+
+def record_query(query, elapsed):
+    stats = _current.get()
+    if stats is not None:
+        stats.add(query, elapsed)
+
+
+class InstrumentedCursor(db.cursors.DictCursor):
+    # DictCursor, который засекает время каждого запроса для текущего HTTP-запроса.
+    # executemany считается одним запросом (пакетный INSERT — один обмен с сервером)
+    _in_batch = False
+
+    def execute(self, query, args=None):
+        if self._in_batch:
+            return super().execute(query, args)
+        started = time.perf_counter()
+        try:
+            return super().execute(query, args)
+        finally:
+            record_query(query, time.perf_counter() - started)
+
+    def executemany(self, query, args):
+        started = time.perf_counter()
+        self._in_batch = True
+        try:
+            return super().executemany(query, args)
+        finally:
+            self._in_batch = False
+            record_query(query, time.perf_counter() - started)
+
+
+# --- Журнал медленных запросов ---
+
+_WHITESPACE_RE = re.compile(r'\s+')
+_STRING_RE = re.compile(r"'(?:[^'\\]|\\.|'')*'")
+_NUMBER_RE = re.compile(r'(?<![\w.])-?\d+(?:\.\d+)?\b')
+_IN_LIST_RE = re.compile(r'\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)', re.IGNORECASE)
+_VALUES_RE = re.compile(r'\bVALUES\s*(\([^()]*\))(?:\s*,\s*\([^()]*\))*', re.IGNORECASE)
+
+
+def normalize_sql(query):
+    # Приводит запрос к шаблону: значения заменены на ?, списки IN (...) и VALUES свернуты
+    if isinstance(query, (bytes, bytearray)):
+        query = query.decode('utf-8', 'replace')
+    query = _WHITESPACE_RE.sub(' ', query).strip()
+    query = query.replace('%s', '?')
+    query = _STRING_RE.sub('?', query)
+    query = _NUMBER_RE.sub('?', query)
+    query = _IN_LIST_RE.sub('IN (...)', query)
+    return _VALUES_RE.sub(r'VALUES \1', query)
+
+
+def log_slow_request(stats, duration, method, path, endpoint, status):
+    # Одна строка JSON на медленный запрос: SQL сгруппирован по шаблону
+    grouped = {}
+    for query, elapsed in stats.statements:
+        key = normalize_sql(query)
+        item = grouped.get(key)
+        if item is None:
+            item = grouped[key] = {'sql': key, 'count': 0, 'total_ms': 0.0}
+        item['count'] += 1
+        item['total_ms'] += elapsed * 1000
+    statements = sorted(grouped.values(), key=lambda item: -item['total_ms'])
+    for item in statements:
+        item['total_ms'] = round(item['total_ms'], 2)
+    slow_log.warning(json.dumps({
+        'ts': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'method': method,
+        'path': path,
+        'endpoint': endpoint,
+        'status': status,
+        'duration_ms': round(duration * 1000, 2),
+        'db_queries': stats.queries,
+        'db_time_ms': round(stats.db_time * 1000, 2),
+        'slowest_sql': normalize_sql(stats.slowest) if stats.slowest else None,
+        'slowest_ms': round(stats.slowest_time * 1000, 2),
+        'statements': statements,
+    }, ensure_ascii=False))
+
+
+def setup_slow_log(path=None):
+    # Журнал пишется в файл path (или в stderr, если путь не задан)
+    handler = logging.FileHandler(path, encoding='utf-8') if path else logging.StreamHandler()
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    slow_log.addHandler(handler)
+    slow_log.setLevel(logging.WARNING)
+    slow_log.propagate = False
+
+
+def observe_request(stats, method, path, endpoint, status, slow_threshold):
+    # Вызывается в конце HTTP-запроса
+    duration = time.perf_counter() - stats.started
+    endpoint = endpoint or 'unknown'
+    http_requests.observe(duration, endpoint, method, str(status))
+    if stats.queries:
+        db_queries.inc(endpoint, amount=stats.queries)
+        db_time.inc(endpoint, amount=stats.db_time)
+    db_queries_per_request.observe(stats.queries, endpoint)
+    if slow_threshold and duration >= slow_threshold:
+        slow_requests.inc(endpoint)
+        log_slow_request(stats, duration, method, path, endpoint, status)
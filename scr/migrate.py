@@ -0,0 +1,167 @@
+import hashlib
+import os
+import re
+import sys
+
+import pymysql as db
+
+# Версионные миграции схемы БД. Файлы лежат в database/migrations и называются
+# NNN_описание.sql; примененные версии записываются в таблицу Миграции.
+# Новая база, созданная из Create_DB.sql, уже содержит все миграции.
+#
+# Запуск из командной строки:
+#   python migrate.py          — применить новые миграции
+#   python migrate.py status   — показать примененные и ожидающие миграции
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'database', 'migrations')
+
+MIGRATION_RE = re.compile(r'^(\d+)_(.+)\.sql$')
+
+
+class Migration:
+    def __init__(self, version, name, path):
+        self.version = version
+        self.name = name
+        self.path = path
+
+    def read(self):
+        with open(self.path, encoding='utf-8') as f:
+            return f.read()
+
+    def checksum(self):
+        return hashlib.sha256(self.read().encode('utf-8')).hexdigest()
+
+
+def find_migrations(directory=MIGRATIONS_DIR):
+    migrations = []
+    for filename in os.listdir(directory):
+        match = MIGRATION_RE.match(filename)
+        if match:
+            migrations.append(Migration(int(match.group(1)), match.group(2), os.path.join(directory, filename)))
+    migrations.sort(key=lambda m: m.version)
+    versions = [m.version for m in migrations]
+    if len(versions) != len(set(versions)):
+        raise ValueError("Несколько файлов миграций с одним номером версии")
+    return migrations
+
+
+def split_statements(script):
+    # Делит SQL-скрипт на отдельные запросы. Понимает DELIMITER, как консольный клиент
+    # mysql, чтобы в миграциях можно было создавать триггеры и процедуры
+    statements = []
+    delimiter = ';'
+    current = []
+    for line in script.splitlines():
+        stripped = line.strip()
+        if stripped.upper().startswith('DELIMITER '):
+            delimiter = stripped.split(None, 1)[1]
+            continue
+        if not current and (not stripped or stripped.startswith('--')):
+            continue
+        if stripped.endswith(delimiter):
+            current.append(line.rstrip()[:-len(delimiter)])
+            statements.append('\n'.join(current).strip())
+            current = []
+        else:
+            current.append(line)
+    tail = '\n'.join(current).strip()
+    if tail:
+        statements.append(tail)
+    return [s for s in statements if s]
+
+
+def ensure_table(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS Миграции (
+            Версия INT PRIMARY KEY,
+            Название VARCHAR(255) NOT NULL,
+            Контрольная_сумма CHAR(64) NOT NULL,
+            Дата_применения DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+
+def applied_migrations(cursor):
+    ensure_table(cursor)
+    cursor.execute("SELECT Версия, Название, Контрольная_сумма FROM Миграции ORDER BY Версия")
+    return {row['Версия']: row for row in cursor.fetchall()}
+
+
+def pending_migrations(cursor, migrations):
+    applied = applied_migrations(cursor)
+    return [m for m in migrations if m.version not in applied]
+
+
+def apply_migration(conn, migration):
+    # DDL в MySQL/MariaDB фиксируется сразу, поэтому миграция не атомарна: при ошибке
+    # версия не записывается, и миграцию нужно поправить и запустить повторно
+    with conn.cursor() as cursor:
+        for statement in split_statements(migration.read()):
+            cursor.execute(statement)
+        cursor.execute(
+            "INSERT INTO Миграции (Версия, Название, Контрольная_сумма) VALUES (%s, %s, %s)",
+            (migration.version, migration.name, migration.checksum())
+        )
+
+
+def migrate(conn, migrations=None):
+    # Применяет ожидающие миграции по порядку. Возвращает список примененных
+    if migrations is None:
+        migrations = find_migrations()
+    with conn.cursor() as cursor:
+        pending = pending_migrations(cursor, migrations)
+    done = []
+    for migration in pending:
+        print(f"Применяется миграция {migration.version:03d}_{migration.name}")
+        apply_migration(conn, migration)
+        done.append(migration)
+    return done
+
+
+def status(conn, migrations=None):
+    # Возвращает строки отчета: версия, название и состояние миграции
+    if migrations is None:
+        migrations = find_migrations()
+    with conn.cursor() as cursor:
+        applied = applied_migrations(cursor)
+    report = []
+    for migration in migrations:
+        row = applied.get(migration.version)
+        if row is None:
+            state = 'ожидает'
+        elif row['Контрольная_сумма'] != migration.checksum():
+            state = 'применена, файл изменен после применения'
+        else:
+            state = 'применена'
+        report.append((migration.version, migration.name, state))
+    return report
+
+
+def main(argv):
+    from config import host, user, password, port, db_name
+
+    command = argv[1] if len(argv) > 1 else 'up'
+    if command not in ('up', 'status'):
+        print("Использование: python migrate.py [up | status]")
+        return 2
+
+    conn = db.connect(host=host, port=port, user=user, password=password,
+                      database=db_name, cursorclass=db.cursors.DictCursor, autocommit=True)
+    try:
+        if command == 'status':
+            for version, name, state in status(conn):
+                print(f"{version:03d}_{name}: {state}")
+            return 0
+        try:
+            done = migrate(conn)
+        except Exception as ex:
+            print("Ошибка миграции:", ex)
+            return 1
+        print(f"Применено миграций: {len(done)}" if done else "Схема БД актуальна")
+        return 0
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
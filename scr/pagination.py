@@ -0,0 +1,193 @@
+import base64
+import json
+from bisect import bisect_left, bisect_right
+from datetime import date, datetime
+from decimal import Decimal
+
+# Направления курсора: следующая страница (после ключа) и предыдущая (до ключа)
+AFTER = 'a'
+BEFORE = 'b'
+
+
+class Page:
+    # Одна страница выборки и курсоры для перехода к соседним страницам
+    def __init__(self, items, limit, next_cursor=None, prev_cursor=None):
+        self.items = items
+        self.limit = limit
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __bool__(self):
+        return bool(self.items)
+
+
+# --- Кодирование курсора ---
+# Курсор — это ключ сортировки крайней строки страницы. Значения Decimal и datetime
+# помечаются типом, чтобы после декодирования сравниваться так же, как в БД
+
+def _pack(value):
+    if isinstance(value, Decimal):
+        return {'d': str(value)}
+    if isinstance(value, datetime):
+        return {'t': value.isoformat()}
+    if isinstance(value, date):
+        return {'D': value.isoformat()}
+    return value
+
+
+def _unpack(value):
+    if isinstance(value, dict):
+        if 'd' in value:
+            return Decimal(value['d'])
+        if 't' in value:
+            return datetime.fromisoformat(value['t'])
+        if 'D' in value:
+            return date.fromisoformat(value['D'])
+        raise ValueError("Неизвестный тип значения в курсоре")
+    return value
+
+
+def encode_cursor(direction, key):
+    raw = json.dumps([direction, [_pack(v) for v in key]], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token):
+    # Возвращает (направление, ключ) или (None, None) для пустого/испорченного курсора
+    if not token:
+        return None, None
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        direction, key = json.loads(raw.decode('utf-8'))
+        if direction not in (AFTER, BEFORE) or not isinstance(key, list):
+            return None, None
+        return direction, tuple(_unpack(v) for v in key)
+    except (ValueError, TypeError):
+        return None, None
+
+
+def page_size(value, default, maximum):
+    # Размер страницы из параметра запроса, ограниченный сверху
+    try:
+        size = int(value)
+    except (TypeError, ValueError):
+        return default
+    return max(1, min(size, maximum))
+
+
+def page_args(args, updates):
+    # Параметры ссылки на текущую страницу (page_url в app и async_app):
+    # те же, что в запросе, кроме измененных (None — убрать)
+    args = args.to_dict()
+    for name, value in updates.items():
+        if value is None:
+            args.pop(name, None)
+        else:
+            args[name] = value
+    return args
+
+
+# --- Пагинация списка в памяти (каталог) ---
+
+def paginate_list(items, key, token, limit):
+    # items уже отсортированы по возрастанию key(item)
+    direction, cursor_key = decode_cursor(token)
+    keys = [key(item) for item in items]
+    try:
+        if direction == AFTER:
+            start = bisect_right(keys, cursor_key)
+            end = start + limit
+        elif direction == BEFORE:
+            end = bisect_left(keys, cursor_key)
+            start = max(0, end - limit)
+        else:
+            start, end = 0, limit
+    except TypeError:
+        # Курсор от другой сортировки — начинаем с первой страницы
+        start, end = 0, limit
+
+    page_items = items[start:end]
+    next_cursor = encode_cursor(AFTER, keys[end - 1]) if end < len(items) and page_items else None
+    prev_cursor = encode_cursor(BEFORE, keys[start]) if start > 0 and page_items else None
+    return Page(page_items, limit, next_cursor, prev_cursor)
+
+
+# --- Пагинация SQL-запроса по ключу (keyset) ---
+
+def _keyset_condition(columns, descending, direction):
+    # (c1, c2) < (%s, %s) в развернутом виде: c1 < %s OR (c1 = %s AND c2 < %s).
+    # Развернутая форма надежнее использует составной индекс в MySQL/MariaDB
+    forward = (direction == AFTER)
+    op = '<' if descending == forward else '>'
+    parts = []
+    for i, column in enumerate(columns):
+        equal = ["%s = %%s" % c for c in columns[:i]]
+        parts.append("(" + " AND ".join(equal + ["%s %s %%s" % (column, op)]) + ")")
+    return "(" + " OR ".join(parts) + ")"
+
+
+def _keyset_params(key):
+    params = []
+    for i in range(len(key)):
+        params.extend(key[:i + 1])
+    return params
+
+
+def keyset_query(sql, params, columns, token, limit, descending=False, has_where=False):
+    """Дописывает к sql условие по курсору, ORDER BY и LIMIT.
+
+    Возвращает (sql, параметры, направление курсора); строки результата
+    передаются в keyset_page. sql не должен содержать ORDER BY и LIMIT.
+    """
+    direction, cursor_key = decode_cursor(token)
+    if cursor_key is not None and len(cursor_key) != len(columns):
+        direction, cursor_key = None, None
+
+    params = list(params)
+    if direction is not None:
+        sql += (" AND " if has_where else " WHERE ") + _keyset_condition(columns, descending, direction)
+        params.extend(_keyset_params(cursor_key))
+
+    # Для предыдущей страницы идем в обратном порядке и потом разворачиваем
+    reverse = (direction == BEFORE)
+    order = 'ASC' if descending == reverse else 'DESC'
+    sql += " ORDER BY " + ", ".join("%s %s" % (c, order) for c in columns)
+    sql += " LIMIT %s"
+    params.append(limit + 1)
+    return sql, tuple(params), direction
+
+
+def keyset_page(rows, key_fields, direction, limit):
+    # key_fields — имена полей строки, соответствующие columns (из них строится курсор)
+    has_more = len(rows) > limit
+    rows = list(rows[:limit])
+    if direction == BEFORE:
+        rows.reverse()
+
+    def key_of(row):
+        return [row[f] for f in key_fields]
+
+    next_cursor = prev_cursor = None
+    if rows:
+        if direction is None:
+            next_cursor = encode_cursor(AFTER, key_of(rows[-1])) if has_more else None
+        elif direction == AFTER:
+            next_cursor = encode_cursor(AFTER, key_of(rows[-1])) if has_more else None
+            prev_cursor = encode_cursor(BEFORE, key_of(rows[0]))
+        else:
+            next_cursor = encode_cursor(AFTER, key_of(rows[-1]))
+            prev_cursor = encode_cursor(BEFORE, key_of(rows[0])) if has_more else None
+    return Page(rows, limit, next_cursor, prev_cursor)
+
+
+def fetch_keyset(cursor, sql, params, columns, key_fields, token, limit, descending=False, has_where=False):
+    """Выполняет sql с keyset-пагинацией по columns и возвращает Page."""
+    sql, params, direction = keyset_query(sql, params, columns, token, limit, descending, has_where)
+    cursor.execute(sql, params)
+    return keyset_page(cursor.fetchall(), key_fields, direction, limit)
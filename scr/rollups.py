@@ -0,0 +1,227 @@
+import sys
+
+import pymysql as db
+
+# Сводные таблицы отчетов админ-панели. apply_order() вызывается при оформлении заказа
+# в той же транзакции, rebuild() пересчитывает всё из истории заказов.
+#
+# Запуск из командной строки:
+#   python rollups.py rebuild    — заполнить сводки заново (первичное заполнение)
+#   python rollups.py reconcile  — сверить сводки с историей и пересчитать при расхождении
+
+PAID_STATUS = 'Оплачен'
+
+
+def order_statements(user_id, total, lines, status=PAID_STATUS):
+    # Запросы обновления сводок для одного заказа: (sql, параметры, executemany ли).
+    # lines — позиции заказа: словари с ID_Товара, ID_Категории, Количество, Цена
+    yield ("""
+        INSERT INTO Сводка_товары (ID_Товара, Количество) VALUES (%s, %s)
+        ON DUPLICATE KEY UPDATE Количество = Количество + VALUES(Количество)
+    """, [(line['ID_Товара'], line['Количество']) for line in lines], True)
+
+    by_category = {}
+    for line in lines:
+        category_id = line['ID_Категории']
+        by_category[category_id] = by_category.get(category_id, 0) + line['Цена'] * line['Количество']
+    yield ("""
+        INSERT INTO Сводка_категории (ID_Категории, Выручка) VALUES (%s, %s)
+        ON DUPLICATE KEY UPDATE Выручка = Выручка + VALUES(Выручка)
+    """, list(by_category.items()), True)
+
+    # Дневная динамика, клиенты и выручка считаются только по оплаченным заказам
+    if status == PAID_STATUS:
+        yield from payment_statements(user_id, total)
+
+
+def payment_statements(user_id, total, day=None):
+    # day — день оформления заказа: сводка по дням, как и HISTORY_QUERIES, группирует
+    # по DATE(Дата_заказа), даже если оплата прошла позже. None — заказ оформлен сейчас
+    yield ("""
+        INSERT INTO Сводка_дни (День, Количество_заказов, Сумма) VALUES (COALESCE(%s, CURDATE()), 1, %s)
+        ON DUPLICATE KEY UPDATE Количество_заказов = Количество_заказов + 1, Сумма = Сумма + VALUES(Сумма)
+    """, (day, total), False)
+    yield ("""
+        INSERT INTO Сводка_покупатели (ID_Пользователя, Сумма) VALUES (%s, %s)
+        ON DUPLICATE KEY UPDATE Сумма = Сумма + VALUES(Сумма)
+    """, (user_id, total), False)
+    yield ("""
+        INSERT INTO Счетчики (Название, Значение) VALUES ('revenue', %s)
+        ON DUPLICATE KEY UPDATE Значение = Значение + VALUES(Значение)
+    """, (total,), False)
+
+
+def _run(cursor, statements):
+    for sql, params, many in statements:
+        if many:
+            cursor.executemany(sql, params)
+        else:
+            cursor.execute(sql, params)
+
+
+def apply_order(cursor, user_id, total, lines, status=PAID_STATUS):
+    _run(cursor, order_statements(user_id, total, lines, status))
+
+
+def apply_payment(cursor, user_id, total, day=None):
+    _run(cursor, payment_statements(user_id, total, day))
+
+
+# --- Чтение для админ-панели (маленькие таблицы, стоимость не зависит от истории) ---
+
+STATS_QUERY = "SELECT Название, Значение FROM Счетчики"
+
+REPORT_QUERIES = {
+    # 1. ТОП-5 популярных товаров
+    'top_products': """
+        SELECT t.Название, s.Количество as total_qty
+        FROM Сводка_товары s
+        JOIN Товары t ON s.ID_Товара = t.ID_Товара
+        ORDER BY s.Количество DESC LIMIT 5
+    """,
+    # 2. Выручка по категориям
+    'category_revenue': """
+        SELECT k.Название_категории, s.Выручка as total_revenue
+        FROM Сводка_категории s
+        JOIN Категории k ON s.ID_Категории = k.ID_Категории
+        ORDER BY s.Выручка DESC
+    """,
+    # 3. Активность продаж по дням (последние 14)
+    'daily_sales': """
+        SELECT День as day, Количество_заказов as order_count, Сумма as daily_sum
+        FROM Сводка_дни
+        ORDER BY День DESC LIMIT 14
+    """,
+    # 4. ТОП-5 Покупателей (Самые ценные клиенты)
+    'vip_customers': """
+        SELECT p.Имя, p.Фамилия, p.Логин, s.Сумма as total_spent
+        FROM Сводка_покупатели s
+        JOIN Пользователи p ON s.ID_Пользователя = p.ID_Пользователя
+        ORDER BY s.Сумма DESC LIMIT 5
+    """,
+}
+
+
+def stats_from_rows(rows):
+    counters = {row['Название']: row['Значение'] for row in rows}
+    return {
+        'revenue': counters.get('revenue') or 0,
+        'orders_count': int(counters.get('orders') or 0),
+        'products_count': int(counters.get('products') or 0),
+        'users_count': int(counters.get('users') or 0),
+    }
+
+
+def read_stats(cursor):
+    cursor.execute(STATS_QUERY)
+    return stats_from_rows(cursor.fetchall())
+
+
+def read_reports(cursor):
+    reports = {}
+    for name, query in REPORT_QUERIES.items():
+        cursor.execute(query)
+        reports[name] = cursor.fetchall()
+    return reports
+
+
+# --- Пересчет из истории ---
+
+# Запросы, по которым сводки строятся из истории (те же, что раньше выполняла админка)
+HISTORY_QUERIES = {
+    'Сводка_товары': """
+        SELECT ID_Товара, SUM(Количество) AS Количество
+        FROM Состав_заказа
+        GROUP BY ID_Товара
+    """,
+    'Сводка_категории': """
+        SELECT t.ID_Категории, SUM(sz.Цена_продажи * sz.Количество) AS Выручка
+        FROM Состав_заказа sz
+        JOIN Товары t ON sz.ID_Товара = t.ID_Товара
+        WHERE t.ID_Категории IS NOT NULL
+        GROUP BY t.ID_Категории
+    """,
+    'Сводка_дни': """
+        SELECT DATE(Дата_заказа) AS День, COUNT(ID_Заказа) AS Количество_заказов, SUM(Итоговая_сумма) AS Сумма
+        FROM Заказы
+        WHERE Статус = 'Оплачен'
+        GROUP BY DATE(Дата_заказа)
+    """,
+    'Сводка_покупатели': """
+        SELECT ID_Пользователя, SUM(Итоговая_сумма) AS Сумма
+        FROM Заказы
+        WHERE Статус = 'Оплачен' AND ID_Пользователя IS NOT NULL
+        GROUP BY ID_Пользователя
+    """,
+    'Счетчики': """
+        SELECT 'orders' AS Название, COUNT(*) AS Значение FROM Заказы
+        UNION ALL SELECT 'products', COUNT(*) FROM Товары
+        UNION ALL SELECT 'users', COUNT(*) FROM Пользователи
+        UNION ALL SELECT 'revenue', COALESCE(SUM(Итоговая_сумма), 0) FROM Заказы WHERE Статус = 'Оплачен'
+    """,
+    # Свободные ключи по товарам (ведет keystore.py)
+    'Остатки_ключей': """
+        SELECT ID_Товара, SUM(Выдан = 0) AS Доступно
+        FROM Склад_ключей
+        GROUP BY ID_Товара
+    """,
+}
+
+
+def rebuild(conn):
+    # Полный пересчет в одной транзакции: читатели видят либо старые, либо новые сводки
+    conn.begin()
+    try:
+        with conn.cursor() as cursor:
+            for table, query in HISTORY_QUERIES.items():
+                cursor.execute("DELETE FROM " + table)
+                cursor.execute("INSERT INTO " + table + " " + query)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def reconcile(conn):
+    # Возвращает список таблиц, в которых сводка разошлась с историей
+    mismatched = []
+    with conn.cursor() as cursor:
+        for table, query in HISTORY_QUERIES.items():
+            cursor.execute(query)
+            expected = {tuple(row.values()) for row in cursor.fetchall()}
+            cursor.execute("SELECT * FROM " + table)
+            actual = {tuple(row.values()) for row in cursor.fetchall()}
+            if expected != actual:
+                mismatched.append(table)
+    return mismatched
+
+
+def main(argv):
+    from config import host, user, password, port, db_name
+
+    command = argv[1] if len(argv) > 1 else ''
+    if command not in ('rebuild', 'reconcile'):
+        print("Использование: python rollups.py rebuild | reconcile")
+        return 2
+
+    conn = db.connect(host=host, port=port, user=user, password=password,
+                      database=db_name, cursorclass=db.cursors.DictCursor, autocommit=True)
+    try:
+        if command == 'rebuild':
+            rebuild(conn)
+            print("Сводки пересчитаны")
+            return 0
+        mismatched = reconcile(conn)
+        if not mismatched:
+            print("Сводки совпадают с историей заказов")
+            return 0
+        print("Расхождения в таблицах:", ", ".join(mismatched))
+        rebuild(conn)
+        print("Сводки пересчитаны")
+        return 1
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
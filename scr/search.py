@@ -0,0 +1,300 @@
+import math
+import re
+import threading
+from bisect import bisect_left
+from functools import lru_cache
+
+# Сколько последних запросов помнить (поиск "по мере набора" часто повторяет запросы)
+RESULT_CACHE_SIZE = 1024
+
+# Слова: кириллица, латиница и цифры (после приведения к нижнему регистру)
+TOKEN_RE = re.compile(r'[0-9a-zа-я]+')
+
+# --- Нормализация и стемминг (алгоритм Snowball для русского языка) ---
+
+VOWELS = set('аеиоуыэюя')
+
+PERFECTIVE_GERUND_1 = ('вшись', 'вши', 'в')               # после а / я
+PERFECTIVE_GERUND_2 = ('ившись', 'ывшись', 'ивши', 'ывши', 'ив', 'ыв')
+ADJECTIVE = ('ими', 'ыми', 'его', 'ого', 'ему', 'ому', 'ее', 'ие', 'ые', 'ое', 'ей', 'ий', 'ый', 'ой',
+             'ем', 'им', 'ым', 'ом', 'их', 'ых', 'ую', 'юю', 'ая', 'яя', 'ою', 'ею')
+PARTICIPLE_1 = ('ем', 'нн', 'вш', 'ющ', 'щ')               # после а / я
+PARTICIPLE_2 = ('ивш', 'ывш', 'ующ')
+REFLEXIVE = ('ся', 'сь')
+VERB_1 = ('ете', 'йте', 'ешь', 'нно', 'ла', 'на', 'ли', 'ем', 'ло', 'но', 'ет', 'ют', 'ны', 'ть', 'й', 'л', 'н')
+VERB_2 = ('ейте', 'уйте', 'ила', 'ыла', 'ена', 'ите', 'или', 'ыли', 'ило', 'ыло', 'ено', 'ует', 'уют',
+          'ены', 'ить', 'ыть', 'ишь', 'ей', 'уй', 'ил', 'ыл', 'им', 'ым', 'ен', 'ят', 'ит', 'ыт', 'ую', 'ю')
+NOUN = ('иями', 'ями', 'ами', 'ией', 'иям', 'ием', 'иях', 'ев', 'ов', 'ие', 'ье', 'еи', 'ии', 'ей', 'ой',
+        'ий', 'ям', 'ем', 'ам', 'ом', 'ах', 'ях', 'ию', 'ью', 'ия', 'ья', 'а', 'е', 'и', 'й', 'о', 'у',
+        'ы', 'ь', 'ю', 'я')
+SUPERLATIVE = ('ейше', 'ейш')
+DERIVATIONAL = ('ость', 'ост')
+
+
+def _longest(word, endings):
+    # Самое длинное окончание из списка, на которое заканчивается слово
+    best = ''
+    for ending in endings:
+        if len(ending) > len(best) and word.endswith(ending):
+            best = ending
+    return best
+
+
+def _strip_either(word, group1, group2):
+    # Как among в Snowball: берем самое длинное окончание из обеих групп; окончание
+    # первой группы удаляется, только если перед ним стоит а или я
+    end1 = _longest(word, group1)
+    end2 = _longest(word, group2)
+    if end2 and len(end2) >= len(end1):
+        return word[:-len(end2)]
+    if end1 and len(word) > len(end1) and word[-len(end1) - 1] in 'ая':
+        return word[:-len(end1)]
+    return None
+
+
+def _region(word, start):
+    # Позиция после первой согласной, следующей за гласной (R1/R2 в терминах Snowball)
+    for i in range(start + 1, len(word)):
+        if word[i] not in VOWELS and word[i - 1] in VOWELS:
+            return i + 1
+    return len(word)
+
+
+@lru_cache(maxsize=200000)
+def stem(word):
+    if len(word) < 3 or not any('а' <= ch <= 'я' for ch in word):
+        return word
+
+    rv_start = len(word)
+    for i, ch in enumerate(word):
+        if ch in VOWELS:
+            rv_start = i + 1
+            break
+    r2_start = _region(word, _region(word, 0))
+    prefix, rv = word[:rv_start], word[rv_start:]
+
+    # Шаг 1
+    stripped = _strip_either(rv, PERFECTIVE_GERUND_1, PERFECTIVE_GERUND_2)
+    if stripped is not None:
+        rv = stripped
+    else:
+        ending = _longest(rv, REFLEXIVE)
+        if ending:
+            rv = rv[:-len(ending)]
+        ending = _longest(rv, ADJECTIVE)
+        if ending:
+            rv = rv[:-len(ending)]
+            participle = _strip_either(rv, PARTICIPLE_1, PARTICIPLE_2)
+            if participle is not None:
+                rv = participle
+        else:
+            stripped = _strip_either(rv, VERB_1, VERB_2)
+            if stripped is not None:
+                rv = stripped
+            else:
+                ending = _longest(rv, NOUN)
+                if ending:
+                    rv = rv[:-len(ending)]
+
+    # Шаг 2
+    if rv.endswith('и'):
+        rv = rv[:-1]
+
+    # Шаг 3: словообразовательное окончание удаляется только в R2
+    ending = _longest(rv, DERIVATIONAL)
+    if ending and rv_start + len(rv) - len(ending) >= r2_start:
+        rv = rv[:-len(ending)]
+
+    # Шаг 4
+    if rv.endswith('нн'):
+        rv = rv[:-1]
+    else:
+        ending = _longest(rv, SUPERLATIVE)
+        if ending:
+            rv = rv[:-len(ending)]
+            if rv.endswith('нн'):
+                rv = rv[:-1]
+        elif rv.endswith('ь'):
+            rv = rv[:-1]
+
+    return prefix + rv
+
+
+def normalize(text):
+    return (text or '').lower().replace('ё', 'е')
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(normalize(text))
+
+
+def terms(text):
+    return [stem(token) for token in tokenize(text)]
+
+
+def trigrams(term):
+    padded = '  %s ' % term
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class SearchIndex:
+    """Инвертированный индекс по названию и описанию товаров с ранжированием BM25."""
+
+    # Параметры BM25
+    K1 = 1.2
+    B = 0.75
+
+    def __init__(self, name_weight=3.0, fuzzy_threshold=0.45, prefix_limit=50):
+        self.name_weight = name_weight          # вес слова из названия относительно описания
+        self.fuzzy_threshold = fuzzy_threshold  # минимальная похожесть по триграммам для опечаток
+        self.prefix_limit = prefix_limit        # сколько терминов разворачивать по префиксу
+        self._lock = threading.Lock()
+        self._postings = {}   # термин -> {ID товара: вес}
+        self._docs = {}       # ID товара -> {термин: вес}
+        self._doc_len = {}
+        self._total_len = 0.0
+        self._vocab = []      # отсортированный словарь для поиска по префиксу
+        self._vocab_dirty = False
+        self._trigrams = {}   # триграмма -> множество терминов
+        self._results = {}    # кэш ранжированных ответов, сбрасывается при любом изменении
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._docs)
+
+    # --- Обновление индекса ---
+
+    def _add_term(self, term):
+        # Словарь пересортируется один раз при следующем поиске, а не на каждое слово
+        self._vocab_dirty = True
+        for gram in trigrams(term):
+            self._trigrams.setdefault(gram, set()).add(term)
+
+    def _drop_term(self, term):
+        self._vocab_dirty = True
+        for gram in trigrams(term):
+            bucket = self._trigrams.get(gram)
+            if bucket is not None:
+                bucket.discard(term)
+                if not bucket:
+                    del self._trigrams[gram]
+
+    def _remove(self, doc_id):
+        weights = self._docs.pop(doc_id, None)
+        if weights is None:
+            return
+        self._total_len -= self._doc_len.pop(doc_id)
+        for term in weights:
+            posting = self._postings[term]
+            del posting[doc_id]
+            if not posting:
+                del self._postings[term]
+                self._drop_term(term)
+
+    def add(self, doc_id, name, description=None):
+        weights = {}
+        for term in terms(name):
+            weights[term] = weights.get(term, 0) + self.name_weight
+        for term in terms(description):
+            weights[term] = weights.get(term, 0) + 1
+        with self._lock:
+            self._results.clear()
+            self._remove(doc_id)
+            self._docs[doc_id] = weights
+            length = sum(weights.values())
+            self._doc_len[doc_id] = length
+            self._total_len += length
+            for term, weight in weights.items():
+                posting = self._postings.get(term)
+                if posting is None:
+                    posting = self._postings[term] = {}
+                    self._add_term(term)
+                posting[doc_id] = weight
+
+    def remove(self, doc_id):
+        with self._lock:
+            self._results.clear()
+            self._remove(doc_id)
+
+    # --- Поиск ---
+
+    def _expand(self, term):
+        # Термины словаря, которые считаем совпадением для слова запроса, с их весом
+        if term in self._postings:
+            matches = {term: 1.0}
+        else:
+            matches = {}
+        if len(term) >= 3:
+            if self._vocab_dirty:
+                self._vocab = sorted(self._postings)
+                self._vocab_dirty = False
+            # Поиск "по мере набора": недописанное слово совпадает с началом термина
+            i = bisect_left(self._vocab, term)
+            while i < len(self._vocab) and len(matches) < self.prefix_limit:
+                candidate = self._vocab[i]
+                if not candidate.startswith(term):
+                    break
+                matches.setdefault(candidate, 0.9)
+                i += 1
+        if not matches and len(term) >= 3:
+            # Опечатки: ищем термины с наибольшей долей общих триграмм
+            grams = trigrams(term)
+            shared = {}
+            for gram in grams:
+                for candidate in self._trigrams.get(gram, ()):
+                    shared[candidate] = shared.get(candidate, 0) + 1
+            for candidate, count in shared.items():
+                similarity = 2.0 * count / (len(grams) + len(trigrams(candidate)))
+                if similarity >= self.fuzzy_threshold:
+                    matches[candidate] = similarity
+        return matches
+
+    def search(self, query, limit=None):
+        query_terms = tuple(dict.fromkeys(terms(query)))
+        if not query_terms:
+            return []
+
+        with self._lock:
+            ranked = self._results.get(query_terms)
+            if ranked is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+                ranked = self._search(query_terms)
+                if len(self._results) >= RESULT_CACHE_SIZE:
+                    self._results.clear()
+                self._results[query_terms] = ranked
+        return ranked[:limit] if limit else list(ranked)
+
+    def _search(self, query_terms):
+        expanded = [self._expand(term) for term in query_terms]
+        if not all(expanded):
+            return []
+
+        # Документ должен содержать каждое слово запроса (как и LIKE по всей строке).
+        # Множество строим только для самого редкого слова, остальные проверяем по спискам
+        postings = [[self._postings[term] for term in matches] for matches in expanded]
+        order = sorted(range(len(expanded)), key=lambda i: sum(len(p) for p in postings[i]))
+        found = set()
+        for posting in postings[order[0]]:
+            found.update(posting)
+        for i in order[1:]:
+            found = {doc_id for doc_id in found if any(doc_id in p for p in postings[i])}
+            if not found:
+                return []
+
+        n_docs = len(self._docs)
+        avg_len = self._total_len / n_docs if n_docs else 1.0
+        doc_len = self._doc_len
+        scores = dict.fromkeys(found, 0.0)
+        for matches, term_postings in zip(expanded, postings):
+            for boost, posting in zip(matches.values(), term_postings):
+                idf = math.log(1 + (n_docs - len(posting) + 0.5) / (len(posting) + 0.5))
+                for doc_id in found:
+                    tf = posting.get(doc_id)
+                    if tf:
+                        norm = tf + self.K1 * (1 - self.B + self.B * doc_len[doc_id] / avg_len)
+                        scores[doc_id] += boost * idf * tf * (self.K1 + 1) / norm
+
+        return sorted(scores, key=lambda doc_id: (-scores[doc_id], doc_id))
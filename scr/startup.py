@@ -0,0 +1,77 @@
+import os
+import time
+
+# Запуск приложения: маршруты объявляются в app.py на уровне модуля, но подключаются к
+# Flask только в create_app(), поэтому приложение можно создать после fork() в каждом
+# воркере или один раз в мастер-процессе (gunicorn --preload) — без соединений с БД,
+# которые дочерние процессы унаследовали бы от родителя. Длительность этапов запуска
+# (импорт, создание приложения, прогрев) видна в /ready и /metrics.
+
+
+class Routes:
+    """Маршруты и обработчики, которые create_app() подключает к новому приложению Flask."""
+
+    def __init__(self):
+        self._setup = []  # функции app -> None в порядке объявления
+
+    def _deferred(self, method, *args, **kwargs):
+        # Декоратор, повторяющий app.<method>(*args, **kwargs)(f) при регистрации
+        def decorator(f):
+            self._setup.append(lambda app: getattr(app, method)(*args, **kwargs)(f))
+            return f
+        return decorator
+
+    def _hook(self, method, f):
+        self._setup.append(lambda app: getattr(app, method)(f))
+        return f
+
+    def route(self, rule, **options):
+        return self._deferred('route', rule, **options)
+
+    def errorhandler(self, code_or_exception):
+        return self._deferred('errorhandler', code_or_exception)
+
+    def template_global(self, name=None):
+        return self._deferred('template_global', name)
+
+    def before_request(self, f):
+        return self._hook('before_request', f)
+
+    def after_request(self, f):
+        return self._hook('after_request', f)
+
+    def teardown_request(self, f):
+        return self._hook('teardown_request', f)
+
+    def teardown_appcontext(self, f):
+        return self._hook('teardown_appcontext', f)
+
+    def url_defaults(self, f):
+        return self._hook('url_defaults', f)
+
+    def register(self, app):
+        for setup in self._setup:
+            setup(app)
+
+
+class StartupTimer:
+    """Длительность этапов запуска процесса и готовность принимать запросы."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self._last = self.started
+        self.phases = {}   # этап -> секунды
+        self.ready = False
+
+    def mark(self, phase):
+        now = time.perf_counter()
+        self.phases[phase] = self.phases.get(phase, 0) + now - self._last
+        self._last = now
+
+    @property
+    def total(self):
+        return sum(self.phases.values())
+
+    def report(self):
+        phases = ', '.join(f"{phase} {seconds:.2f} с" for phase, seconds in self.phases.items())
+        return f"Процесс {os.getpid()}: запуск {self.total:.2f} с ({phases})"
@@ -0,0 +1,36 @@
+import pymysql as db
+import pytest
+
+import explain_check
+
+# Регрессионный тест планов запросов: падает, если какой-то запрос приложения делает полный
+# просмотр большой таблицы (см. explain_check.py). Нужна база с реалистичным объемом данных
+# (python -m bench.seed); если БД из config.py недоступна, тест пропускается.
+
+
+@pytest.fixture(scope='module')
+def conn():
+    from config import host, user, password, port, db_name
+    try:
+        conn = db.connect(host=host, port=port, user=user, password=password, database=db_name,
+                          cursorclass=db.cursors.DictCursor, autocommit=True, connect_timeout=3)
+    except db.MySQLError as ex:
+        pytest.skip(f"БД недоступна: {ex}")
+    yield conn
+    conn.close()
+
+
+@pytest.fixture(scope='module')
+def statements():
+    return explain_check.all_statements()
+
+
+def test_statements_are_bound(statements):
+    # Каждый запрос превращается в исполнимый текст без заглушек
+    assert statements
+    for statement in statements:
+        assert '%s' not in explain_check.bind_sample(statement.sql), statement.location
+
+
+def test_no_full_scans(conn, statements):
+    assert explain_check.check(conn, statements, explain_check.MIN_ROWS, verbose=True) == 0